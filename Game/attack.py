@@ -0,0 +1,91 @@
+import json
+
+# Clear types as small codes, Board.check_lines hands these out instead of names
+NO_CLEAR = 0
+SINGLE = 1
+DOUBLE = 2
+TRIPLE = 3
+TETRIS = 4
+T_SPIN_SINGLE = 5
+T_SPIN_DOUBLE = 6
+T_SPIN_TRIPLE = 7
+MINI_T_SPIN_SINGLE = 8
+MINI_T_SPIN_DOUBLE = 9
+
+# Names by code, these are also the keys of a rule set's clears
+CLEAR_TYPES = [None, 'SINGLE', 'DOUBLE', 'TRIPLE', 'TETRIS',
+               'T-SPIN SINGLE', 'T-SPIN DOUBLE', 'T-SPIN TRIPLE',
+               'MINI T-SPIN SINGLE', 'MINI T-SPIN DOUBLE']
+CLEAR_CODES = {name: code for code, name in enumerate(CLEAR_TYPES) if name}
+
+# Clears that keep back to back going, anything else that clears lines breaks it
+B2B_CLEARS = [code in (TETRIS, T_SPIN_SINGLE, T_SPIN_DOUBLE, T_SPIN_TRIPLE, MINI_T_SPIN_SINGLE)
+              for code in range(len(CLEAR_TYPES))]
+
+# Line clears by count for plain clears and t-spins, a mini t-spin clearing two or more counts as a double
+LINE_CLEARS = [NO_CLEAR, SINGLE, DOUBLE, TRIPLE, TETRIS]
+T_SPIN_CLEARS = [NO_CLEAR, T_SPIN_SINGLE, T_SPIN_DOUBLE, T_SPIN_TRIPLE, NO_CLEAR]
+MINI_T_SPIN_CLEARS = [NO_CLEAR, MINI_T_SPIN_SINGLE, MINI_T_SPIN_DOUBLE, MINI_T_SPIN_DOUBLE, MINI_T_SPIN_DOUBLE]
+
+# Rule sets give the lines sent by each clear type, the bonuses for back to back and perfect clears,
+# and the combo bonus by combo count, combos past the end of the list get its last entry
+JSTRIS = {
+    'name': 'jstris',
+    'clears': {
+        'SINGLE': 0,
+        'DOUBLE': 1,
+        'TRIPLE': 2,
+        'TETRIS': 4,
+        'T-SPIN SINGLE': 2,
+        'T-SPIN DOUBLE': 4,
+        'T-SPIN TRIPLE': 6,
+        'MINI T-SPIN SINGLE': 0,
+        'MINI T-SPIN DOUBLE': 1
+    },
+    'back_to_back': 1,
+    'perfect_clear': 10,
+    'combo': [0, 0, 1, 1, 1, 2, 2, 3, 3, 4, 4, 4, 5]
+}
+
+GUIDELINE = dict(JSTRIS, name='guideline', combo=[0, 0, 1, 1, 2, 2, 3, 3, 4, 4, 4, 5])
+
+RULE_SETS = {rules['name']: rules for rules in (JSTRIS, GUIDELINE)}
+
+# A rule set compiled into one flat table of lines sent, indexed by clear code, back to back, combo and perfect clear
+# Working out the attack of a clear is then a single lookup, which matters as searches do it for every placement
+class AttackRules:
+    def __init__(self, rules):
+        unknown = set(rules['clears']) - set(CLEAR_CODES)
+        if unknown:
+            raise ValueError(f"Unknown clear types in rule set {rules.get('name')}: {', '.join(sorted(unknown))}")
+
+        self.name = rules.get('name', 'custom')
+        self.max_combo = len(rules['combo']) - 1
+        combo_levels = self.max_combo + 1
+        self.table = [0] * (len(CLEAR_TYPES) * 2 * combo_levels * 2)
+        for code in range(1, len(CLEAR_TYPES)):
+            for back_to_back in range(2):
+                for combo, combo_bonus in enumerate(rules['combo']):
+                    for perfect_clear in range(2):
+                        self.table[self.index(code, back_to_back, combo, perfect_clear)] = (
+                            rules['clears'].get(CLEAR_TYPES[code], 0) + combo_bonus
+                            + rules['back_to_back'] * back_to_back + rules['perfect_clear'] * perfect_clear)
+
+    def index(self, clear_type, back_to_back, combo, perfect_clear):
+        return ((clear_type * 2 + back_to_back) * (self.max_combo + 1) + combo) * 2 + perfect_clear
+
+    # Lines sent by a clear result from Board.check_lines, back to back counts from the second clear in a row
+    def attack(self, clear_result):
+        return self.table[((clear_result['clear_type'] * 2 + (clear_result['back_to_back'] > 0)) * (self.max_combo + 1)
+                           + min(clear_result['combo'], self.max_combo)) * 2 + clear_result['perfect_clear']]
+
+# A built-in rule set by name, or a JSON file of one whose missing entries are filled in from jstris
+def load_rules(name):
+    if name in RULE_SETS:
+        return AttackRules(RULE_SETS[name])
+    with open(name) as file:
+        rules = json.load(file)
+    clears = dict(JSTRIS['clears'], **rules.get('clears', {}))
+    return AttackRules(JSTRIS | {'name': name} | rules | {'clears': clears})
+
+DEFAULT_RULES = AttackRules(JSTRIS)
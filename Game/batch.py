@@ -0,0 +1,205 @@
+import numpy as np
+from board import Board
+from attack import DEFAULT_RULES, B2B_CLEARS, LINE_CLEARS, T_SPIN_CLEARS, MINI_T_SPIN_CLEARS
+from rng import SPLITMIX_GAMMA, SPLITMIX_MIX_1, SPLITMIX_MIX_2
+from constants import *
+
+# Clear codes by lines cleared for each kind of spin, and whether each code keeps back to back going
+SPIN_CLEARS = np.array([LINE_CLEARS, T_SPIN_CLEARS, MINI_T_SPIN_CLEARS])
+B2B_TABLE = np.array(B2B_CLEARS)
+
+# Mino offsets per piece id and rotation: MINO_TABLE[piece_id, rotation] is a (4, 2) array of (x, y)
+MINO_TABLE = np.zeros((len(PIECES) + 1, 4, 4, 2), dtype=np.int64)
+for name, states in ROTATION_STATES.items():
+    for rotation, state in enumerate(states):
+        MINO_TABLE[PIECE_IDS[name], rotation] = state.minos
+
+# T-spin corners relative to the piece position, and the two facing the flat side for each rotation
+T_CORNERS_X = np.array([0, 2, 0, 2])
+T_CORNERS_Y = np.array([0, 0, 2, 2])
+T_FRONT_CORNERS = np.array([[0, 1], [1, 3], [2, 3], [0, 2]])
+T_SPIN = 1
+MINI_T_SPIN = 2
+
+# SplitMix64 over an array of states, one stream per board, the same numbers rng.SplitMix64 gives
+# Only the states of the boards listed are advanced, returns their next outputs
+def splitmix_next(states, boards):
+    z = states[boards] + np.uint64(SPLITMIX_GAMMA)
+    states[boards] = z
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(SPLITMIX_MIX_1)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(SPLITMIX_MIX_2)
+    return z ^ (z >> np.uint64(31))
+
+def splitmix_random(states, boards):
+    return (splitmix_next(states, boards) >> np.uint64(11)) / (1 << 53)
+
+# N boards stored in one array so every rule is applied to the whole batch with numpy operations
+# Pieces are given per board as arrays of piece ids, rotations and positions, results follow Board exactly
+# seeds is one garbage seed for every board or one per board, board i then gets the garbage of Board(seeds[i])
+class BatchBoard:
+    def __init__(self, n, seeds=0, messiness=GARBAGE_MESSINESS, attack_rules=DEFAULT_RULES):
+        self.n = n
+        self.index = np.arange(n)
+        self.grid = np.zeros((n, BOARD_HEIGHT, BOARD_WIDTH), dtype=np.uint8)
+        self.back_to_back = np.full(n, -1, dtype=np.int64)
+        self.combo = np.full(n, -1, dtype=np.int64)
+        self.garbage_queued = np.zeros(n, dtype=np.int64)
+        self.garbage_states = np.array(np.broadcast_to(np.asarray(seeds, dtype=np.uint64), n))  # SplitMix64 per board
+        self.messiness = np.array(np.broadcast_to(np.asarray(messiness, dtype=np.float64), n))
+        self.garbage_hole = (splitmix_next(self.garbage_states, self.index) % np.uint64(BOARD_WIDTH)).astype(np.int64)
+        self.attack_rules = attack_rules
+        self.attack_table = np.array(attack_rules.table)
+
+    # A batch carrying on from where each board is, garbage streams included
+    @classmethod
+    def from_boards(cls, boards):
+        batch = cls(len(boards), attack_rules=boards[0].attack_rules if boards else DEFAULT_RULES)
+        for i, board in enumerate(boards):
+            batch.grid[i] = board.grid
+            batch.back_to_back[i] = board.back_to_back
+            batch.combo[i] = board.combo
+            batch.garbage_queued[i] = board.garbage_queued
+            batch.garbage_states[i] = board.garbage_generator.state
+            batch.garbage_hole[i] = board.garbage_hole
+            batch.messiness[i] = board.messiness
+        return batch
+
+    def to_board(self, i):
+        board = Board(messiness=float(self.messiness[i]), attack_rules=self.attack_rules)
+        board.load_grid(self.grid[i])
+        board.back_to_back = int(self.back_to_back[i])
+        board.combo = int(self.combo[i])
+        board.garbage_queued = int(self.garbage_queued[i])
+        board.garbage_generator.state = int(self.garbage_states[i])
+        board.garbage_hole = int(self.garbage_hole[i])
+        return board
+
+    def piece_cells(self, pieces, rotations, xs, ys):
+        minos = MINO_TABLE[pieces, rotations]
+        return xs[:, None] + minos[:, :, 0], ys[:, None] + minos[:, :, 1]
+
+    def is_occupied(self, cell_x, cell_y):
+        inside = (cell_x >= 0) & (cell_x < BOARD_WIDTH) & (cell_y >= 0) & (cell_y < BOARD_HEIGHT)
+        cells = self.grid[self.index[:, None],
+                          np.clip(cell_y, 0, BOARD_HEIGHT - 1),
+                          np.clip(cell_x, 0, BOARD_WIDTH - 1)]
+        return ~inside | (cells != EMPTY)
+
+    def check_collision(self, pieces, rotations, xs, ys):
+        return self.is_occupied(*self.piece_cells(pieces, rotations, xs, ys)).any(axis=1)
+
+    def drop_distance(self, pieces, rotations, xs, ys):
+        # For every cell, the y of the first filled cell at or below it, the floor counting as filled
+        rows = np.arange(BOARD_HEIGHT, dtype=np.int8)[:, None]
+        filled_y = np.where(self.grid[:, ::-1] != EMPTY, rows[::-1], np.int8(BOARD_HEIGHT))
+        floor = np.empty((self.n, BOARD_HEIGHT + 1, BOARD_WIDTH), dtype=np.int8)
+        np.minimum.accumulate(filled_y, axis=1, out=floor[:, BOARD_HEIGHT - 1::-1])
+        floor[:, BOARD_HEIGHT] = BOARD_HEIGHT
+
+        cell_x, cell_y = self.piece_cells(pieces, rotations, xs, ys)
+        below = floor[self.index[:, None], cell_y + 1, cell_x]
+        return (below - 1 - cell_y).min(axis=1)
+
+    def add_to_board(self, pieces, rotations, xs, ys, active=None):
+        cell_x, cell_y = self.piece_cells(pieces, rotations, xs, ys)
+        boards = self.index if active is None else np.nonzero(active)[0]
+        self.grid[boards[:, None], cell_y[boards], cell_x[boards]] = pieces[boards, None]
+
+    def is_t_spin(self, pieces, rotations, xs, ys, last_rotation, last_kick_index):
+        blocked = self.is_occupied(xs[:, None] + T_CORNERS_X, ys[:, None] + T_CORNERS_Y)
+        front_free = ~blocked[self.index[:, None], T_FRONT_CORNERS[rotations]]
+
+        spin = (pieces == PIECE_IDS['T']) & last_rotation & (blocked.sum(axis=1) >= 3)
+        mini = spin & (last_kick_index < 4) & front_free.any(axis=1)
+        return np.where(mini, MINI_T_SPIN, np.where(spin, T_SPIN, 0))
+
+    def check_lines(self, pieces, rotations, xs, ys, last_rotation=False, last_kick_index=0, active=None):
+        if active is None:
+            active = np.ones(self.n, dtype=bool)
+        last_rotation = np.broadcast_to(last_rotation, self.n)
+        last_kick_index = np.broadcast_to(last_kick_index, self.n)
+
+        full = (self.grid != EMPTY).all(axis=2) & active[:, None]
+        lines = full.sum(axis=1)
+        cleared = lines > 0
+
+        spin = self.is_t_spin(pieces, rotations, xs, ys, last_rotation, last_kick_index)
+        clear_type = SPIN_CLEARS[spin, lines]
+
+        self.combo = np.where(cleared, self.combo + 1, np.where(active, -1, self.combo))
+        self.back_to_back = np.where(cleared, np.where(B2B_TABLE[clear_type], self.back_to_back + 1, -1),
+                                     self.back_to_back)
+
+        # Garbage only rises on placements that didn't clear
+        rising = active & ~cleared
+        self.add_garbage_lines(np.where(rising, self.garbage_queued, 0))
+        self.garbage_queued[rising] = 0
+
+        self.remove_lines(full)
+        return {
+            'clear_type': clear_type,
+            'lines': lines,
+            'perfect_clear': cleared & ~self.grid.any(axis=(1, 2)),
+            'combo': np.maximum(0, self.combo),
+            'back_to_back': self.back_to_back
+        }
+
+    def remove_lines(self, full):
+        boards = np.nonzero(full.any(axis=1))[0]
+        if len(boards) == 0:
+            return
+
+        # Stable sort moves the full rows to the top without reordering the rest, then they get emptied
+        order = np.argsort(~full[boards], axis=1, kind='stable')
+        cleared = self.grid[boards[:, None], order]
+        cleared[np.arange(BOARD_HEIGHT) < full[boards].sum(axis=1)[:, None]] = EMPTY
+        self.grid[boards] = cleared
+
+    # Holes for the next nums[i] garbage lines of each of boards, the same way Board.garbage_holes picks them
+    # Returns (len(boards), max(nums)) holes, a line at a time for every board that still needs one
+    def garbage_holes(self, boards, nums):
+        holes = np.zeros((len(boards), nums.max()), dtype=np.int64)
+        for line in range(nums.max()):
+            drawing = boards[nums > line]
+            moving = drawing[splitmix_random(self.garbage_states, drawing) < self.messiness[drawing]]
+            # Moving means landing in any other column
+            steps = splitmix_next(self.garbage_states, moving) % np.uint64(BOARD_WIDTH - 1)
+            self.garbage_hole[moving] = (self.garbage_hole[moving] + 1 + steps.astype(np.int64)) % BOARD_WIDTH
+            holes[:, line] = self.garbage_hole[boards]
+        return holes
+
+    def add_garbage_lines(self, nums):
+        boards = np.nonzero(nums)[0]
+        if len(boards) == 0:
+            return
+
+        lines = np.minimum(nums[boards], BOARD_HEIGHT)
+        source = np.arange(BOARD_HEIGHT) + lines[:, None]
+        shifted = self.grid[boards[:, None], np.minimum(source, BOARD_HEIGHT - 1)]
+
+        # The first garbage line goes in the highest garbage row, like Board.add_garbage_lines
+        holes = self.garbage_holes(boards, lines)
+        line = np.clip(source - BOARD_HEIGHT, 0, holes.shape[1] - 1)
+        row_holes = np.take_along_axis(holes, line, axis=1)
+        garbage = np.where(np.arange(BOARD_WIDTH) == row_holes[:, :, None], EMPTY, GARBAGE_ID).astype(np.uint8)
+        self.grid[boards] = np.where((source < BOARD_HEIGHT)[:, :, None], shifted, garbage)
+
+    def garbage_calc(self, result):
+        rules = self.attack_rules
+        index = rules.index(result['clear_type'], result['back_to_back'] > 0,
+                            np.minimum(result['combo'], rules.max_combo), result['perfect_clear'])
+        return self.attack_table[index]
+
+    def take_garbage(self, nums):
+        self.garbage_queued += nums
+
+    def send_garbage(self, nums):
+        cancelled = np.minimum(nums, self.garbage_queued)
+        self.garbage_queued -= cancelled
+        return nums - cancelled
+
+    # Same as Engine.lock_piece for every active board, returns the clear results and the lines sent
+    def lock(self, pieces, rotations, xs, ys, last_rotation=False, last_kick_index=0, active=None):
+        self.add_to_board(pieces, rotations, xs, ys, active)
+        result = self.check_lines(pieces, rotations, xs, ys, last_rotation, last_kick_index, active)
+        return result, self.send_garbage(self.garbage_calc(result))
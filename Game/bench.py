@@ -0,0 +1,325 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from board import Board
+from engine import Engine
+from tetromino import Tetromino
+from placements import find_placements, PLACEMENT_CACHE
+from bot import Bot, BotController, benchmark
+from features import extract, game_grids
+from attack import SINGLE, DOUBLE, TETRIS, T_SPIN_DOUBLE
+from constants import *
+
+# Each microbenchmark is timed over enough calls to take at least MIN_TIME seconds, REPEATS times, keeping the fastest
+MIN_TIME = .2
+REPEATS = 5
+
+# Results more than this much worse than the baseline are reported as regressions
+DEFAULT_THRESHOLD = .1
+
+# Modules timed on import in a fresh interpreter, the rules and headless tools shouldn't pull in pygame
+IMPORT_MODULES = ['constants', 'board', 'engine', 'bot', 'tournament', 'game']
+IMPORT_REPEATS = 3
+
+SEED = 1
+GAME_PIECES = 300
+GAME_FRAMES = 3600
+FEATURE_BOARDS = 100000
+
+# Mid-game board every microbenchmark runs against: eight rows of garbage
+def test_board():
+    board = Board(SEED)
+    board.add_garbage_lines(8)
+    return board
+
+# A piece somewhere its first rotation needs a kick, so rotate runs through the kick tests
+def kicking_piece(board):
+    for name in ('T', 'L', 'J', 'S', 'Z', 'I'):
+        for rotation in range(4):
+            for x in range(-2, BOARD_WIDTH):
+                piece = Tetromino(name)
+                piece.set_rotation(rotation)
+                piece.x = x
+                if board.check_collision(piece):
+                    continue
+                piece.y = piece.get_ghost_position(board)
+                pose = (rotation, x, piece.y)
+                board.last_kick_index = 0
+                if piece.rotate(board) and board.last_kick_index > 0:
+                    return name, pose
+    raise RuntimeError("No pose on the test board needs a kick")
+
+# Microbenchmarks return a function to time, one call of it is one operation
+# Ones that change what they run on also return prepare(number), which makes the argument of each call untimed
+def bench_check_collision():
+    board = test_board()
+    piece = Tetromino('T')
+    offsets = [(dx, dy) for dx in range(-3, 4) for dy in range(0, 22)]
+    def run():
+        for dx, dy in offsets:
+            board.check_collision(piece, dx, dy)
+    return run, len(offsets)
+
+def bench_rotate():
+    board = test_board()
+    name, (rotation, x, y) = kicking_piece(board)
+    piece = Tetromino(name)
+    def run():
+        piece.set_rotation(rotation)
+        piece.x, piece.y = x, y
+        piece.rotate(board)
+    return run, 1
+
+def bench_ghost_position():
+    board = test_board()
+    pieces = [Tetromino(name) for name in PIECES]
+    def run():
+        for piece in pieces:
+            piece.get_ghost_position(board)
+    return run, len(pieces)
+
+def bench_board_copy():
+    board = test_board()
+    return board.copy, 1
+
+# Locks an I piece into a well four rows deep and clears the tetris, board copy included
+def bench_check_lines():
+    board = test_board()
+    board.grid[BOARD_HEIGHT - 12:BOARD_HEIGHT - 8] = GARBAGE_ID
+    board.grid[BOARD_HEIGHT - 12:BOARD_HEIGHT - 8, 0] = EMPTY
+    board.update_rows()
+    piece = Tetromino('I')
+    piece.set_rotation(1)
+    piece.x = -2
+    piece.y = piece.get_ghost_position(board)
+    def run():
+        copy = board.copy()
+        copy.add_to_board(piece)
+        copy.check_lines(piece)
+    return run, 1
+
+# Removes four full rows sitting on the garbage, the way check_lines clears a tetris
+def bench_remove_lines():
+    board = test_board()
+    lines = list(range(BOARD_HEIGHT - 12, BOARD_HEIGHT - 8))
+    board.grid[lines] = GARBAGE_ID
+    board.update_rows()
+    def prepare(number):
+        return [board.copy() for _ in range(number)]
+    def run(copy):
+        copy.remove_lines(lines)
+    return run, 1, prepare
+
+def bench_add_garbage_lines():
+    board = test_board()
+    def run():
+        board.copy().add_garbage_lines(4)
+    return run, 1
+
+def bench_garbage_calc():
+    board = Board()
+    clears = [
+        {'clear_type': SINGLE, 'lines': 1, 'perfect_clear': False, 'combo': 0, 'back_to_back': -1},
+        {'clear_type': TETRIS, 'lines': 4, 'perfect_clear': False, 'combo': 3, 'back_to_back': 1},
+        {'clear_type': T_SPIN_DOUBLE, 'lines': 2, 'perfect_clear': False, 'combo': 8, 'back_to_back': 2},
+        {'clear_type': DOUBLE, 'lines': 2, 'perfect_clear': True, 'combo': 13, 'back_to_back': -1}
+    ]
+    def run():
+        for clear in clears:
+            board.garbage_calc(clear)
+    return run, len(clears)
+
+# Every placement of each piece from where it spawns, with the cache emptied first so each search starts cold
+def bench_find_placements_cold():
+    board = test_board()
+    pieces = [Tetromino(name) for name in PIECES]
+    def run():
+        for piece in pieces:
+            PLACEMENT_CACHE.clear()
+            find_placements(board, piece)
+    return run, len(pieces)
+
+MICRO_BENCHMARKS = {
+    'check_collision': bench_check_collision,
+    'rotate_with_kicks': bench_rotate,
+    'get_ghost_position': bench_ghost_position,
+    'find_placements_cold': bench_find_placements_cold,
+    'board_copy': bench_board_copy,
+    'check_lines_tetris': bench_check_lines,
+    'remove_lines': bench_remove_lines,
+    'add_garbage_lines': bench_add_garbage_lines,
+    'garbage_calc': bench_garbage_calc
+}
+
+def time_calls(run, number, prepare):
+    if prepare:
+        arguments = prepare(number)
+        start = time.perf_counter()
+        for argument in arguments:
+            run(argument)
+    else:
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+    return time.perf_counter() - start
+
+def time_micro(setup):
+    run, operations, *prepare = setup()
+    prepare = prepare[0] if prepare else None
+    number = 1
+    while True:
+        elapsed = time_calls(run, number, prepare)
+        if elapsed >= MIN_TIME:
+            break
+        number *= 2
+
+    best = elapsed
+    for _ in range(REPEATS - 1):
+        best = min(best, time_calls(run, number, prepare))
+    return best / (number * operations) * 1e9
+
+# A bot that always finishes its search, so every run does the same work
+def deterministic_bot():
+    return Bot(beam_width=4, preview=1, think_time=10**6)
+
+# Whole seeded games played by the bot, placement search and evaluation included
+def bench_game_pieces():
+    return benchmark(SEED, GAME_PIECES, deterministic_bot())['pieces_per_second']
+
+# Inputs for every frame of a seeded bot game, so the engine can be timed on its own
+def record_frames(frames):
+    engine = Engine(SEED)
+    controller = BotController(deterministic_bot(), input_delay=1000 / FPS)
+    schedule = []
+    for frame in range(frames):
+        inputs = controller.next_inputs(engine)
+        schedule.append(inputs)
+        engine.step(inputs, 0)
+        engine.advance((frame + 1) * 1000 / FPS)
+        if engine.game_over:
+            engine.reset()
+    return schedule
+
+def play_frames(schedule, draw=None):
+    engine = Engine(SEED)
+    start = time.perf_counter()
+    for frame, inputs in enumerate(schedule):
+        engine.step(inputs, 0)
+        engine.advance((frame + 1) * 1000 / FPS)
+        if engine.game_over:
+            engine.reset()
+        if draw:
+            draw(engine)
+    return len(schedule) / (time.perf_counter() - start)
+
+# Engine frames at FPS, each one the inputs of that frame and every logic step in it
+def bench_engine_frames():
+    return play_frames(record_frames(GAME_FRAMES))
+
+# The same frames drawn by the renderer to an offscreen display
+def bench_render_frames():
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import pygame
+    from render import Renderer
+
+    schedule = record_frames(GAME_FRAMES)
+    pygame.init()
+    renderer = Renderer(pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT)))
+    try:
+        return play_frames(schedule, renderer.draw)
+    finally:
+        pygame.quit()
+
+# Boards a second through the batch feature extractor, a batch of grids from a seeded bot game at once
+def bench_feature_boards():
+    grids = game_grids(SEED, FEATURE_BOARDS)
+    best = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        extract(grids)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return FEATURE_BOARDS / best
+
+# Milliseconds to import a module from scratch, and whether doing so loaded pygame
+def time_import(module):
+    code = f"import sys, time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start, 'pygame' in sys.modules)"
+    best = None
+    for _ in range(IMPORT_REPEATS):
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split()
+        elapsed = float(output[-2]) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, output[-1] == 'True'
+
+# Name to (function, unit), these are throughputs so higher is better
+MACRO_BENCHMARKS = {
+    'game_pieces_per_second': (bench_game_pieces, 'pieces/s'),
+    'engine_frames_per_second': (bench_engine_frames, 'frames/s'),
+    'render_frames_per_second': (bench_render_frames, 'frames/s'),
+    'feature_boards_per_second': (bench_feature_boards, 'boards/s')
+}
+
+def run_benchmarks(only=None):
+    results = {}
+    for name, setup in MICRO_BENCHMARKS.items():
+        if not only or any(part in name for part in only):
+            results[name] = {'value': time_micro(setup), 'unit': 'ns/op', 'higher_is_better': False}
+            print(f"{name:<28}{results[name]['value']:>14.0f} ns/op")
+    for module in IMPORT_MODULES:
+        name = f'import_{module}'
+        if not only or any(part in name for part in only):
+            elapsed, loads_pygame = time_import(module)
+            results[name] = {'value': elapsed, 'unit': 'ms', 'higher_is_better': False, 'loads_pygame': loads_pygame}
+            print(f"{name:<28}{elapsed:>14.1f} ms{'  (loads pygame)' if loads_pygame else ''}")
+    for name, (function, unit) in MACRO_BENCHMARKS.items():
+        if not only or any(part in name for part in only):
+            results[name] = {'value': function(), 'unit': unit, 'higher_is_better': True}
+            print(f"{name:<28}{results[name]['value']:>14.1f} {unit}")
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results
+    }
+
+# Change of every result shared with the baseline, positive is better, returns the ones worse than the threshold
+def compare(report, baseline, threshold=DEFAULT_THRESHOLD):
+    regressions = []
+    print(f"\n{'benchmark':<28}{'baseline':>14}{'now':>14}{'change':>9}")
+    for name, result in report['results'].items():
+        if name not in baseline['results']:
+            continue
+        old = baseline['results'][name]['value']
+        new = result['value']
+        change = (new - old) / old if result['higher_is_better'] else (old - new) / old
+        flag = "  REGRESSION" if change < -threshold else ""
+        print(f"{name:<28}{old:>14.1f}{new:>14.1f}{change:>+9.1%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the engine's hot paths and whole games")
+    parser.add_argument('--output', help="save the results to this JSON file")
+    parser.add_argument('--compare', metavar='BASELINE', help="compare against results saved earlier, exits with 1 on a regression")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="fraction slower that counts as a regression")
+    parser.add_argument('--only', nargs='+', help="only run benchmarks whose names contain one of these")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.only)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regressions: {', '.join(regressions)}")
+            sys.exit(1)
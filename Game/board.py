@@ -1,43 +1,132 @@
-import random
+import copy
+import struct
 from constants import *
+from attack import *
+from rng import SplitMix64
 from tetromino import Tetromino
 
+# Snapshots are these fields followed by the grid packed two cells to a byte, always the same size
+BOARD_STATE = struct.Struct('<hhH?BQBd')
+BOARD_CELLS_SIZE = BOARD_HEIGHT * BOARD_WIDTH // 2
+BOARD_SNAPSHOT_SIZE = BOARD_STATE.size + BOARD_CELLS_SIZE
+ROW_BIT_VALUES = 1 << (np.arange(BOARD_WIDTH, dtype=np.int64) + WALL_WIDTH)
+
 class Board:
-    def __init__(self):
-        self.grid = np.empty((BOARD_HEIGHT, BOARD_WIDTH), dtype=object)
+    def __init__(self, seed=0, messiness=GARBAGE_MESSINESS, attack_rules=DEFAULT_RULES):
+        self.grid = np.zeros((BOARD_HEIGHT, BOARD_WIDTH), dtype=np.uint8)
+        self.rows = [EMPTY_ROW] * BOARD_HEIGHT  # One occupancy bitmask per row, see WALL_WIDTH
+        self.heights = [BOARD_HEIGHT] * BOARD_WIDTH  # Y of the highest filled cell in each column
+        self.row_counts = [0] * BOARD_HEIGHT  # Filled cells per row, a row is full at BOARD_WIDTH
+        self.cell_count = 0
+        self.full_rows = []  # Full rows not cleared yet, filled by add_to_board and cleared by check_lines
+        self.version = 0  # Bumped whenever cells change, so drawing can skip boards that haven't
         self.last_rotation = False  # Track if last move was a rotation
         self.last_kick_index = 0    # Track which kick was used in last rotation
         self.back_to_back = -1
         self.combo = -1  # Start at -1 so first clear gives combo of 0
         self.garbage_queued = 0
+        self.garbage_generator = SplitMix64(seed)  # Garbage holes only, so they replay the same for a seed
+        self.messiness = messiness  # Chance each garbage row moves its hole away from the row before it
+        self.garbage_hole = self.garbage_generator.randrange(BOARD_WIDTH)
+        self.attack_rules = attack_rules  # Compiled AttackRules that garbage_calc looks clears up in
         
+    def copy(self):
+        board = copy.copy(self)
+        board.grid = self.grid.copy()
+        board.rows = self.rows.copy()
+        board.heights = self.heights.copy()
+        board.row_counts = self.row_counts.copy()
+        board.full_rows = self.full_rows.copy()
+        board.garbage_generator = self.garbage_generator.copy()
+        return board
+
     def is_valid_position(self, x, y):
         return (0 <= x < BOARD_WIDTH) and (0 <= y < BOARD_HEIGHT)
     
+    def is_occupied(self, x, y):
+        if not self.is_valid_position(x, y):
+            return True
+        return (self.rows[y] >> (x + WALL_WIDTH)) & 1 == 1
+
     def check_collision(self, piece, dx=0, dy=0):
-        shape_height, shape_width = np.shape(piece.shape)
-
-        # Loop through all minos and check if they can move to the new location
-        for x in range(shape_width):
-            for y in range(shape_height):
-                if piece.shape[y, x]:
-                    new_x = piece.x + x + dx
-                    new_y = piece.y + y + dy
-                    
-                    if not self.is_valid_position(new_x, new_y):
-                        return True
-                    if self.grid[new_y, new_x] is not None:
-                        return True
+        return self.check_state_collision(piece.state, piece.x + dx, piece.y + dy)
+
+    def check_state_collision(self, state, x, y):
+        # The walls in rows are only WALL_WIDTH wide, so anything further out is caught here first
+        if x + state.min_x < 0 or x + state.max_x >= BOARD_WIDTH:
+            return True
+        x += WALL_WIDTH
+
+        # AND every row of the piece against the board row it would move into
+        for row, mask in state.row_masks:
+            new_y = y + row
+            if not 0 <= new_y < BOARD_HEIGHT:
+                return True
+            if self.rows[new_y] & (mask << x):
+                return True
         return False
     
     def add_to_board(self, piece):
-        shape_height, shape_width = np.shape(piece.shape)
-
         # Add each mino to the board
-        for x in range(shape_width):
-            for y in range(shape_height):
-                if piece.shape[y,x]:
-                    self.grid[piece.y + y, piece.x + x] = piece.color
+        for row, mask in piece.state.row_masks:
+            self.rows[piece.y + row] |= mask << (piece.x + WALL_WIDTH)
+        for x, y in piece.state.minos:
+            self.grid[piece.y + y, piece.x + x] = piece.piece_id
+            if piece.y + y < self.heights[piece.x + x]:
+                self.heights[piece.x + x] = piece.y + y
+
+            self.row_counts[piece.y + y] += 1
+            if self.row_counts[piece.y + y] == BOARD_WIDTH:
+                self.full_rows.append(piece.y + y)
+        self.cell_count += len(piece.state.minos)
+        self.version += 1
+
+    def load_grid(self, grid):
+        self.grid = np.array(grid, dtype=np.uint8)
+        self.update_rows()
+
+    # Rebuilds the row masks, counters and column heights from the grid of piece ids
+    def update_rows(self):
+        self.rows = ((self.grid != EMPTY) @ ROW_BIT_VALUES | EMPTY_ROW).tolist()
+        self.row_counts = [(row ^ EMPTY_ROW).bit_count() for row in self.rows]
+        self.cell_count = sum(self.row_counts)
+        self.full_rows = [y for y, count in enumerate(self.row_counts) if count == BOARD_WIDTH]
+        self.version += 1
+        self.update_heights_from(0)
+
+    def snapshot(self):
+        cells = (self.grid[:, 0::2] << 4) | self.grid[:, 1::2]
+        return BOARD_STATE.pack(self.back_to_back, self.combo, self.garbage_queued, self.last_rotation,
+                                self.last_kick_index, self.garbage_generator.state, self.garbage_hole,
+                                self.messiness) + cells.tobytes()
+
+    def restore(self, data, offset=0):
+        (self.back_to_back, self.combo, self.garbage_queued, self.last_rotation, self.last_kick_index,
+         self.garbage_generator.state, self.garbage_hole, self.messiness) = BOARD_STATE.unpack_from(data, offset)
+        cells = np.frombuffer(data, np.uint8, BOARD_CELLS_SIZE, offset + BOARD_STATE.size)
+        cells = cells.reshape(BOARD_HEIGHT, BOARD_WIDTH // 2)
+        self.grid[:, 0::2] = cells >> 4
+        self.grid[:, 1::2] = cells & 0xF
+        self.update_rows()
+
+    def drop_distance(self, piece):
+        return self.state_drop_distance(piece.state, piece.x, piece.y)
+
+    def state_drop_distance(self, state, x, y):
+        distance = BOARD_HEIGHT
+        for column, bottom in state.bottom_profile:
+            column_height = self.heights[x + column]
+            if y + bottom > column_height:
+                # The piece is tucked under an overhang, so the surface doesn't bound the drop
+                return self.scan_drop_distance(state, x, y)
+            distance = min(distance, column_height - 1 - y - bottom)
+        return distance
+
+    def scan_drop_distance(self, state, x, y):
+        distance = 0
+        while not self.check_state_collision(state, x, y + distance + 1):
+            distance += 1
+        return distance
 
     def is_t_spin(self, piece):
         if piece.piece_name != 'T' or not self.last_rotation:
@@ -53,10 +142,7 @@ class Board:
             (center_x + 1, center_y + 1)
         ]
         
-        blocked_corners = sum(
-            1 for x, y in corners
-            if not self.is_valid_position(x, y) or self.grid[y, x] is not None
-        )
+        blocked_corners = sum(1 for x, y in corners if self.is_occupied(x, y))
         
         if blocked_corners < 3:
             return None
@@ -71,56 +157,32 @@ class Board:
         elif piece.rotation_state == 3:  # Facing left
             front_corners = [corners[0], corners[2]]
         
-        front_corner_check = any(
-            self.is_valid_position(x, y) and self.grid[y, x] is None
-            for x, y in front_corners
-        )
+        front_corner_check = any(not self.is_occupied(x, y) for x, y in front_corners)
 
         if self.last_kick_index < 4 and front_corner_check:
             return "MINI T-SPIN"
         return "T-SPIN"
 
     def is_perfect_clear(self):
-        return not np.any(self.grid != None)
+        return self.cell_count == 0
 
     def check_lines(self, piece):
-        lines_cleared = []
-
-        min_y = max(0, piece.y)
-        max_y =  min(BOARD_HEIGHT - 1, piece.y + len(piece.shape))
-        
-        for y in range(min_y, max_y + 1):
-            if all(cell is not None for cell in self.grid[y]):
-                lines_cleared.append(y)
+        lines_cleared = self.full_rows
+        self.full_rows = []
 
-        clear_type = None
+        clear_type = NO_CLEAR
         if lines_cleared:
             tspin_type = self.is_t_spin(piece)
             if tspin_type == "T-SPIN":
-                if len(lines_cleared) == 1:
-                    clear_type = "T-SPIN SINGLE"
-                elif len(lines_cleared) == 2:
-                    clear_type = "T-SPIN DOUBLE"
-                elif len(lines_cleared) == 3:
-                    clear_type = "T-SPIN TRIPLE"
+                clear_type = T_SPIN_CLEARS[len(lines_cleared)]
             elif tspin_type == "MINI T-SPIN":
-                if len(lines_cleared) == 1:
-                    clear_type = "MINI T-SPIN SINGLE"
-                else:
-                    clear_type = "MINI T-SPIN"
+                clear_type = MINI_T_SPIN_CLEARS[len(lines_cleared)]
             else:
-                if len(lines_cleared) == 1:
-                    clear_type = "SINGLE"
-                elif len(lines_cleared) == 2:
-                    clear_type = "DOUBLE"
-                elif len(lines_cleared) == 3:
-                    clear_type = "TRIPLE"
-                elif len(lines_cleared) == 4:
-                    clear_type = "TETRIS"
+                clear_type = LINE_CLEARS[len(lines_cleared)]
         
         if lines_cleared:
             self.combo += 1
-            if clear_type in ["TETRIS", "T-SPIN SINGLE", "T-SPIN DOUBLE", "T-SPIN TRIPLE", "MINI T-SPIN SINGLE"]:
+            if B2B_CLEARS[clear_type]:
                 self.back_to_back += 1
             else:
                 self.back_to_back = -1
@@ -145,61 +207,79 @@ class Board:
         return None
 
     def remove_lines(self, lines):
-        lines.sort(reverse=True)
-        
-        for line in lines:
-            self.grid = np.delete(self.grid, line, axis=0)
-        for line in lines:
-            self.grid = np.vstack([np.full(BOARD_WIDTH, None), self.grid])
+        # Compacts the board in place, moving every kept row down past the cleared rows below it
+        # Rows below the lowest cleared row stay where they are
+        cleared = set(lines)
+        top = min(self.heights)
+        write = max(lines)
+        for read in range(write, top - 1, -1):
+            if read in cleared:
+                continue
+            if write != read:
+                self.grid[write] = self.grid[read]
+                self.rows[write] = self.rows[read]
+                self.row_counts[write] = self.row_counts[read]
+            write -= 1
 
-    def add_garbage_lines(self, num):
-        self.grid = np.delete(self.grid, range(num), axis=0)
+        # Everything from the old top down to the last written row is now empty
+        self.grid[top:write + 1] = EMPTY
+        for y in range(top, write + 1):
+            self.rows[y] = EMPTY_ROW
+            self.row_counts[y] = 0
+        self.cell_count -= BOARD_WIDTH * len(lines)
+        # Full rows that weren't removed moved down with everything else
+        if self.full_rows:
+            self.full_rows = [y for y in range(write + 1, BOARD_HEIGHT) if self.row_counts[y] == BOARD_WIDTH]
+        self.version += 1
+        self.update_heights_from(write + 1)
+
+    def update_heights_from(self, top):
+        # Walks down the row masks from the top of the stack until every column has been seen
+        self.heights = [BOARD_HEIGHT] * BOARD_WIDTH
+        missing = FULL_ROW ^ EMPTY_ROW
+        for y in range(top, BOARD_HEIGHT):
+            found = self.rows[y] & missing
+            if found:
+                missing ^= found
+                for x in range(BOARD_WIDTH):
+                    if found >> (x + WALL_WIDTH) & 1:
+                        self.heights[x] = y
+                if not missing:
+                    break
+
+    def garbage_holes(self, num):
+        holes = []
         for i in range(num):
-            row = np.empty(BOARD_WIDTH, dtype=object)
-            hole = random.randint(0, BOARD_WIDTH - 1)
-            for j in range(BOARD_WIDTH):
-                if j != hole:
-                    row[j] = GRAY
-            self.grid = np.vstack([self.grid, row])
+            if self.garbage_generator.random() < self.messiness:
+                # Moving means landing in any other column
+                self.garbage_hole = (self.garbage_hole + 1 + self.garbage_generator.randrange(BOARD_WIDTH - 1)) % BOARD_WIDTH
+            holes.append(self.garbage_hole)
+        return holes
+
+    def add_garbage_lines(self, num):
+        num = min(num, BOARD_HEIGHT)
+        holes = self.garbage_holes(num)
+        top = max(0, min(self.heights) - num)
+
+        # Shift everything up once, then write all of the garbage rows into the freed space together
+        self.grid[:BOARD_HEIGHT - num] = self.grid[num:]
+        self.grid[BOARD_HEIGHT - num:] = GARBAGE_ID
+        self.grid[np.arange(BOARD_HEIGHT - num, BOARD_HEIGHT), holes] = EMPTY
+
+        self.cell_count += num * (BOARD_WIDTH - 1) - sum(self.row_counts[:num])
+        del self.rows[:num]
+        del self.row_counts[:num]
+        self.rows.extend(FULL_ROW ^ (1 << (hole + WALL_WIDTH)) for hole in holes)
+        self.row_counts.extend([BOARD_WIDTH - 1] * num)
+        # Garbage rows always have a hole, full rows just move up with the rest and the ones pushed off the top are gone
+        self.full_rows = [y - num for y in self.full_rows if y >= num]
+        self.version += 1
+        self.update_heights_from(top)
             
     def garbage_calc(self, clear_dict):
-        if not clear_dict or clear_dict['lines'] == 0:
+        if not clear_dict:
             return 0
-
-        # Attack & Combo Table taken from jstris
-        attack_table = {
-            'SINGLE': 0,
-            'DOUBLE': 1,
-            'TRIPLE': 2,
-            'TETRIS': 4,
-            'T-SPIN DOUBLE': 4,
-            'T-SPIN TRIPLE': 6,
-            'T-SPIN SINGLE': 2,
-            'T-SPIN MINI SINGLE': 0
-        }
-
-        lines_sent = 0
-        if clear_dict['clear_type']:
-            lines_sent += attack_table[clear_dict['clear_type']]
-        if clear_dict['perfect_clear']:
-            lines_sent += 10
-        if clear_dict['back_to_back'] > 0:
-            lines_sent += 1
-        
-        combo = clear_dict['combo']
-        if combo > 1:
-            if combo < 5:
-                lines_sent += 1
-            elif combo < 7:
-                lines_sent += 2
-            elif combo < 9:
-                lines_sent += 3
-            elif combo < 12:
-                lines_sent += 4
-            else:
-                lines_sent += 5
-
-        return lines_sent
+        return self.attack_rules.attack(clear_dict)
 
     def take_garbage(self, num):
         self.garbage_queued += num
@@ -212,33 +292,3 @@ class Board:
         sent = num - self.garbage_queued
         self.garbage_queued = 0
         return sent
-
-    def draw(self, screen, current_piece=None):
-        # Grid
-        for x in range(BOARD_OFFSET_X, BOARD_WIDTH * CELL_SIZE + BOARD_OFFSET_X + 1, CELL_SIZE):
-           pygame.draw.line(
-               screen,
-               BOARD_LINE,
-               (x, BOARD_OFFSET_Y),
-               (x, GRID_HEIGHT * CELL_SIZE + BOARD_OFFSET_Y)
-           )
-        
-        # Draw horizontal grid lines
-        for y in range(BOARD_OFFSET_Y, GRID_HEIGHT * CELL_SIZE + BOARD_OFFSET_Y + 1, CELL_SIZE):
-            pygame.draw.line(
-                screen,
-                BOARD_LINE,
-                (BOARD_OFFSET_X, y),
-                (BOARD_WIDTH * CELL_SIZE + BOARD_OFFSET_X, y)
-            )
-        
-        pygame.draw.rect(screen, BOARD_BORDER, pygame.Rect(BOARD_OFFSET_X, BOARD_OFFSET_Y, BOARD_WIDTH * CELL_SIZE + 1, GRID_HEIGHT * CELL_SIZE + 1), 1)
-
-        # Pieces on board
-        for x in range(BOARD_WIDTH):
-            for y in reversed(range(BOARD_HEIGHT)):
-                if self.grid[y, x]:
-                    pygame.draw.rect(screen, self.grid[y, x],
-                        (BOARD_OFFSET_X + x * CELL_SIZE,
-                        BOARD_OFFSET_Y + (y - GRID_HEIGHT) * CELL_SIZE,
-                        CELL_SIZE, CELL_SIZE))
\ No newline at end of file
@@ -0,0 +1,291 @@
+import argparse
+import itertools
+import multiprocessing
+import time
+from board import Board
+from engine import Engine
+from tetromino import Tetromino
+from placements import find_placements
+from attack import DEFAULT_RULES, RULE_SETS, load_rules
+from constants import *
+
+# Weights for each board feature, the score of a line of play is the weighted sum
+DEFAULT_WEIGHTS = {
+    'attack': 4.0,        # Lines sent over the whole line of play
+    'height': -0.3,       # Sum of all column heights
+    'max_height': -0.5,
+    'holes': -6.0,        # Empty cells with a filled cell somewhere above them
+    'bumpiness': -0.6,    # Height difference between neighbouring columns
+    'well_depth': 0.5,    # Depth of the deepest well, kept open for tetrises
+    'danger': -20.0       # Per row the highest column plus queued garbage reaches past DANGER_HEIGHT
+}
+DANGER_HEIGHT = 14
+
+def evaluate(board, weights, garbage_queued=0):
+    heights = [BOARD_HEIGHT - height for height in board.heights]
+    holes = sum(heights) - board.cell_count
+    bumpiness = sum(abs(a - b) for a, b in zip(heights, heights[1:]))
+    walls = [BOARD_HEIGHT] + heights + [BOARD_HEIGHT]
+    well_depth = max(max(0, min(walls[i], walls[i + 2]) - walls[i + 1]) for i in range(BOARD_WIDTH))
+    max_height = max(heights)
+
+    return (weights['height'] * sum(heights)
+            + weights['max_height'] * max_height
+            + weights['holes'] * holes
+            + weights['bumpiness'] * bumpiness
+            + weights['well_depth'] * min(well_depth, 4)
+            + weights['danger'] * max(0, max_height + garbage_queued - DANGER_HEIGHT))
+
+# One line of play in the beam: the board after it, what is held, how much of the queue is used and the attack sent
+class SearchNode:
+    def __init__(self, board, held, index, attack, root, score=0):
+        self.board = board
+        self.held = held
+        self.index = index
+        self.attack = attack
+        self.root = root  # Index of the first move in the root's candidate list
+        self.score = score
+
+# Every piece that can be played next by name: (name, held afterwards, queue index afterwards, whether it was a hold)
+def hold_options(pieces, held, index):
+    current = pieces[index]
+    options = [(current, held, index + 1, False)]
+    if held is None:
+        if index + 1 < len(pieces):
+            options.append((pieces[index + 1], current, index + 2, True))
+    elif held != current:
+        options.append((held, current, index + 1, True))
+    return options
+
+# The same for a node, as pieces to place, the first piece starts from start_piece's pose when it's given
+def piece_options(node, pieces, start_piece):
+    return [(start_piece if node.index == 0 and start_piece and not use_hold else Tetromino(name), held, index, use_hold)
+            for name, held, index, use_hold in hold_options(pieces, node.held, node.index)]
+
+def expand(node, pieces, weights, garbage_queued, deadline):
+    for piece, held, index, _ in piece_options(node, pieces, None):
+        if node.board.check_collision(piece):
+            continue
+        for placement in find_placements(node.board, piece):
+            if time.monotonic() >= deadline:
+                return
+            board = node.board.copy()
+            clear_result = placement.lock(board)
+            attack = node.attack + board.garbage_calc(clear_result)
+            score = weights['attack'] * attack + evaluate(board, weights, garbage_queued)
+            yield SearchNode(board, held, index, attack, node.root, score)
+
+# The first moves from the engine's position: (use_hold, placement, held afterwards, queue index afterwards)
+def root_candidates(board, pieces, held, start_piece):
+    root = SearchNode(board, held, 0, 0, None)
+    candidates = []
+    for piece, held_after, index, use_hold in piece_options(root, pieces, start_piece):
+        if not board.check_collision(piece):
+            candidates.extend((use_hold, placement, held_after, index) for placement in find_placements(board, piece))
+    return candidates
+
+# A node for each of the allowed first moves, or as many of them as there's time for, best first
+# board should have no garbage queued, garbage holes are random so the search only weighs the danger of queued lines
+def root_layer(board, candidates, allowed, weights, garbage_queued, deadline):
+    nodes = []
+    for i in allowed:
+        if nodes and time.monotonic() >= deadline:
+            break
+        _, placement, held_after, index = candidates[i]
+        child = board.copy()
+        attack = child.garbage_calc(placement.lock(child))
+        score = weights['attack'] * attack + evaluate(child, weights, garbage_queued)
+        nodes.append(SearchNode(child, held_after, index, attack, i, score))
+    nodes.sort(key=lambda node: node.score, reverse=True)
+    return nodes
+
+# Beam search from the root nodes over the queue until it runs out or the deadline (time.monotonic) passes
+# Returns (score, root index) of the best line from the deepest layer that was completed
+def beam_search(roots, pieces, weights, beam_width, deadline, garbage_queued):
+    if not roots:
+        return None
+    beam = sorted(roots, key=lambda node: node.score, reverse=True)[:beam_width]
+    best = beam[0]
+
+    while time.monotonic() < deadline:
+        children = []
+        for node in beam:
+            if node.index < len(pieces):
+                children.extend(expand(node, pieces, weights, garbage_queued, deadline))
+            if time.monotonic() >= deadline:
+                break
+        # A layer cut short by the deadline would favour whichever nodes happened to be expanded first
+        if not children or time.monotonic() >= deadline:
+            break
+        children.sort(key=lambda node: node.score, reverse=True)
+        beam = children[:beam_width]
+        best = beam[0]
+
+    return best.score, best.root
+
+# Root nodes go to worker processes as board snapshots, which pickle far smaller than boards,
+# so a worker only restores its share of the first layer instead of finding every first move again
+def pack_roots(nodes):
+    return [(node.board.snapshot(), node.held, node.index, node.attack, node.root, node.score) for node in nodes]
+
+def search_packed_roots(packed, attack_rules, pieces, weights, beam_width, deadline, garbage_queued):
+    roots = []
+    for snapshot, held, index, attack, root, score in packed:
+        board = Board(attack_rules=attack_rules)
+        board.restore(snapshot)
+        roots.append(SearchNode(board, held, index, attack, root, score))
+    return beam_search(roots, pieces, weights, beam_width, deadline, garbage_queued)
+
+# Seconds for the quickest of a few empty round trips through the pool
+def pool_round_trip(pool, workers, repeats=5):
+    best = None
+    for _ in range(repeats):
+        start = time.monotonic()
+        pool.map(abs, range(workers))
+        elapsed = time.monotonic() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+# Default milliseconds per piece, with more given to a bot that has a pool
+# Handing the roots to the pool and collecting the results takes around 3 ms, so workers only pay off well above that
+THINK_TIME = 5
+POOL_THINK_TIME = 50
+
+class Bot:
+    def __init__(self, weights=None, beam_width=6, preview=5, think_time=None, workers=0):
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.beam_width = beam_width
+        self.preview = preview
+        if think_time is None:
+            think_time = POOL_THINK_TIME if workers > 1 else THINK_TIME
+        self.think_time = think_time  # Milliseconds per piece
+        self.workers = workers
+        self.pool = multiprocessing.Pool(workers) if workers > 1 else None
+        # Seconds a search through the pool takes on top of the search itself, kept up to date as the bot thinks
+        self.pool_overhead = pool_round_trip(self.pool, workers) if self.pool else None
+
+    def close(self):
+        if self.pool:
+            self.pool.terminate()
+            self.pool = None
+
+    # Picks (use_hold, placement) for the engine's current piece
+    # The pool is only used while its round trip fits in the time left after the first layer, otherwise it's slower
+    def think(self, engine):
+        deadline = time.monotonic() + self.think_time / 1000
+        start_piece = engine.current_piece
+        pieces = [start_piece.piece_name] + [PIECE_NAMES[piece_id] for piece_id in itertools.islice(engine.next_pieces, self.preview)]
+        held = PIECE_NAMES[engine.held_piece] if engine.held_piece else None
+
+        candidates = root_candidates(engine.board, pieces, held, start_piece)
+        allowed = [i for i, (use_hold, *_) in enumerate(candidates) if engine.can_hold or not use_hold]
+        if not allowed:
+            return None
+
+        garbage_queued = engine.board.garbage_queued
+        board = engine.board.copy()
+        board.garbage_queued = 0
+        roots = root_layer(board, candidates, allowed, self.weights, garbage_queued, deadline)
+
+        if self.pool and self.pool_overhead < deadline - time.monotonic():
+            worker_deadline = deadline - self.pool_overhead
+            tasks = [(pack_roots(roots[i::self.workers]), board.attack_rules, pieces, self.weights, self.beam_width,
+                      worker_deadline, garbage_queued) for i in range(min(self.workers, len(roots)))]
+            results = [result for result in self.pool.starmap(search_packed_roots, tasks) if result]
+            self.pool_overhead = (self.pool_overhead + time.monotonic() - worker_deadline) / 2
+        else:
+            result = beam_search(roots, pieces, self.weights, self.beam_width, deadline, garbage_queued)
+            results = [result] if result else []
+
+        use_hold, placement, *_ = candidates[max(results)[1] if results else allowed[0]]
+        return use_hold, placement
+
+    # The inputs that play a decision, SOFT_DROP has to be held until the piece lands
+    def plan(self, engine):
+        decision = self.think(engine)
+        if decision is None:
+            return [HARD_DROP]
+        use_hold, placement = decision
+        return ([HOLD] if use_hold else []) + list(placement.inputs)
+
+# Feeds a bot's plan to an engine a few inputs at a time, the same way a player's keys reach it
+class BotController:
+    def __init__(self, bot, inputs_per_step=1, input_delay=0):
+        self.bot = bot
+        self.inputs_per_step = inputs_per_step
+        self.input_delay = input_delay  # Engine milliseconds between batches of inputs, 0 for as fast as it's asked
+        self.next_input_time = 0
+        self.plan = []
+        self.soft_dropping = False
+        self.piece_count = -1
+
+    def next_inputs(self, engine):
+        if engine.game_over or not engine.current_piece or engine.time < self.next_input_time:
+            return []
+        self.next_input_time = engine.time + self.input_delay
+
+        # A new piece, or the current one locked on its own, needs a new plan
+        if engine.pieces_placed != self.piece_count:
+            self.piece_count = engine.pieces_placed
+            self.plan = self.bot.plan(engine)
+            self.soft_dropping = False
+
+        if self.soft_dropping:
+            if not engine.board.check_collision(engine.current_piece, 0, 1):
+                return []
+            self.soft_dropping = False
+            return [(SOFT_DROP, False)]
+
+        inputs = []
+        while self.plan and len(inputs) < self.inputs_per_step * 2:
+            action = self.plan.pop(0)
+            if action == SOFT_DROP:
+                inputs.append((SOFT_DROP, True))
+                self.soft_dropping = True
+                break
+            inputs.extend([(action, True), (action, False)])
+            if action == HARD_DROP:
+                break
+        return inputs
+
+# Plays a headless game as fast as the bot can think and reports the results
+def benchmark(seed, pieces, bot, attack_rules=DEFAULT_RULES):
+    engine = Engine(seed, attack_rules=attack_rules)
+    controller = BotController(bot, inputs_per_step=BOARD_HEIGHT)
+    frame = 1000 / FPS
+    attack = 0
+
+    start = time.perf_counter()
+    while not engine.game_over and engine.pieces_placed < pieces:
+        inputs = controller.next_inputs(engine)
+        # Time only passes while soft dropping, every other input lands within the same instant
+        engine.step(inputs, frame if controller.soft_dropping else 0)
+        attack += engine.pop_attack()
+    elapsed = time.perf_counter() - start
+
+    return {
+        'pieces': engine.pieces_placed,
+        'lines': engine.lines_cleared,
+        'attack': attack,
+        'attack_per_piece': attack / max(1, engine.pieces_placed),
+        'pieces_per_second': engine.pieces_placed / elapsed,
+        'game_over': engine.game_over
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the bot headless and report how it played")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--pieces', type=int, default=500)
+    parser.add_argument('--think-time', type=float, help=f"milliseconds per piece, {THINK_TIME} or {POOL_THINK_TIME} with --workers")
+    parser.add_argument('--beam-width', type=int, default=6)
+    parser.add_argument('--workers', type=int, default=0,
+                        help="processes to split each search across, the pool's round trip is a few ms so this only helps at think times well above that")
+    parser.add_argument('--rules', default='jstris', help=f"attack rules, one of {', '.join(RULE_SETS)} or a JSON rule set file")
+    args = parser.parse_args()
+
+    bot = Bot(beam_width=args.beam_width, think_time=args.think_time, workers=args.workers)
+    try:
+        for key, value in benchmark(args.seed, args.pieces, bot, load_rules(args.rules)).items():
+            print(f"{key}: {value}")
+    finally:
+        bot.close()
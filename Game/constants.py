@@ -1,7 +1,11 @@
 import numpy as np
-import pygame
 
-FPS = 60
+FPS = 60  # Gravity is given in cells per frame at this rate
+
+# The game logic runs in fixed steps at LOGIC_RATE, drawing happens separately at RENDER_FPS (0 for uncapped)
+LOGIC_RATE = 1000
+LOGIC_STEP = 1000 / LOGIC_RATE
+RENDER_FPS = 60
 
 # Colors
 BLACK = (0, 0, 0)
@@ -32,6 +36,15 @@ PREVIEW_PIECE_HEIGHT = 80
 GARBAGE_QUEUE_WIDTH = 10
 GARBAGE_QUEUE_OFFSET = 10
 
+# Engine inputs, passed to Engine.step as (action, pressed) pairs
+MOVE_LEFT = 0
+MOVE_RIGHT = 1
+SOFT_DROP = 2
+HARD_DROP = 3
+ROTATE_CW = 4
+ROTATE_CCW = 5
+HOLD = 6
+
 # Pieces in starting position
 PIECES = {
     'I': (np.array([[0, 0, 0, 0],
@@ -57,6 +70,24 @@ PIECES = {
                     [0, 0, 0]]), ORANGE)
 }
 
+# Board cells hold piece ids, colors are only looked up from the palette when drawing
+EMPTY = 0
+PIECE_IDS = {name: i + 1 for i, name in enumerate(PIECES)}
+PIECE_NAMES = [None] + list(PIECES)
+GARBAGE_ID = len(PIECES) + 1
+PALETTE = [None] + [color for _, color in PIECES.values()] + [GRAY]
+
+# Chance that each garbage row's hole moves to another column, 0 keeps every hole in one column
+# 0.9 is the same as picking every hole uniformly at random
+GARBAGE_MESSINESS = 0.9
+
+# Row bitmasks, column x is stored in bit x + WALL_WIDTH
+# The wall bits on both sides are always set so pieces collide with them like with any other cell
+WALL_WIDTH = 4
+ROW_BITS = BOARD_WIDTH + 2 * WALL_WIDTH
+FULL_ROW = (1 << ROW_BITS) - 1
+EMPTY_ROW = FULL_ROW ^ (((1 << BOARD_WIDTH) - 1) << WALL_WIDTH)
+
 # SRS Wall Kicks
 # Determines what order tests are done for spins
 WALL_KICK_DATA = {
@@ -80,4 +111,46 @@ WALL_KICK_DATA = {
         [(0, 0), (1, 0), (-2, 0), (1, -2), (-2, 1)],    # 3>>0
         [(0, 0), (-1, 0), (2, 0), (-1, 2), (2, -1)]     # 0>>3
     ]
-}
\ No newline at end of file
+}
+
+# Everything a piece needs in one rotation state, computed once so rotating and moving are table lookups
+class RotationState:
+    def __init__(self, shape):
+        self.shape = shape
+        ys, xs = np.nonzero(shape)
+        self.minos = tuple((int(x), int(y)) for y, x in zip(ys, xs))
+
+        # One bitmask per non-empty row of the shape, shifted by the piece x when checking the board rows
+        masks = {}
+        for x, y in self.minos:
+            masks[y] = masks.get(y, 0) | (1 << x)
+        self.row_masks = tuple(sorted(masks.items()))
+
+        # Lowest mino of every column the shape covers, compared against the board's column heights when dropping
+        bottoms = {}
+        for x, y in self.minos:
+            bottoms[x] = max(bottoms.get(x, 0), y)
+        self.bottom_profile = tuple(sorted(bottoms.items()))
+
+        # Bounding box of the minos inside the shape, inclusive
+        self.min_x, self.max_x = int(xs.min()), int(xs.max())
+        self.min_y, self.max_y = int(ys.min()), int(ys.max())
+
+ROTATION_STATES = {
+    name: [RotationState(np.rot90(shape, -rotation)) for rotation in range(4)]
+    for name, (shape, _) in PIECES.items()
+}
+
+# Kick tests resolved per piece, starting state and direction: ROTATION_KICKS[name][state][clockwise]
+# The y offsets are already flipped to board coordinates where +Y goes down
+def resolve_kicks(name, state, clockwise):
+    if name == 'O':
+        return ((0, 0),)
+    kick_type = 'I' if name == 'I' else 'JLSTZ'
+    test_index = 2 * state if clockwise else 2 * ((state - 1) % 4) + 1
+    return tuple((kick_x, -kick_y) for kick_x, kick_y in WALL_KICK_DATA[kick_type][test_index])
+
+ROTATION_KICKS = {
+    name: [[resolve_kicks(name, state, clockwise) for clockwise in (False, True)] for state in range(4)]
+    for name in PIECES
+}
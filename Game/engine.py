@@ -0,0 +1,245 @@
+import collections
+import struct
+from board import Board, BOARD_SNAPSHOT_SIZE
+from attack import DEFAULT_RULES
+from rng import SplitMix64, MASK_64
+from tetromino import Tetromino
+from constants import *
+
+# Snapshots are these fields followed by the board's snapshot, always the same size
+# The next queue is packed two piece ids to a byte, it never holds more than two bags
+QUEUE_SIZE = 2 * len(PIECES)
+ENGINE_STATE = struct.Struct(f'<QQQ10d b???BBbbB IIH B{QUEUE_SIZE // 2}s')
+SNAPSHOT_SIZE = ENGINE_STATE.size + BOARD_SNAPSHOT_SIZE
+
+# Endless 7-bag randomizer, each bag is every piece id once in a shuffled order
+# Bags are only drawn when the queue runs low and always whole, so the generator's state is all in the SplitMix64
+def seven_bag(generator):
+    while True:
+        bag = list(range(1, len(PIECES) + 1))
+        generator.shuffle(bag)
+        yield bag
+
+# Rules of a single game without any display or wall clock
+# Time only moves forward through step(), so the engine runs as fast as the caller drives it
+class Engine:
+    def __init__(self, seed, messiness=GARBAGE_MESSINESS, attack_rules=DEFAULT_RULES):
+        self.messiness = messiness
+        self.attack_rules = attack_rules
+        self.reset(seed)
+
+    # Starts a new game, reseeding it when a seed is given and otherwise carrying on with the same piece order
+    def reset(self, seed=None):
+        if seed is not None:
+            self.seed = seed
+            self.piece_generator = SplitMix64(seed)
+            self.garbage_seeds = SplitMix64(~seed)  # Every game after a reset gets its own garbage stream
+            self.bags = seven_bag(self.piece_generator)
+
+        self.board = Board(self.garbage_seeds.next(), self.messiness, self.attack_rules)
+        self.piece = Tetromino('I')  # The one piece object, current_piece is either this or None
+        self.current_piece = None
+        self.next_pieces = collections.deque(maxlen=QUEUE_SIZE)  # Piece ids
+        self.held_piece = None  # Piece id
+        self.can_hold = True
+
+        self.game_over = False
+        self.lines_cleared = 0
+        self.pieces_placed = 0
+        self.pending_attack = 0  # Lines sent by clears that haven't been picked up with pop_attack yet
+
+        self.time = 0  # Simulated milliseconds
+        self.gravity = .02  # Cells per frame at FPS
+        self.gravity_count = 0
+        self.lock_delay = 500
+        self.lock_time = 0  # Last time the piece fell, lock delay counts from here
+
+        # Handling
+        self.sdf = 1000
+        self.das = 125
+        self.arr = 0
+        self.is_soft_dropping = False
+        self.next_repeat_time = 0  # When the held direction moves the piece next
+        self.moving_direction = 0
+
+        self.fill_next_queue()
+
+    # Packs the whole game into SNAPSHOT_SIZE bytes, restore puts it back exactly
+    def snapshot(self):
+        piece = self.current_piece
+        queue = list(self.next_pieces) + [0] * (QUEUE_SIZE - len(self.next_pieces))
+        return ENGINE_STATE.pack(
+            self.seed & MASK_64, self.piece_generator.state, self.garbage_seeds.state,
+            self.time, self.gravity, self.gravity_count, self.lock_delay, self.lock_time,
+            self.sdf, self.das, self.arr, self.next_repeat_time, self.messiness,
+            self.moving_direction, self.is_soft_dropping, self.can_hold, self.game_over,
+            piece.piece_id if piece else 0, piece.rotation_state if piece else 0,
+            piece.x if piece else 0, piece.y if piece else 0,
+            self.held_piece or 0,
+            self.lines_cleared, self.pieces_placed, self.pending_attack,
+            len(self.next_pieces), bytes(queue[i] << 4 | queue[i + 1] for i in range(0, QUEUE_SIZE, 2))
+        ) + self.board.snapshot()
+
+    def restore(self, data):
+        (self.seed, self.piece_generator.state, self.garbage_seeds.state,
+         self.time, self.gravity, self.gravity_count, self.lock_delay, self.lock_time,
+         self.sdf, self.das, self.arr, self.next_repeat_time, self.messiness,
+         self.moving_direction, self.is_soft_dropping, self.can_hold, self.game_over,
+         piece_id, rotation, x, y, held_id,
+         self.lines_cleared, self.pieces_placed, self.pending_attack,
+         queue_length, queue) = ENGINE_STATE.unpack_from(data)
+
+        self.current_piece = None
+        if piece_id:
+            self.current_piece = self.piece.reset(PIECE_NAMES[piece_id])
+            self.current_piece.set_rotation(rotation)
+            self.current_piece.x, self.current_piece.y = x, y
+        self.held_piece = held_id or None
+        ids = [half for byte in queue for half in (byte >> 4, byte & 0xF)]
+        self.next_pieces.clear()
+        self.next_pieces.extend(ids[:queue_length])
+        self.board.restore(data, ENGINE_STATE.size)
+
+    def fill_next_queue(self):
+        if len(self.next_pieces) <= 7:
+            self.next_pieces.extend(next(self.bags))
+        if not self.current_piece:
+            self.spawn_piece()
+
+    def spawn_piece(self):
+        if not self.current_piece:
+            self.current_piece = self.piece.reset(PIECE_NAMES[self.next_pieces.popleft()])
+            self.lock_time = self.time
+            self.fill_next_queue()
+
+        if self.board.check_collision(self.current_piece):
+            self.game_over = True
+            return False
+        return True
+
+    def hold_piece(self):
+        if self.can_hold:
+            held = self.held_piece
+            self.held_piece = self.current_piece.piece_id
+            if held:
+                self.current_piece.reset(PIECE_NAMES[held])
+                self.lock_time = self.time  # A fresh piece gets the whole lock delay, the way a spawned one does
+            else:
+                self.current_piece = None
+                self.spawn_piece()
+            self.can_hold = False
+            self.board.last_rotation = False
+
+    def lock_piece(self):
+        if self.current_piece:
+            self.board.add_to_board(self.current_piece)
+            clear_result = self.board.check_lines(self.current_piece)
+            if clear_result:
+                self.lines_cleared += clear_result['lines']
+                self.pending_attack += self.board.send_garbage(self.board.garbage_calc(clear_result))
+            self.pieces_placed += 1
+            self.board.last_rotation = False
+            self.current_piece = None
+            self.can_hold = True
+            self.spawn_piece()
+
+    def pop_attack(self):
+        attack = self.pending_attack
+        self.pending_attack = 0
+        return attack
+
+    def hard_drop(self):
+        if self.current_piece:
+            drop_distance = self.board.drop_distance(self.current_piece)
+            if drop_distance > 0:
+                self.current_piece.move(self.board, 0, drop_distance)
+            self.lock_piece()
+
+    def rotate(self, clockwise):
+        if self.current_piece and self.current_piece.rotate(self.board, clockwise):
+            # Last rotation isn't true if the piece can fall more because of the way t-spins are calculated
+            if self.board.check_collision(self.current_piece, 0, 1):
+                self.board.last_rotation = True
+            else:
+                self.board.last_rotation = False
+
+    def shift(self, direction):
+        self.moving_direction = direction
+        self.next_repeat_time = self.time + self.das
+        if self.current_piece:
+            self.current_piece.move(self.board, direction, 0)
+
+    def handle_input(self, action, pressed):
+        if not pressed:
+            if action == MOVE_LEFT and self.moving_direction == -1:
+                self.moving_direction = 0
+            elif action == MOVE_RIGHT and self.moving_direction == 1:
+                self.moving_direction = 0
+            elif action == SOFT_DROP:
+                self.is_soft_dropping = False
+        elif action == MOVE_LEFT:
+            self.shift(-1)
+        elif action == MOVE_RIGHT:
+            self.shift(1)
+        elif action == SOFT_DROP:
+            self.is_soft_dropping = True
+        elif action == HARD_DROP:
+            self.hard_drop()
+        elif action == ROTATE_CW:
+            self.rotate(True)
+        elif action == ROTATE_CCW:
+            self.rotate(False)
+        elif action == HOLD:
+            self.hold_piece()
+
+    def handle_das(self):
+        if self.moving_direction != 0 and self.current_piece:
+            # Every repeat that came due since the last step is played, so handling doesn't depend on the step size
+            while self.time >= self.next_repeat_time:
+                if self.arr == 0:
+                    # No repeat delay, the piece goes straight to the wall and stays there
+                    while self.current_piece.move(self.board, self.moving_direction, 0):
+                        pass
+                    break
+                self.current_piece.move(self.board, self.moving_direction, 0)
+                self.next_repeat_time += self.arr
+
+    def handle_gravity(self, dt):
+        if self.current_piece:
+            current_gravity = self.gravity * (self.sdf if self.is_soft_dropping else 1)
+
+            self.gravity_count += current_gravity * dt * FPS / 1000
+            cells_to_drop = int(self.gravity_count)
+
+            if cells_to_drop > 0:
+                self.gravity_count -= cells_to_drop
+
+                # Try to drop the piece by the calculated amount
+                actual_drop = min(cells_to_drop, self.board.drop_distance(self.current_piece))
+                if actual_drop > 0:
+                    self.current_piece.move(self.board, 0, actual_drop)
+                    self.lock_time = self.time
+
+            # Checked every step rather than only when gravity pulls, so the piece locks right when the delay runs out
+            if self.time - self.lock_time >= self.lock_delay and self.board.check_collision(self.current_piece, 0, 1):
+                self.lock_piece()
+
+    # Applies a batch of (action, pressed) inputs, then advances the simulation by dt milliseconds
+    def step(self, inputs, dt):
+        if self.game_over:
+            return
+
+        for action, pressed in inputs:
+            self.handle_input(action, pressed)
+            if self.game_over:
+                return
+
+        self.time += dt
+        self.handle_das()
+        self.handle_gravity(dt)
+
+    # Runs fixed LOGIC_STEP steps until the simulation catches up with the given time
+    # Handling and lock delay then resolve to the step size no matter how often the caller gets to run
+    def advance(self, until):
+        while self.time + LOGIC_STEP <= until and not self.game_over:
+            self.step((), LOGIC_STEP)
@@ -0,0 +1,154 @@
+import argparse
+import time
+import numpy as np
+from bot import DEFAULT_WEIGHTS, DANGER_HEIGHT
+from constants import *
+
+# Board features for many boards at once, every one of them computed with numpy operations over the whole batch
+# Boards come in as grids stacked like Board.grid, (n, BOARD_HEIGHT, BOARD_WIDTH) of piece ids,
+# or as the compact row masks of Board.rows, (n, BOARD_HEIGHT) integers with a bit per cell and the walls set
+
+# Rows are worked on as 12 bit masks, bit 0 the left wall, bit x + 1 column x and bit BOARD_WIDTH + 1 the right wall
+CELLS = ((1 << BOARD_WIDTH) - 1) << 1
+WALLS = 1 | 1 << (BOARD_WIDTH + 1)
+COLUMN_SHIFTS = np.arange(BOARD_WIDTH) + 1
+ROW_EDGES = (1 << (BOARD_WIDTH + 1)) - 1  # Bit x of row ^ row >> 1 is the pair of cells x - 1 and x
+
+# Multiplying eight 0 or 1 bytes by this gathers them into the top byte, the first byte as its lowest bit
+GATHER_BYTES = np.uint64(0x0102040810204080)
+
+# The batch as (rows, n) walled row masks, and how many rows were left off the top
+# Rows come first so every step down the board works on one contiguous row of the whole batch at a time,
+# and rows above the tallest stack in the batch are empty on every board, so they're cut off first
+def row_masks(boards):
+    boards = np.asarray(boards)
+    if boards.ndim == 2:
+        used = np.bitwise_or.reduce(boards, axis=0) != EMPTY_ROW
+        top = int(np.argmax(used)) if used.any() else BOARD_HEIGHT
+        masks = (boards[:, top:].T >> (WALL_WIDTH - 1)).astype(np.uint16) & (CELLS | WALLS)
+        return np.ascontiguousarray(masks), top
+
+    used = np.bitwise_or.reduce(boards, axis=0).any(axis=1)
+    top = int(np.argmax(used)) if used.any() else BOARD_HEIGHT
+    filled = (boards[:, top:] != EMPTY).view(np.uint8)
+    masks = ((filled[:, :, :8].view(np.uint64)[:, :, 0] * GATHER_BYTES) >> np.uint64(56)).astype(np.uint16)
+    for x in range(8, BOARD_WIDTH):
+        masks |= filled[:, :, x].astype(np.uint16) << x
+    return np.ascontiguousarray(masks.T) << 1 | WALLS, top
+
+def pack_boards(boards):
+    return np.array([board.rows for board in boards], dtype=np.uint32)
+
+# Every feature for every board, as arrays with the batch first:
+# heights (n, BOARD_WIDTH) column heights, height their sum and max_height the tallest,
+# holes empty cells with a filled cell above them and covered the filled cells above holes,
+# bumpiness the height differences between neighbouring columns,
+# row_transitions and column_transitions the filled to empty changes along rows (walls filled, empty rows skipped)
+# and down columns (floor filled), well_depths (n, BOARD_WIDTH) how far each column is below both neighbours,
+# well_depth the deepest and wells the sum of 1 + 2 + ... + depth over every well,
+# t_slots the places a T facing down fits with three corners blocked and clears a line,
+# and danger_distance the rows left before the tallest column plus the queued garbage reaches DANGER_HEIGHT
+def extract(boards, garbage_queued=0):
+    masks, top = row_masks(boards)
+    cells = masks & CELLS
+    rows, n = cells.shape
+
+    stacked = np.bitwise_or.accumulate(cells, axis=0)  # Cells at or below the top filled cell of their column
+    hole_cells = stacked & ~cells
+    above_holes = np.bitwise_or.accumulate(hole_cells[::-1], axis=0)[::-1]
+    row_counts = np.bitwise_count(cells)
+    heights = column_heights(stacked)
+
+    row_transitions = (np.bitwise_count((masks ^ masks >> 1) & ROW_EDGES).sum(axis=0, dtype=np.int64)
+                       - 2 * (row_counts == 0).sum(axis=0))
+    column_transitions = ((np.bitwise_count(cells[0]) + np.bitwise_count(~cells[-1] & CELLS)).astype(np.int64)
+                          + np.bitwise_count(cells[1:] ^ cells[:-1]).sum(axis=0, dtype=np.int64)
+                          if rows else np.full(n, BOARD_WIDTH))
+
+    walls = np.pad(heights, ((0, 0), (1, 1)), constant_values=BOARD_HEIGHT)
+    well_depths = np.maximum(0, np.minimum(walls[:, :-2], walls[:, 2:]) - heights)
+    max_height = heights.max(axis=1)
+
+    return {
+        'heights': heights,
+        'height': heights.sum(axis=1),
+        'max_height': max_height,
+        'holes': np.bitwise_count(hole_cells).sum(axis=0, dtype=np.int64),
+        'covered': np.bitwise_count(cells & above_holes).sum(axis=0, dtype=np.int64),
+        'bumpiness': np.abs(np.diff(heights, axis=1)).sum(axis=1),
+        'row_transitions': row_transitions,
+        'column_transitions': column_transitions,
+        'well_depths': well_depths,
+        'well_depth': well_depths.max(axis=1),
+        'wells': (well_depths * (well_depths + 1) // 2).sum(axis=1),
+        't_slots': t_slots(masks, row_counts),
+        'danger_distance': DANGER_HEIGHT - max_height - np.asarray(garbage_queued)
+    }
+
+# Column heights from the stacked masks, built a bit of the height at a time so no work is done per cell
+# A column's top is in the one row where its bit first turns up, and that row's height is rows - y
+def column_heights(stacked):
+    rows, n = stacked.shape
+    tops = stacked.copy()
+    tops[1:] ^= stacked[:-1]
+    row_heights = rows - np.arange(rows)
+    heights = np.zeros((BOARD_WIDTH, n), dtype=np.int64)
+    for bit in range(rows.bit_length()):
+        columns = np.bitwise_or.reduce(tops[row_heights >> bit & 1 == 1], axis=0)
+        heights |= (columns >> COLUMN_SHIFTS[:, None] & 1).astype(np.int64) << bit
+    return heights.T
+
+# A T facing down with its flat side in row r1 and its point in r2, and the corners of its box in r0 and r2
+# Counted where all four of its cells are empty, at least three corners are blocked (walls and floor count)
+# and locking it would clear r1 or r2, so a T-spin single or double slot, whether or not a T can get there
+# Every column is checked at once with shifted row masks, bit x of a result is the box starting in column x
+def t_slots(masks, row_counts):
+    padded = np.pad(masks, ((1, 1), (0, 0)), constant_values=(WALLS, CELLS | WALLS))  # Floor underneath
+    counts = np.pad(row_counts, ((1, 1), (0, 0)))
+    r0, r1, r2 = padded[:-2], padded[1:-1], padded[2:]
+
+    fits = ~r1 & ~r1 >> 1 & ~r1 >> 2 & ~r2 >> 1
+    near, far = r2, r2 >> 2
+    corners = r0 & r0 >> 2 & (near | far) | near & far & (r0 | r0 >> 2)
+    clears = (counts[1:-1] == BOARD_WIDTH - 3) | (counts[2:] == BOARD_WIDTH - 1)
+    return (np.bitwise_count(fits & corners & CELLS) * clears).sum(axis=0, dtype=np.int64)
+
+# The bot's board score for every board in the batch, the same as bot.evaluate without the attack
+def evaluate(features, weights=DEFAULT_WEIGHTS):
+    return (weights['height'] * features['height']
+            + weights['max_height'] * features['max_height']
+            + weights['holes'] * features['holes']
+            + weights['bumpiness'] * features['bumpiness']
+            + weights['well_depth'] * np.minimum(features['well_depth'], 4)
+            + weights['danger'] * np.maximum(0, -features['danger_distance']))
+
+# Grids from the first frames of a seeded bot game, one per frame with some garbage coming in, repeated up to count boards
+def game_grids(seed, count, frames=500):
+    from bot import Bot, BotController
+    from engine import Engine
+
+    engine = Engine(seed)
+    controller = BotController(Bot(beam_width=2, preview=1, think_time=10**6), inputs_per_step=BOARD_HEIGHT)
+    grids = []
+    while len(grids) < frames:
+        engine.step(controller.next_inputs(engine), 1000 / FPS)
+        if engine.game_over:
+            engine.reset()
+        grids.append(engine.board.grid.copy())
+        if len(grids) % 50 == 0:
+            engine.board.add_garbage_lines(2)
+    return np.stack(grids)[np.arange(count) % len(grids)]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time batch feature extraction on boards from a seeded bot game")
+    parser.add_argument('--boards', type=int, default=200000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    grids = game_grids(args.seed, args.boards)
+    rows = row_masks(grids)[0]
+    for name, boards in (('grids', grids), ('row masks', (rows.T << (WALL_WIDTH - 1)).astype(np.uint32) | EMPTY_ROW)):
+        start = time.perf_counter()
+        extract(boards)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<10}{args.boards / elapsed:>10.0f} boards per second")
@@ -1,209 +1,89 @@
+import argparse
 import pygame
 import sys
 import random
-from board import Board
-from tetromino import Tetromino
+from engine import Engine
+from render import Renderer
+from replay import ReplayRecorder
+from perf import PerfMonitor
 from constants import *
 
+KEY_BINDINGS = {
+    pygame.K_LEFT: MOVE_LEFT,
+    pygame.K_RIGHT: MOVE_RIGHT,
+    pygame.K_DOWN: SOFT_DROP,
+    pygame.K_SPACE: HARD_DROP,
+    pygame.K_UP: ROTATE_CW,
+    pygame.K_x: ROTATE_CW,
+    pygame.K_z: ROTATE_CCW,
+    pygame.K_c: HOLD
+}
+
+# Pygame front end, all of the rules live in the engine
 class Game:
-    def __init__(self, conn, seed):
+    # Every finished game is saved to replay_path when one is given, {seed} in it is filled in per game
+    def __init__(self, conn, seed, replay_path=None):
         pygame.init()
         
         self.conn = conn
         self.seed = seed
-        self.piece_generator = random.Random(seed)
+        self.engine = Engine(seed)
+        self.replay_path = replay_path
+        self.recorder = ReplayRecorder(seed, self.engine.messiness)
 
         # Display setup
         self.screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
         pygame.display.set_caption("Tetris")
 
-        # Create single ghost surface for all pieces
-        self.ghost_surface = pygame.Surface((BOARD_WIDTH * CELL_SIZE, BOARD_HEIGHT * CELL_SIZE), pygame.SRCALPHA)
-        
-        self.initialize_game_state()
-        
-        self.clock = pygame.time.Clock()
-        self.running = False
+        self.renderer = Renderer(self.screen)
+        self.perf = PerfMonitor(self)  # F3 shows frame timings
 
-    def initialize_game_state(self):
-        self.board = Board()
-        self.current_piece = None
-        self.next_pieces = []
-        self.held_piece = None
-        self.can_hold = True
-        
         self.paused = False
-        self.game_over = False
-        self.lines_cleared = 0
-        
-        self.gravity = .02
-        self.gravity_count = 0
-        self.last_drop_time = pygame.time.get_ticks()
-        self.lock_delay = 500
-        self.last_move_time = 0
-        self.lock_time = 0
-        
-        # Handling
-        self.sdf = 1000
-        self.das = 125
-        self.arr = 0
-        self.is_soft_dropping = False
-        self.last_key_down_time = 0
-        self.moving_direction = 0
-        self.reset_das = False
-        
-        self.fill_next_queue()
+        self.clock = pygame.time.Clock()
+        self.logic_time = 0  # Unpaused milliseconds played, the engine is caught up to this every update
+        self.next_render_time = 0
+        self.running = False
 
     def restart_game(self):
-        self.initialize_game_state()
-
-    def fill_next_queue(self):
-        if len(self.next_pieces) <= 7:
-            bag = list(map(lambda x: Tetromino(x), PIECES.keys()))
-            self.piece_generator.shuffle(bag)
-            self.next_pieces.extend(bag)
-        if not self.current_piece:
-            self.spawn_piece()
-
-    def spawn_piece(self):
-        if not self.current_piece:
-            self.current_piece = self.next_pieces.pop(0)
-            self.fill_next_queue()
-        
-        if self.board.check_collision(self.current_piece):
-            self.game_over = True
-            return False
-        return True
-    
-    def hold_piece(self):
-        if self.can_hold:
-            if self.held_piece:
-                temp = self.held_piece
-                self.held_piece = Tetromino(self.current_piece.piece_name)
-                self.current_piece = temp
-            else:
-                self.held_piece = self.current_piece
-                self.current_piece = None
-                self.held_piece = Tetromino(self.held_piece.piece_name)
-                self.spawn_piece()
-            self.can_hold = False
-    
-    def lock_piece(self):
-        if self.current_piece:
-            self.board.add_to_board(self.current_piece)
-            self.board.check_lines(self.current_piece)
-            self.current_piece = None
-            self.can_hold = True
-            self.spawn_piece()
-    
-    def hard_drop(self):
-        if self.current_piece:
-            drop_distance = 0
-            while not self.board.check_collision(self.current_piece, 0, drop_distance + 1):
-                drop_distance += 1
-            
-            if drop_distance > 0:
-                self.current_piece.move(self.board, 0, drop_distance)
-            self.lock_piece()
-    
-    def handle_das(self):
-        if self.moving_direction != 0:
-            current_time = pygame.time.get_ticks()
+        self.save_replay()
 
-            if self.reset_das:
-                self.last_key_down_time = current_time
-                self.reset_das = False
-
-            if current_time - self.last_key_down_time >= self.das:
-                if current_time - self.last_move_time >= self.arr:
-                    self.current_piece.move(self.board, self.moving_direction, 0)
-                    self.last_move_time = current_time
+        # Each game gets its own seed so its replay can be played back on its own
+        self.seed = (self.seed + 1) % 2**32
+        self.engine.reset(self.seed)
+        self.recorder = ReplayRecorder(self.seed, self.engine.messiness)
+        self.logic_time = 0
+        self.paused = False
 
-    def draw_preview_piece(self, piece, starting_x, starting_y, width, height):
-        piece.draw(self.screen, starting_x + ((width - len(piece.shape[0]) * CELL_SIZE) // 2), 
-                   starting_y + ((height - (3 if piece.piece_name == 'I' else 2) * CELL_SIZE) // 2), True)
+    def save_replay(self):
+        replay = self.recorder.finish(self.engine.time)
+        if self.replay_path:
+            replay.save(self.replay_path.format(seed=self.seed))
+        return replay
 
-    def draw_hold(self):
-        pygame.draw.rect(self.screen, BOARD_BORDER, (BOARD_OFFSET_X - SIDEBAR_OFFSET - SIDEBAR_WIDTH, BOARD_OFFSET_Y, SIDEBAR_WIDTH, PREVIEW_PIECE_HEIGHT), 1)
-        if self.held_piece:
-            self.draw_preview_piece(self.held_piece, BOARD_OFFSET_X - SIDEBAR_OFFSET - SIDEBAR_WIDTH, BOARD_OFFSET_Y, SIDEBAR_WIDTH, PREVIEW_PIECE_HEIGHT)
+    # Save states of the whole game, see Engine.snapshot
+    def snapshot(self):
+        return self.engine.snapshot()
 
-    def draw_next_queue(self):
-        pygame.draw.rect(self.screen, BOARD_BORDER, (BOARD_OFFSET_X + BOARD_WIDTH * CELL_SIZE + SIDEBAR_OFFSET, BOARD_OFFSET_Y, SIDEBAR_WIDTH, PREVIEW_PIECE_HEIGHT * 5), 1)
-        for i in range(5):
-            self.draw_preview_piece(self.next_pieces[i], BOARD_OFFSET_X + (BOARD_WIDTH * CELL_SIZE + 1) + SIDEBAR_OFFSET,
-                                     BOARD_OFFSET_Y + PREVIEW_PIECE_HEIGHT * i, SIDEBAR_WIDTH, PREVIEW_PIECE_HEIGHT)
+    def restore(self, data):
+        self.engine.restore(data)
+        self.logic_time = self.engine.time
 
-    def draw_garbage_queue(self):
-        pygame.draw.rect(self.screen, RED, (BOARD_OFFSET_X - GARBAGE_QUEUE_OFFSET - GARBAGE_QUEUE_WIDTH, BOARD_OFFSET_Y + GRID_HEIGHT * CELL_SIZE - self.board.garbage_queued * CELL_SIZE, 
-                         GARBAGE_QUEUE_WIDTH, self.board.garbage_queued * CELL_SIZE))
-        pygame.draw.rect(self.screen, BOARD_BORDER, (BOARD_OFFSET_X - GARBAGE_QUEUE_OFFSET - GARBAGE_QUEUE_WIDTH, BOARD_OFFSET_Y, GARBAGE_QUEUE_WIDTH, GRID_HEIGHT * CELL_SIZE), 1)
+    def receive_garbage(self, lines):
+        self.recorder.record_garbage(self.engine.time, lines)
+        self.engine.board.take_garbage(lines)
 
     def draw(self):
-        self.screen.fill(BLACK)
-        
-        self.board.draw(self.screen)
-        self.current_piece.draw(self.screen)
-        self.current_piece.draw_ghost(self.screen, self.ghost_surface, self.board)
-        self.draw_hold()
-        self.draw_next_queue()
-        self.draw_garbage_queue()
-    
-        pygame.display.flip()
+        self.renderer.draw(self.engine)
 
     def handle_ingame_events(self, events):
-        keys = pygame.key.get_pressed()
-        self.is_soft_dropping = keys[pygame.K_DOWN]
-        
+        inputs = []
         for event in events:
-            if event.type == pygame.KEYDOWN:
-                if not self.game_over:
-                    if not self.paused:
-                        if event.key == pygame.K_LEFT:
-                            if self.moving_direction == 1:
-                                self.reset_das = True
-                            self.moving_direction = -1
-                            self.last_key_down_time = pygame.time.get_ticks()
-                            if self.current_piece:
-                                self.current_piece.move(self.board, -1, 0)
-                        
-                        elif event.key == pygame.K_RIGHT:
-                            if self.moving_direction == -1:
-                                self.reset_das = True
-                            self.moving_direction = 1
-                            self.last_key_down_time = pygame.time.get_ticks()
-                            if self.current_piece:
-                                self.current_piece.move(self.board, 1, 0)
-                        
-                        elif event.key == pygame.K_UP or event.key == pygame.K_x:
-                            if self.current_piece:
-                                self.current_piece.rotate(self.board)
-                                # Last rotation isn't true if the piece can fall more because of the way t-spins are calculated
-                                if self.current_piece.get_ghost_position(self.board) == self.current_piece.y:
-                                    self.board.last_rotation = True
-                                else:
-                                    self.board.last_rotation = False
-                        
-                        elif event.key == pygame.K_z:
-                            if self.current_piece:
-                                self.current_piece.rotate(self.board, False)
-                                # Last rotation isn't true if the piece can fall more because of the way t-spins are calculated
-                                if self.current_piece.get_ghost_position(self.board) == self.current_piece.y:
-                                    self.board.last_rotation = True
-                                else:
-                                    self.board.last_rotation = False
-                        
-                        elif event.key == pygame.K_SPACE:
-                            self.hard_drop()
-                        
-                        elif event.key == pygame.K_c:
-                            self.hold_piece()
-            
-            elif event.type == pygame.KEYUP:
-                if event.key in [pygame.K_LEFT, pygame.K_RIGHT]:
-                    if (event.key == pygame.K_LEFT and self.moving_direction == -1) or \
-                       (event.key == pygame.K_RIGHT and self.moving_direction == 1):
-                        self.moving_direction = 0
+            if event.type == pygame.KEYDOWN and event.key in KEY_BINDINGS:
+                if not self.paused:
+                    inputs.append((KEY_BINDINGS[event.key], True))
+            elif event.type == pygame.KEYUP and event.key in KEY_BINDINGS:
+                inputs.append((KEY_BINDINGS[event.key], False))
+        return inputs
     
     # Separated from ingame events because they need to be done differently in multiplayer
     def handle_broad_events(self, events):
@@ -219,52 +99,49 @@ class Game:
     def handle_events(self):
         events = pygame.event.get()
         self.handle_broad_events(events)
-        self.handle_ingame_events(events)
-
-    def update(self):
-        self.clock.tick(FPS)
+        self.perf.handle_events(events)
+        return self.handle_ingame_events(events)
 
-        if not self.paused and not self.game_over:
-            current_time = pygame.time.get_ticks()
-            # Handle DAS movement
-            self.handle_das()
-            
-            if self.current_piece:
-                current_gravity = self.gravity * (self.sdf if self.is_soft_dropping else 1)
+    # Ticks once per drawn frame, engine.advance then catches the logic up in LOGIC_STEP steps
+    # Input is only polled this often, so key presses land on the frame they're read in,
+    # polling at LOGIC_RATE would time them to the millisecond but keeps a core busy doing it
+    def tick(self):
+        return self.clock.tick(RENDER_FPS or FPS)
 
-                self.gravity_count += current_gravity
-                cells_to_drop = int(self.gravity_count)
-                
-                if cells_to_drop > 0:
-                    self.gravity_count -= cells_to_drop
-                    
-                    # Try to drop the piece by the calculated amount
-                    actual_drop = 0
-                    for i in range(cells_to_drop):
-                        if not self.board.check_collision(self.current_piece, 0, 1):
-                            self.current_piece.move(self.board, 0, 1)
-                            actual_drop += 1
-                        else:
-                            break
-                    
-                    # If we couldn't drop at all, start lock delay
-                    if actual_drop == 0 and current_time - self.lock_time >= self.lock_delay:
-                        self.lock_piece()
-                    elif actual_drop > 0:
-                        self.lock_time = current_time
-                
-        self.handle_events()
-        self.draw()
+    def update(self):
+        dt = self.tick()
+        if not self.paused:
+            self.logic_time += dt
+        self.engine.advance(self.logic_time)
+
+        # Inputs are applied in the order they arrived, after every step that came before them
+        # Key releases still go through while paused so nothing is stuck down afterwards
+        inputs = self.handle_events()
+        self.recorder.record_inputs(self.engine.time, inputs)
+        self.engine.step(inputs, 0)
+        self.draw_if_due()
+
+    def draw_if_due(self):
+        now = pygame.time.get_ticks()
+        if now >= self.next_render_time:
+            if RENDER_FPS:
+                self.next_render_time = max(self.next_render_time + 1000 / RENDER_FPS, now)
+            self.draw()
 
     def run(self):
         self.running = True
         while self.running:
             self.update()
         
+        self.save_replay()
         pygame.quit()
         sys.exit()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--replay', help="save each game's replay here, {seed} is replaced with the game's seed")
+    args = parser.parse_args()
+
     seed = random.randint(0, 2**32 - 1)
-    game = Game(None, seed)
+    game = Game(None, seed, args.replay)
     game.run()
\ No newline at end of file
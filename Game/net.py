@@ -0,0 +1,238 @@
+import asyncio
+import collections
+import struct
+import threading
+import time
+
+DEFAULT_PORT = 7777
+PING_INTERVAL = 0.5  # Seconds between latency probes
+CONNECT_TIMEOUT = 10
+
+class MultiplayerMessage:
+    QUIT = 1
+    RESTART = 2
+    GARBAGE = 3
+    HELLO = 4  # Sent by the host once a player joins, carries the match seed and whether it uses rollback
+    PING = 5
+    PONG = 6
+    INPUTS = 7  # One rollback frame of a player's inputs
+    SYNC = 8  # Checksum of the confirmed rollback state at a frame
+    PUBLISH = 9  # First message of a game streaming to a spectator server, carries its player number
+    SUBSCRIBE = 10  # First message of a spectator, carries the player to watch
+    DELTA = 11  # What changed on a player's screen since their last delta
+    KEYFRAME = 12  # A player's whole screen, for spectators joining or catching up
+
+    def __init__(self, type, data=None):
+        self.type = type
+        self.data = data
+
+    def __repr__(self):
+        return f"MultiplayerMessage({self.type}, {self.data})"
+
+# Every frame is the payload length and message type, then the payload packed with the type's format
+# Messages with one field carry it as data, ones with more carry a tuple
+# Types in VARIABLE_LENGTH are followed by raw bytes, which come last in the tuple
+FRAME_HEADER = struct.Struct('<HB')
+MESSAGE_FORMATS = {
+    MultiplayerMessage.QUIT: struct.Struct('<'),
+    MultiplayerMessage.RESTART: struct.Struct('<'),
+    MultiplayerMessage.GARBAGE: struct.Struct('<I'),  # Lines sent, a rule set loaded from a file can send more than two bytes hold
+    MultiplayerMessage.HELLO: struct.Struct('<Q?'),
+    MultiplayerMessage.PING: struct.Struct('<d'),  # Sender's clock, echoed back in the PONG
+    MultiplayerMessage.PONG: struct.Struct('<d'),
+    MultiplayerMessage.INPUTS: struct.Struct('<BI'),  # Game number, frame, then the packed inputs
+    MultiplayerMessage.SYNC: struct.Struct('<BII'),  # Game number, frame, checksum
+    MultiplayerMessage.PUBLISH: struct.Struct('<B'),
+    MultiplayerMessage.SUBSCRIBE: struct.Struct('<B'),
+    MultiplayerMessage.DELTA: struct.Struct('<B'),  # Player, then the delta, see spectate.py
+    MultiplayerMessage.KEYFRAME: struct.Struct('<B')
+}
+VARIABLE_LENGTH = {MultiplayerMessage.INPUTS, MultiplayerMessage.DELTA, MultiplayerMessage.KEYFRAME}
+
+def encode(message):
+    if message.data is None:
+        fields = ()
+    elif isinstance(message.data, tuple):
+        fields = message.data
+    else:
+        fields = (message.data,)
+    if message.type in VARIABLE_LENGTH:
+        payload = MESSAGE_FORMATS[message.type].pack(*fields[:-1]) + fields[-1]
+    else:
+        payload = MESSAGE_FORMATS[message.type].pack(*fields)
+    return FRAME_HEADER.pack(len(payload), message.type) + payload
+
+def decode(type, payload):
+    message_format = MESSAGE_FORMATS[type]
+    if type in VARIABLE_LENGTH:
+        data = message_format.unpack_from(payload) + (payload[message_format.size:],)
+    else:
+        data = message_format.unpack(payload)
+    if len(data) == 0:
+        data = None
+    elif len(data) == 1:
+        data = data[0]
+    return MultiplayerMessage(type, data)
+
+class DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, connection):
+        self.connection = connection
+
+    def datagram_received(self, data, address):
+        self.connection.udp_peer = address
+        length, type = FRAME_HEADER.unpack_from(data)
+        self.connection.handle_message(decode(type, data[FRAME_HEADER.size:FRAME_HEADER.size + length]), address)
+
+# A connection to the other player, run by an asyncio loop on its own thread so the game loop never blocks on it
+# Messages go over TCP, and with udp also turned on, pings and unreliable messages go over UDP on the same port
+# The game sends with send() and drains everything that arrived since its last tick with poll()
+class Connection:
+    def __init__(self, udp=False):
+        self.udp_enabled = udp
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.incoming = collections.deque()
+        self.connected = threading.Event()
+        self.closed = False
+        self.writer = None
+        self.udp = None
+        self.udp_peer = None
+        self.server = None
+        self.rtt = None  # Smoothed round trip time in milliseconds, None until the first pong
+        self.thread.start()
+
+    @classmethod
+    def host(cls, host, port=DEFAULT_PORT, udp=False, timeout=None):
+        connection = cls(udp)
+        connection.run(connection.serve(host, port))
+        if not connection.connected.wait(timeout):
+            connection.close()
+            raise TimeoutError("No player joined")
+        return connection
+
+    @classmethod
+    def connect(cls, host, port=DEFAULT_PORT, udp=False, timeout=CONNECT_TIMEOUT):
+        connection = cls(udp)
+        connection.run(connection.open(host, port, timeout)).result()
+        return connection
+
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    async def serve(self, host, port):
+        if self.udp_enabled:
+            self.udp, _ = await self.loop.create_datagram_endpoint(lambda: DatagramProtocol(self), local_addr=(host, port))
+        self.server = await asyncio.start_server(self.accept, host, port)
+
+    async def accept(self, reader, writer):
+        # Only the first player is kept, the match is one on one
+        if self.writer:
+            writer.close()
+            return
+        self.server.close()
+        await self.start(reader, writer)
+
+    async def open(self, host, port, timeout):
+        # The host may still be starting up, so keep trying until the timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(host, port)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(.05)
+        if self.udp_enabled:
+            self.udp, _ = await self.loop.create_datagram_endpoint(lambda: DatagramProtocol(self), remote_addr=(host, port))
+            self.udp_peer = (host, port)
+        self.loop.create_task(self.start(reader, writer))
+
+    async def start(self, reader, writer):
+        self.writer = writer
+        self.connected.set()
+        pinger = self.loop.create_task(self.ping())
+        try:
+            while True:
+                length, type = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+                self.handle_message(decode(type, await reader.readexactly(length)))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            pinger.cancel()
+            writer.close()
+            self.closed = True
+
+    async def ping(self):
+        while True:
+            self.write(encode(MultiplayerMessage(MultiplayerMessage.PING, time.perf_counter())), False)
+            await asyncio.sleep(PING_INTERVAL)
+
+    # Runs on the loop's thread, pings are answered right away and never reach the game
+    def handle_message(self, message, address=None):
+        if message.type == MultiplayerMessage.PING:
+            self.write(encode(MultiplayerMessage(MultiplayerMessage.PONG, message.data)), address is None)
+        elif message.type == MultiplayerMessage.PONG:
+            sample = (time.perf_counter() - message.data) * 1000
+            self.rtt = sample if self.rtt is None else self.rtt * .875 + sample * .125
+        else:
+            self.incoming.append(message)
+
+    def write(self, data, reliable=True):
+        if not reliable and self.udp and self.udp_peer:
+            if self.udp.get_extra_info('peername'):
+                self.udp.sendto(data)
+            else:
+                self.udp.sendto(data, self.udp_peer)
+        elif self.writer and not self.writer.is_closing():
+            self.writer.write(data)
+
+    # Safe to call from the game's thread, unreliable messages use UDP when it's on and fall back to TCP otherwise
+    def send(self, message, reliable=True):
+        if not self.closed:
+            self.loop.call_soon_threadsafe(self.write, encode(message), reliable)
+
+    # Every message that arrived since the last poll, in order
+    def poll(self):
+        messages = []
+        while self.incoming:
+            messages.append(self.incoming.popleft())
+        return messages
+
+    # Blocks until a message of the given type arrives, messages before it are kept for poll
+    def wait_for(self, type, timeout=CONNECT_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and not self.closed:
+            for message in list(self.incoming):
+                if message.type == type:
+                    self.incoming.remove(message)
+                    return message
+            time.sleep(.01)
+        raise TimeoutError("Connection closed or timed out before the message arrived")
+
+    async def shutdown(self):
+        if self.server:
+            self.server.close()
+        if self.udp:
+            self.udp.close()
+        if self.writer:
+            # Lets anything still buffered, like a last QUIT, go out before the socket closes
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+        tasks = [task for task in asyncio.all_tasks(self.loop) if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def close(self):
+        if self.loop.is_running():
+            try:
+                self.run(self.shutdown()).result(1)
+            except TimeoutError:
+                pass
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+        self.closed = True
@@ -0,0 +1,419 @@
+import argparse
+import multiprocessing
+import time
+from engine import Engine
+from tetromino import Tetromino
+from placements import find_placements
+from bot import hold_options
+from constants import *
+
+# Tallest perfect clear searched for, in rows
+MAX_PC_HEIGHT = 6
+
+# The search packs the rows below the perfect clear line into one integer, BOARD_WIDTH bits a row with the bottom row lowest
+ROW_MASK = (1 << BOARD_WIDTH) - 1
+
+# Every cell but the first or last column of height packed rows, per height
+NOT_FIRST_COLUMN = [sum((ROW_MASK ^ 1) << (row * BOARD_WIDTH) for row in range(height)) for height in range(BOARD_HEIGHT + 1)]
+NOT_LAST_COLUMN = [sum((ROW_MASK >> 1) << (row * BOARD_WIDTH) for row in range(height)) for height in range(BOARD_HEIGHT + 1)]
+
+# Every cell of each column of height packed rows, per height
+COLUMNS = [[sum(1 << (row * BOARD_WIDTH + x) for row in range(height)) for x in range(BOARD_WIDTH)] for height in range(BOARD_HEIGHT + 1)]
+
+# Cells of a piece rotation at piece position x packed with its lowest mino in row 0
+def drop_mask(state, x):
+    return sum(1 << ((state.max_y - mino_y) * BOARD_WIDTH + x + mino_x) for mino_x, mino_y in state.minos)
+
+# Every distinct way each piece can drop: (rotation, x, packed cells, rows tall), rotations covering the same cells once
+DROPS = {}
+for name, states in ROTATION_STATES.items():
+    DROPS[name] = []
+    seen = set()
+    for rotation, state in enumerate(states):
+        for x in range(-state.min_x, BOARD_WIDTH - state.max_x):
+            mask = drop_mask(state, x)
+            if mask not in seen:
+                seen.add(mask)
+                DROPS[name].append((rotation, x, mask, state.max_y - state.min_y + 1))
+
+# Cells of every rotation at every x it fits at, packed like drop_mask
+ROTATION_MASKS = {name: [{x: drop_mask(state, x) for x in range(-state.min_x, BOARD_WIDTH - state.max_x)} for state in states]
+                  for name, states in ROTATION_STATES.items()}
+
+# Tuck placements by (rows, height, piece name), see tuck_placements
+TUCK_CACHE = {}
+TUCK_CACHE_SIZE = 65536
+
+# Piece by the shape of its cells moved to the corner, to tell which piece an empty area of four cells needs
+PIECE_SHAPES = {}
+for name, states in ROTATION_STATES.items():
+    for state in states:
+        PIECE_SHAPES[frozenset((x - state.min_x, state.max_y - y) for x, y in state.minos)] = name
+
+def pack_board(board, height):
+    field = 0
+    for row in range(height):
+        field |= (board.rows[BOARD_HEIGHT - 1 - row] >> WALL_WIDTH & ROW_MASK) << (row * BOARD_WIDTH)
+    return field
+
+# Removes full rows between bottom and top from the packed rows, returns the rows and the height left
+def clear_rows(field, height, bottom, top):
+    cleared = 0
+    for row in range(top - 1, bottom - 1, -1):
+        shift = row * BOARD_WIDTH
+        if field >> shift & ROW_MASK == ROW_MASK:
+            field = field & ((1 << shift) - 1) | field >> (shift + BOARD_WIDTH) << shift
+            cleared += 1
+    return field, height - cleared
+
+# Empty cells with a filled cell somewhere above them in the same column, only tucks and spins can fill these
+# The filled cells are smeared down the columns a row, then two, four and so on at a time
+def covered_mask(field, height):
+    above = field >> BOARD_WIDTH
+    shift = BOARD_WIDTH
+    while shift < height * BOARD_WIDTH:
+        above |= above >> shift
+        shift *= 2
+    return above & ~field
+
+def covered_cells(field, height):
+    return covered_mask(field, height).bit_count()
+
+# How uneven the filled cells per column are, placements that keep it flat are searched first
+def bumpiness(field, height):
+    counts = [(field & column).bit_count() for column in COLUMNS[height]]
+    return sum(abs(counts[x] - counts[x + 1]) for x in range(BOARD_WIDTH - 1))
+
+def region_shape(region):
+    cells = []
+    while region:
+        bit = region & -region
+        cells.append(divmod(bit.bit_length() - 1, BOARD_WIDTH))
+        region ^= bit
+    min_row = min(row for row, _ in cells)
+    min_x = min(x for _, x in cells)
+    return frozenset((x - min_x, row - min_row) for row, x in cells)
+
+# Parity pruning: pieces fill four cells each, so every separate empty area below the perfect clear line
+# has to be a multiple of four cells or it can never be filled exactly
+# An area of exactly four cells can only be filled by the one piece of its shape, so that piece has to be in names,
+# and an area with every cell covered is sealed off, no piece can get in there
+# covered is the field's covered_mask when the caller already has it
+def regions_fit(field, height, names=None, covered=None):
+    if covered is None:
+        covered = covered_mask(field, height)
+    empty = ~field & ((1 << (height * BOARD_WIDTH)) - 1)
+    open_cells = empty & ~covered
+    not_first, not_last = NOT_FIRST_COLUMN[height], NOT_LAST_COLUMN[height]
+    while empty:
+        # Flood fill from the lowest empty bit, growing the area by a cell in every direction until it stops
+        region = empty & -empty
+        while True:
+            grown = empty & (region | (region << 1 & not_first) | (region >> 1 & not_last)
+                             | region << BOARD_WIDTH | region >> BOARD_WIDTH)
+            if grown == region:
+                break
+            region = grown
+        size = region.bit_count()
+        if size % 4 or not region & open_cells:
+            return False
+        if size == 4 and names is not None and PIECE_SHAPES.get(region_shape(region)) not in names:
+            return False
+        empty ^= region
+    return True
+
+# Pieces still needed to fill everything below the perfect clear line, None when the cells don't work out
+def pieces_needed(field, height):
+    cells = height * BOARD_WIDTH - field.bit_count()
+    return cells // 4 if cells % 4 == 0 else None
+
+# Every pose a piece can be in up to height, as (rotation, x, row) with row the lowest mino's, and the moves between them
+# by index: the pose a row down (None on the floor), then left, right and the kicks of each rotation in the order they're tried,
+# cut off at the first one up in the open air above the line, which always fits and is never needed
+# Each pose's cells are packed like the field, so checking a move is one AND,
+# and covering lists the poses below the line that fill each cell
+TUCK_GRAPHS = {}
+
+def tuck_graph(name, height):
+    key = (name, height)
+    if key in TUCK_GRAPHS:
+        return TUCK_GRAPHS[key]
+
+    states = ROTATION_STATES[name]
+    masks = ROTATION_MASKS[name]
+    poses = [(rotation, x, row) for rotation in range(len(states)) for x in masks[rotation] for row in range(height + 1)]
+    index = {pose: i for i, pose in enumerate(poses)}
+    cells = [masks[rotation][x] << (row * BOARD_WIDTH) for rotation, x, row in poses]
+    down = [index.get((rotation, x, row - 1)) for rotation, x, row in poses]
+    # Moving left or right is a move with one pose to try, a rotation tries its kicks in order
+    moves = [[[index[side]] for side in ((rotation, x - 1, row), (rotation, x + 1, row)) if side in index]
+             for rotation, x, row in poses]
+    for (rotation, x, row), pose_moves in zip(poses, moves):
+        for turn in ((1, 3) if name != 'O' else ()):
+            new_rotation = (rotation + turn) % 4
+            # Kicks move the box, screen y down, so the packed row goes down by kick_y and by how much lower the new minos reach
+            shift = states[rotation].max_y - states[new_rotation].max_y
+            kicks = []
+            for kick_x, kick_y in ROTATION_KICKS[name][rotation][turn == 1]:
+                new_x, new_row = x + kick_x, row + shift - kick_y
+                if new_row >= height and new_x in masks[new_rotation]:
+                    break
+                if (new_rotation, new_x, new_row) in index:
+                    kicks.append(index[(new_rotation, new_x, new_row)])
+            if kicks:
+                pose_moves.append(kicks)
+
+    below_line = [(rotation, x, cells[i], row) if row + states[rotation].max_y - states[rotation].min_y < height else None
+                  for i, (rotation, x, row) in enumerate(poses)]
+    tops = [i for i, (_, _, row) in enumerate(poses) if row == height]
+    covering = [[i for i in range(len(poses)) if below_line[i] and cells[i] >> bit & 1] for bit in range(height * BOARD_WIDTH)]
+    TUCK_GRAPHS[key] = (cells, down, moves, below_line, tops, covering)
+    return TUCK_GRAPHS[key]
+
+# Every straight drop of a piece from above the line as (rotation, x, packed cells, row), row being the lowest mino's
+def drop_placements(field, height, name):
+    placements = []
+    for rotation, x, mask, rows in DROPS[name]:
+        # Down from the line until the row below collides
+        row = height - rows
+        if row < 0 or field & (mask << (row * BOARD_WIDTH)):
+            continue
+        while row > 0 and not field & (mask << ((row - 1) * BOARD_WIDTH)):
+            row -= 1
+        placements.append((rotation, x, mask << (row * BOARD_WIDTH), row))
+    return placements
+
+# Where a piece lands under an overhang: every placement below the line, packed like drop_placements,
+# found with a breadth first search over the piece's tuck_graph on the packed rows themselves
+# Like the engine's soft drop, a piece only ever goes down all the way, and everything starts straight down
+# from the open air above the line, the rows above the line are always empty
+# A placement that fills no covered cell has nothing above it, so it's a straight drop,
+# which leaves only the resting poses that fill a covered cell for the search to reach
+def tuck_placements(field, height, name):
+    key = (field, height, name)
+    cached = TUCK_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    cells, down, moves, below_line, tops, covering = tuck_graph(name, height)
+    # The resting poses that fill a covered cell, the search stops once it has reached all of them
+    covered = covered_mask(field, height)
+    tucks = set()
+    cells_left = covered
+    while cells_left:
+        bit = cells_left & -cells_left
+        cells_left ^= bit
+        for pose in covering[bit.bit_length() - 1]:
+            below = down[pose]
+            if not field & cells[pose] and (below is None or field & cells[below]):
+                tucks.add(pose)
+    if not tucks:
+        return drop_placements(field, height, name)
+
+    seen = bytearray(len(cells))
+    queue = []
+    for pose in tops:
+        below = down[pose]
+        while below is not None and not field & cells[below]:
+            pose, below = below, down[below]
+        if not seen[pose]:
+            seen[pose] = 1
+            queue.append(pose)
+
+    found = []
+    for pose in queue:
+        below = down[pose]
+        if below is None or field & cells[below]:
+            if pose in tucks:
+                found.append(below_line[pose])
+                tucks.discard(pose)
+                if not tucks:
+                    break
+        else:
+            landed = below
+            while down[landed] is not None and not field & cells[down[landed]]:
+                landed = down[landed]
+            if not seen[landed]:
+                seen[landed] = 1
+                queue.append(landed)
+        for tries in moves[pose]:
+            for target in tries:
+                if not field & cells[target]:
+                    if not seen[target]:
+                        seen[target] = 1
+                        queue.append(target)
+                    break
+
+    # Drops that would fill a covered cell only get there through the filled cells above it, what's reachable of them was found
+    placements = [placement for placement in drop_placements(field, height, name) if not placement[2] & covered]
+    cells_seen = {placement[2] for placement in placements}
+    for placement in found:
+        if placement[2] not in cells_seen:
+            cells_seen.add(placement[2])
+            placements.append(placement)
+
+    if len(TUCK_CACHE) >= TUCK_CACHE_SIZE:
+        TUCK_CACHE.clear()
+    TUCK_CACHE[key] = placements
+    return TUCK_CACHE[key]
+
+# Depth first search for placements that leave the board empty, with the rows below the perfect clear line packed in one integer
+# Positions already searched are kept in a transposition table of (rows, height, held, queue index) and skipped,
+# placements reaching above the perfect clear line and boards with empty areas that can't be filled are pruned
+# Only the cells a placement fills matter here, so while nothing is covered every placement is a straight drop,
+# and tuck_placements is only needed for tucks and spins once something overhangs
+# Without tucks nothing may ever be covered, which leaves far fewer positions to search
+# With split as (part, parts) only every parts-th first move from part on is searched, so several processes can share one search
+# Returns a list of (use_hold, piece, rotation, x, y) in the order they're played, or None
+def search(field, height, pieces, held, can_hold=True, tucks=True, deadline=None, split=None):
+    visited = set()
+    path = []
+
+    def children(field, height, held, index):
+        overhang = tucks and covered_cells(field, height) > 0
+        found = []
+        for name, held_after, next_index, use_hold in hold_options(pieces, held, index):
+            if use_hold and index == 0 and not can_hold:
+                continue
+            if overhang:
+                placements = tuck_placements(field, height, name)
+            else:
+                placements = drop_placements(field, height, name)
+
+            for rotation, x, cells, row in placements:
+                state = ROTATION_STATES[name][rotation]
+                move = (use_hold, name, rotation, x, BOARD_HEIGHT - 1 - row - state.max_y)
+                child, child_height = clear_rows(field | cells, height, row, row + state.max_y - state.min_y + 1)
+                if not child:
+                    return [(0, move, 0, 0, held_after, next_index)]
+                # Positions already searched or pruned are skipped before any of the checks are paid for again,
+                # and a pruned position goes in the table too since it can't lead anywhere either
+                key = (child, child_height, held_after, next_index)
+                if key in visited:
+                    continue
+
+                needed = pieces_needed(child, child_height)
+                if needed is None or needed > len(pieces) - next_index + (held_after is not None):
+                    visited.add(key)
+                    continue
+                covered = covered_mask(child, child_height)
+                if covered and not tucks:
+                    continue
+                # The pieces the next needed placements can use, holding with nothing held reaches one further
+                if held_after:
+                    names = set(pieces[next_index:next_index + needed]) | {held_after}
+                else:
+                    names = set(pieces[next_index:next_index + needed + 1])
+                if not regions_fit(child, child_height, names, covered):
+                    visited.add(key)
+                    continue
+                # Flattest and least covered first, those are the placements that lead to clears,
+                # a covered cell counting for half a step between columns since a tuck can still fill it
+                found.append((covered.bit_count() + 2 * bumpiness(child, child_height), move, child, child_height, held_after, next_index))
+        found.sort(key=lambda child: child[0])
+        return found
+
+    def dfs(field, height, held, index):
+        if deadline is not None and time.monotonic() > deadline:
+            return False
+        key = (field, height, held, index)
+        if key in visited or index >= len(pieces):
+            return False
+        visited.add(key)
+
+        for i, (_, move, child, child_height, held_after, next_index) in enumerate(children(field, height, held, index)):
+            if index == 0 and split and i % split[1] != split[0]:
+                continue
+            path.append(move)
+            if not child or dfs(child, child_height, held_after, next_index):
+                return True
+            path.pop()
+        return False
+
+    return path if dfs(field, height, held, 0) else None
+
+def search_task(args):
+    return search(*args)
+
+# The moves of a solution found again on the real board from where each piece starts, so they come with inputs to play
+# Returns (use_hold, placement) for every move, or None if one of them can't be reached from there
+def spawn_placements(board, solution, start_piece):
+    board = board.copy()
+    board.garbage_queued = 0  # Garbage would rise on placements that don't clear, a perfect clear is planned without it
+    played = []
+    for i, (use_hold, name, rotation, x, y) in enumerate(solution):
+        state = ROTATION_STATES[name][rotation]
+        cells = {(x + mino_x, y + mino_y) for mino_x, mino_y in state.minos}
+        piece = start_piece if i == 0 and start_piece and not use_hold else Tetromino(name)
+        for placement in find_placements(board, piece):
+            if {(placement.x + mino_x, placement.y + mino_y) for mino_x, mino_y in placement.state.minos} == cells:
+                break
+        else:
+            return None
+        placement.lock(board)
+        played.append((use_hold, placement))
+    return played
+
+# Finds a perfect clear for pieces[0] (played from start_piece's pose when it's given) and the pieces after it,
+# trying every height from the top of the stack up that the cells and max_pieces allow, lowest first
+# Each height is searched without tucks first, then again with them if that found nothing
+# With workers the first moves are split between that many processes and the first solution found wins,
+# one pool serves every pass and is only started once a pass needs it
+# Returns a list of (use_hold, placement) to play in order, or None
+def solve(board, pieces, held=None, max_pieces=10, start_piece=None, can_hold=True, workers=0, timeout=None):
+    deadline = time.monotonic() + timeout if timeout else None
+    available = min(max_pieces, len(pieces) + (held is not None))
+    stack = BOARD_HEIGHT - min(board.heights)
+    pool = None
+
+    try:
+        for height in range(max(1, stack), MAX_PC_HEIGHT + 1):
+            field = pack_board(board, height)
+            needed = pieces_needed(field, height)
+            if not needed or needed > available or not regions_fit(field, height):
+                continue
+
+            for tucks in (False, True):
+                if workers > 1:
+                    pool = pool or multiprocessing.Pool(workers)
+                    tasks = [(field, height, pieces, held, can_hold, tucks, deadline, (i, workers)) for i in range(workers)]
+                    for solution in pool.imap_unordered(search_task, tasks):
+                        if solution:
+                            return spawn_placements(board, solution, start_piece)
+                else:
+                    solution = search(field, height, pieces, held, can_hold, tucks, deadline)
+                    if solution:
+                        return spawn_placements(board, solution, start_piece)
+        return None
+    finally:
+        # Workers still searching the pass that was solved are stopped rather than waited for
+        if pool:
+            pool.terminate()
+
+# Perfect clear for the engine's current position, the current piece is played from where it is
+def solve_engine(engine, max_pieces=10, workers=0, timeout=None):
+    if not engine.current_piece:
+        return None
+    pieces = [engine.current_piece.piece_name] + [PIECE_NAMES[piece_id] for piece_id in engine.next_pieces]
+    held = PIECE_NAMES[engine.held_piece] if engine.held_piece else None
+    return solve(engine.board, pieces, held, max_pieces, engine.current_piece, engine.can_hold, workers, timeout)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search for a perfect clear from the opening of a seeded game")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--pieces', type=int, default=10, help="most pieces the perfect clear may use")
+    parser.add_argument('--workers', type=int, default=0, help="processes to split the search across")
+    parser.add_argument('--timeout', type=float, help="seconds to search before giving up")
+    args = parser.parse_args()
+
+    engine = Engine(args.seed)
+    start = time.perf_counter()
+    solution = solve_engine(engine, args.pieces, args.workers, args.timeout)
+    elapsed = time.perf_counter() - start
+
+    if solution is None:
+        print(f"No perfect clear found in {elapsed:.3f} s")
+    else:
+        for use_hold, placement in solution:
+            print(f"{'hold, ' if use_hold else ''}{placement.piece_name} at x={placement.x} y={placement.y} rotation={placement.rotation_state}")
+        print(f"Perfect clear in {len(solution)} pieces, found in {elapsed:.3f} s")
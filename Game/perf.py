@@ -0,0 +1,173 @@
+import collections
+import csv
+import json
+import time
+import pygame
+from engine import Engine
+from render import Renderer
+from constants import *
+
+TOGGLE_KEY = pygame.K_F3
+DUMP_KEY = pygame.K_F4
+
+# Frames shown in the overlay's averages and histogram
+HISTORY = 100
+
+# Frames and timed calls kept for dumping, the oldest are dropped past these
+MAX_FRAMES = 60 * 60 * 10
+MAX_SPANS = 200000
+
+# Frames that take this many times longer than the render rate allows count as dropped
+DROPPED_FRAME_FACTOR = 1.5
+
+HUD_RECT = pygame.Rect(10, 160, 210, 230)
+HUD_TEXT = (220, 220, 220)
+HUD_BAR = (90, 200, 90)
+
+# Phases in the order they're shown, update includes the time spent waiting for the next tick
+PHASES = ['update', 'wait', 'events', 'logic', 'render', 'board', 'piece', 'ghost']
+
+# Frame timing overlay, F3 turns it on and off and F4 dumps what it has recorded
+# While it's off nothing is wrapped at all, turning it on puts timing wrappers over the methods of each phase
+# and turning it off puts the originals back, so the hooks cost nothing in normal play
+class PerfMonitor:
+    def __init__(self, game):
+        self.game = game
+        self.enabled = False
+        self.patched = []
+        self.font = None
+
+        self.active = set()  # Phases being timed right now, so calls nested inside the same phase count once
+        self.totals = dict.fromkeys(PHASES, 0)
+        self.frames = collections.deque(maxlen=MAX_FRAMES)  # (frame time, phase times, dropped) in seconds
+        self.spans = collections.deque(maxlen=MAX_SPANS)  # (phase, start, duration) of every timed call
+        self.last_frame = None
+        self.dropped = 0
+        self.target = 1 / (RENDER_FPS or FPS)
+
+    # The methods each phase times, ones on a class are timed for every instance and the game's own only on this game
+    def targets(self):
+        return [
+            (self.game, 'update', 'update'),
+            (self.game, 'tick', 'wait'),
+            (self.game, 'handle_events', 'events'),
+            (Engine, 'advance', 'logic'),
+            (Engine, 'step', 'logic'),
+            (Renderer, 'draw', 'render'),
+            (Renderer, 'draw_board', 'board'),
+            (Renderer, 'draw_piece', 'piece'),
+            (Renderer, 'draw_ghost', 'ghost')
+        ]
+
+    def handle_events(self, events):
+        for event in events:
+            if event.type == pygame.KEYDOWN:
+                if event.key == TOGGLE_KEY:
+                    self.toggle()
+                elif event.key == DUMP_KEY and self.frames:
+                    self.dump(time.strftime('perf-%Y%m%d-%H%M%S'))
+
+    def toggle(self):
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+
+    def enable(self):
+        for owner, name, phase in self.targets():
+            original = owner.__dict__.get(name)
+            self.patched.append((owner, name, original))
+            setattr(owner, name, self.timed(getattr(owner, name), phase))
+        self.patched.append((self.game, 'draw', None))
+        self.game.draw = self.timed_frame(self.game.draw)
+        self.last_frame = None
+        self.enabled = True
+
+    def disable(self):
+        for owner, name, original in reversed(self.patched):
+            if original is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self.patched = []
+        self.enabled = False
+        self.game.renderer.invalidate()
+
+    def timed(self, function, phase):
+        active = self.active
+        totals = self.totals
+        spans = self.spans
+        def timed_call(*args, **kwargs):
+            if phase in active:
+                return function(*args, **kwargs)
+            active.add(phase)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                duration = time.perf_counter() - start
+                active.discard(phase)
+                totals[phase] += duration
+                spans.append((phase, start, duration))
+        return timed_call
+
+    # A frame ends every time the game draws, whatever was timed since the last one belongs to it
+    def timed_frame(self, draw):
+        def draw_frame():
+            draw()
+            self.end_frame()
+            self.draw_hud()
+        return draw_frame
+
+    def end_frame(self):
+        now = time.perf_counter()
+        if self.last_frame is not None:
+            frame_time = now - self.last_frame
+            dropped = frame_time > self.target * DROPPED_FRAME_FACTOR
+            self.dropped += dropped
+            self.frames.append((frame_time, [self.totals[phase] for phase in PHASES], dropped))
+        self.last_frame = now
+        for phase in PHASES:
+            self.totals[phase] = 0
+
+    def draw_hud(self):
+        screen = self.game.screen
+        if self.font is None:
+            self.font = pygame.font.Font(None, 20)
+        screen.blit(self.game.renderer.frame, HUD_RECT, HUD_RECT)
+
+        recent = list(self.frames)[-HISTORY:]
+        if recent:
+            count = len(recent)
+            frame_times = [frame[0] for frame in recent]
+            lines = [f"frame {sum(frame_times) / count * 1000:5.2f} ms  max {max(frame_times) * 1000:5.1f}"]
+            for i, phase in enumerate(PHASES):
+                lines.append(f"{phase:<8}{sum(frame[1][i] for frame in recent) / count * 1000:6.3f} ms")
+            lines.append(f"dropped {self.dropped}")
+            y = HUD_RECT.y
+            for line in lines:
+                screen.blit(self.font.render(line, True, HUD_TEXT), (HUD_RECT.x, y))
+                y += 16
+
+            # One bar per frame, the full height is two frames' worth of time
+            bottom = HUD_RECT.bottom
+            height = HUD_RECT.bottom - y - 4
+            for i, (frame_time, _, dropped) in enumerate(recent):
+                bar = min(height, int(frame_time / (self.target * 2) * height))
+                pygame.draw.line(screen, RED if dropped else HUD_BAR,
+                                 (HUD_RECT.x + i * 2, bottom - 1), (HUD_RECT.x + i * 2, bottom - 1 - bar))
+        pygame.display.update(HUD_RECT)
+
+    # Writes path.csv with a row per frame and path.json as a trace of every timed call, which chrome://tracing and Perfetto open
+    def dump(self, path):
+        with open(path + '.csv', 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['frame_ms'] + [phase + '_ms' for phase in PHASES] + ['dropped'])
+            for frame_time, phase_times, dropped in self.frames:
+                writer.writerow([f"{frame_time * 1000:.4f}"] + [f"{t * 1000:.4f}" for t in phase_times] + [int(dropped)])
+
+        events = [{'name': phase, 'ph': 'X', 'ts': start * 1e6, 'dur': duration * 1e6, 'pid': 0, 'tid': 0}
+                  for phase, start, duration in self.spans]
+        with open(path + '.json', 'w') as file:
+            json.dump({'traceEvents': events}, file)
+        print(f"Frame timings written to {path}.csv and {path}.json")
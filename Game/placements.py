@@ -0,0 +1,237 @@
+from tetromino import Tetromino
+from constants import *
+
+# Results are memoized per board, piece and starting pose since searches ask for the same boards again
+PLACEMENT_CACHE = {}
+PLACEMENT_CACHE_SIZE = 4096
+
+# The whole board packed into one integer, ROW_BITS per row, with filled rows padding the top and bottom
+# A piece's rows packed the same way then collide with a single AND no matter how many rows it covers
+FIELD_PADDING = 4
+PACKED_STATES = {
+    name: [sum(mask << (row * ROW_BITS) for row, mask in state.row_masks) for state in states]
+    for name, states in ROTATION_STATES.items()
+}
+
+def pack_rows(rows):
+    field = 0
+    for row in reversed([FULL_ROW] * FIELD_PADDING + rows + [FULL_ROW] * FIELD_PADDING):
+        field = (field << ROW_BITS) | row
+    return field
+
+EMPTY_FIELD = pack_rows([EMPTY_ROW] * BOARD_HEIGHT)
+
+# Open air layers by piece name and starting pose, see open_air_layer
+OPEN_AIR_LAYERS = {}
+
+# A final resting position of a piece and the shortest inputs that reach it from the starting pose
+# SOFT_DROP in the inputs means dropping all the way down before the next input
+# A piece is never stopped partway down to shift or spin from there, at the engine's soft drop factor that takes
+# releasing the key within a millisecond or two, so the few placements only reachable that way aren't found
+class Placement:
+    def __init__(self, piece_name, x, y, rotation_state, inputs, t_spin, kick_index=0):
+        self.piece_name = piece_name
+        self.x = x
+        self.y = y
+        self.rotation_state = rotation_state
+        self.state = ROTATION_STATES[piece_name][rotation_state]
+        self.inputs = inputs
+        self.t_spin = t_spin  # None, "T-SPIN" or "MINI T-SPIN", as Board.is_t_spin would report on lock
+        self.kick_index = kick_index  # Kick used by the final rotation when the placement is a spin
+
+    def piece(self):
+        piece = Tetromino(self.piece_name)
+        piece.set_rotation(self.rotation_state)
+        piece.x = self.x
+        piece.y = self.y
+        return piece
+
+    # Locks the placement on the board the way the engine would after playing its inputs
+    def lock(self, board):
+        piece = self.piece()
+        board.last_rotation = self.t_spin is not None
+        board.last_kick_index = self.kick_index
+        board.add_to_board(piece)
+        clear_result = board.check_lines(piece)
+        board.last_rotation = False
+        return clear_result
+
+    def __repr__(self):
+        return f"Placement({self.piece_name}, x={self.x}, y={self.y}, rotation={self.rotation_state}, t_spin={self.t_spin})"
+
+def classify_t_spin(board, piece, kick_index):
+    last_rotation, last_kick_index = board.last_rotation, board.last_kick_index
+    board.last_rotation, board.last_kick_index = True, kick_index
+    t_spin = board.is_t_spin(piece)
+    board.last_rotation, board.last_kick_index = last_rotation, last_kick_index
+    return t_spin
+
+def kick_offsets(name):
+    return [[tuple(kick_y * ROW_BITS + kick_x for kick_x, kick_y in kicks) for kicks in directions]
+            for directions in ROTATION_KICKS[name]]
+
+# Every pose a piece reaches from start on an empty board without dropping, grouped by the number of inputs to get there,
+# with the (parent, action) each was first reached from and every cell the search looked at on the way
+# Any board with all of those cells empty reaches exactly the same poses the same way, so find_placements can start
+# from them instead of walking the empty rows above the stack again; None if the layer touches the floor
+def open_air_layer(name, start):
+    key = (name, start)
+    if key in OPEN_AIR_LAYERS:
+        return OPEN_AIR_LAYERS[key]
+
+    packed_states = PACKED_STATES[name]
+    offsets = kick_offsets(name)
+    rotations = () if name == 'O' else ((True, ROTATE_CW), (False, ROTATE_CCW))
+    parents = {start: None}
+    levels = [[start]]
+    looked_at = 0
+    while levels[-1]:
+        next_level = []
+        for pose in levels[-1]:
+            rotation = pose & 3
+            offset = pose >> 2
+            packed = packed_states[rotation]
+            below = packed << (offset + ROW_BITS)
+            if EMPTY_FIELD & below:
+                OPEN_AIR_LAYERS[key] = None
+                return None
+            looked_at |= below
+
+            moves = [(offset - 1, rotation, MOVE_LEFT), (offset + 1, rotation, MOVE_RIGHT)]
+            for clockwise, action in rotations:
+                new_rotation = (rotation + (1 if clockwise else 3)) % 4
+                for kick in offsets[rotation][clockwise]:
+                    looked_at |= packed_states[new_rotation] << (offset + kick)
+                    if not EMPTY_FIELD & (packed_states[new_rotation] << (offset + kick)):
+                        moves.append((offset + kick, new_rotation, action))
+                        break
+            for new_offset, new_rotation, action in moves:
+                cells = packed_states[new_rotation] << new_offset
+                looked_at |= cells
+                new_pose = (new_offset << 2) | new_rotation
+                if not EMPTY_FIELD & cells and new_pose not in parents:
+                    parents[new_pose] = (pose, action)
+                    next_level.append(new_pose)
+        levels.append(next_level)
+
+    OPEN_AIR_LAYERS[key] = (levels[:-1], parents, looked_at & ~EMPTY_FIELD)
+    return OPEN_AIR_LAYERS[key]
+
+# Breadth first search over (x, y, rotation) from the piece's current pose, a level of equally many inputs at a time
+# Placements covering the same cells with the same spin are the same placement, the first one found is the shortest
+def find_placements(board, piece):
+    key = (tuple(board.rows), piece.piece_name, piece.x, piece.y, piece.rotation_state)
+    cached = PLACEMENT_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    name = piece.piece_name
+    states = ROTATION_STATES[name]
+    packed_states = PACKED_STATES[name]
+    rotations = () if name == 'O' else ((True, ROTATE_CW), (False, ROTATE_CCW))
+    t_piece = Tetromino(name) if name == 'T' else None
+
+    # Poses are stored as one integer, the piece's bit offset in the packed field times four plus its rotation
+    # Collision is then field & (packed_state << offset), and every move or kick just adds to the offset
+    field = pack_rows(board.rows)
+    offsets = kick_offsets(name)
+    drop_step = ROW_BITS << 2
+
+    # T-spins need three blocked corners, checked on the field before asking the board for the full rules
+    corners = sum(1 << (y * ROW_BITS + x) for x in (0, 2) for y in (0, 2))
+
+    # Every pose remembers the pose and input it was first reached from, paths are only rebuilt for results
+    start = (((piece.y + FIELD_PADDING) * ROW_BITS + piece.x + WALL_WIDTH) << 2) | piece.rotation_state
+    parents = {start: None}
+    arrival_spins = {start: (None, 0)}  # (t_spin, kick_index) the pose was first reached with
+    found = {}
+
+    # With the rows around the start empty, the poses up there come from the open air layer and only need dropping
+    layer = open_air_layer(name, start)
+    if layer and not field & layer[2]:
+        open_air_levels = layer[0]
+        parents.update(layer[1])
+        level = []
+    else:
+        open_air_levels = []
+        level = [start]
+
+    # A placement's inputs are the path to parent, then last_input if there is one, then the hard drop
+    def add(pose, spin, parent, last_input):
+        cells = packed_states[pose & 3] << (pose >> 2)
+        if (cells, spin[0]) not in found:
+            found[(cells, spin[0])] = (pose, spin, parent, last_input)
+
+    def visit(pose, parent, action, spin=(None, 0)):
+        if pose not in parents:
+            parents[pose] = (parent, action)
+            arrival_spins[pose] = spin
+            next_level.append(pose)
+
+    depth = 0
+    while level or depth < len(open_air_levels):
+        next_level = []
+        for pose in open_air_levels[depth] if depth < len(open_air_levels) else ():
+            rotation = pose & 3
+            row, column = divmod(pose >> 2, ROW_BITS)
+            drop = board.state_drop_distance(states[rotation], column - WALL_WIDTH, row - FIELD_PADDING)
+            add(pose + drop * drop_step, (None, 0), pose, None)
+            visit(pose + drop * drop_step, pose, SOFT_DROP)
+
+        for pose in level:
+            rotation = pose & 3
+            offset = pose >> 2
+            packed = packed_states[rotation]
+            row, column = divmod(offset, ROW_BITS)
+
+            # Most poses down by the stack are already resting, which one AND tells without working out the drop
+            if field & (packed << (offset + ROW_BITS)):
+                add(pose, arrival_spins[pose], pose, None)
+            else:
+                drop = board.state_drop_distance(states[rotation], column - WALL_WIDTH, row - FIELD_PADDING)
+                add(pose + drop * drop_step, (None, 0), pose, None)
+                visit(pose + drop * drop_step, pose, SOFT_DROP)
+            if pose - 4 not in parents and not field & (packed << (offset - 1)):
+                visit(pose - 4, pose, MOVE_LEFT)
+            if pose + 4 not in parents and not field & (packed << (offset + 1)):
+                visit(pose + 4, pose, MOVE_RIGHT)
+
+            for clockwise, action in rotations:
+                new_rotation = (rotation + (1 if clockwise else 3)) % 4
+                new_packed = packed_states[new_rotation]
+                for i, kick in enumerate(offsets[rotation][clockwise]):
+                    new_offset = offset + kick
+                    if field & (new_packed << new_offset):
+                        continue
+
+                    new_pose = (new_offset << 2) | new_rotation
+                    spin = (None, 0)
+                    if (t_piece and field & (new_packed << (new_offset + ROW_BITS))
+                            and (field & (corners << new_offset)).bit_count() >= 3):
+                        row, column = divmod(new_offset, ROW_BITS)
+                        t_piece.set_rotation(new_rotation)
+                        t_piece.x, t_piece.y = column - WALL_WIDTH, row - FIELD_PADDING
+                        spin = (classify_t_spin(board, t_piece, i), i)
+                        # The same pose can be a spin from one side and not from another, keep both
+                        add(new_pose, spin, pose, action)
+                    visit(new_pose, pose, action, spin)
+                    break
+        level = next_level
+        depth += 1
+
+    placements = []
+    for pose, (t_spin, kick_index), parent, last_input in found.values():
+        inputs = [HARD_DROP]
+        if last_input is not None:
+            inputs.append(last_input)
+        while parents[parent]:
+            parent, action = parents[parent]
+            inputs.append(action)
+        row, column = divmod(pose >> 2, ROW_BITS)
+        placements.append(Placement(name, column - WALL_WIDTH, row - FIELD_PADDING, pose & 3,
+                                    tuple(reversed(inputs)), t_spin, kick_index))
+
+    if len(PLACEMENT_CACHE) >= PLACEMENT_CACHE_SIZE:
+        PLACEMENT_CACHE.clear()
+    PLACEMENT_CACHE[key] = placements
+    return placements
@@ -0,0 +1,181 @@
+import itertools
+import pygame
+from constants import *
+
+# Board rows that can show on screen, the ones above the field are visible in the top margin
+FIRST_VISIBLE_ROW = max(0, GRID_HEIGHT - -(-BOARD_OFFSET_Y // CELL_SIZE))
+
+# Screen areas that are redrawn as a whole when what they show changes
+BOARD_RECT = pygame.Rect(BOARD_OFFSET_X, 0, BOARD_WIDTH * CELL_SIZE + 1, BOARD_OFFSET_Y + GRID_HEIGHT * CELL_SIZE + 1)
+HOLD_RECT = pygame.Rect(BOARD_OFFSET_X - SIDEBAR_OFFSET - SIDEBAR_WIDTH, BOARD_OFFSET_Y, SIDEBAR_WIDTH, PREVIEW_PIECE_HEIGHT)
+NEXT_RECT = pygame.Rect(BOARD_OFFSET_X + BOARD_WIDTH * CELL_SIZE + SIDEBAR_OFFSET, BOARD_OFFSET_Y,
+                        SIDEBAR_WIDTH + 1, PREVIEW_PIECE_HEIGHT * 5)
+GARBAGE_RECT = pygame.Rect(BOARD_OFFSET_X - GARBAGE_QUEUE_OFFSET - GARBAGE_QUEUE_WIDTH, 0,
+                           GARBAGE_QUEUE_WIDTH, BOARD_OFFSET_Y + GRID_HEIGHT * CELL_SIZE)
+
+def cell_position(x, y):
+    return BOARD_OFFSET_X + x * CELL_SIZE, BOARD_OFFSET_Y + (y - GRID_HEIGHT) * CELL_SIZE
+
+# Draws an engine's game onto the screen, only pushing the parts of the display that changed
+# Everything that only changes on lock, hold or garbage is kept on a cached frame surface,
+# the falling piece and its ghost are drawn over it and erased from it again the next frame
+class Renderer:
+    def __init__(self, screen):
+        self.screen = screen
+        self.screen_rect = screen.get_rect()
+
+        # One solid tile per palette entry, locked cells and pieces are blitted instead of drawn
+        self.tiles = [None] + [self.make_tile(color) for color in PALETTE[1:]]
+
+        # Half transparent ghost sprites per (piece, rotation), only as big as the piece's shape
+        self.ghost_sprites = {}
+
+        self.background = self.make_background()
+        self.frame = self.background.copy()
+        self.invalidate()
+
+    def make_tile(self, color):
+        tile = pygame.Surface((CELL_SIZE, CELL_SIZE)).convert()
+        tile.fill(color)
+        return tile
+
+    def make_background(self):
+        background = pygame.Surface(self.screen.get_size()).convert()
+        background.fill(BLACK)
+
+        # Grid
+        for x in range(BOARD_OFFSET_X, BOARD_WIDTH * CELL_SIZE + BOARD_OFFSET_X + 1, CELL_SIZE):
+            pygame.draw.line(background, BOARD_LINE, (x, BOARD_OFFSET_Y), (x, GRID_HEIGHT * CELL_SIZE + BOARD_OFFSET_Y))
+        for y in range(BOARD_OFFSET_Y, GRID_HEIGHT * CELL_SIZE + BOARD_OFFSET_Y + 1, CELL_SIZE):
+            pygame.draw.line(background, BOARD_LINE, (BOARD_OFFSET_X, y), (BOARD_WIDTH * CELL_SIZE + BOARD_OFFSET_X, y))
+        pygame.draw.rect(background, BOARD_BORDER,
+                         (BOARD_OFFSET_X, BOARD_OFFSET_Y, BOARD_WIDTH * CELL_SIZE + 1, GRID_HEIGHT * CELL_SIZE + 1), 1)
+
+        # Hold, next queue and garbage queue boxes
+        pygame.draw.rect(background, BOARD_BORDER, HOLD_RECT, 1)
+        pygame.draw.rect(background, BOARD_BORDER, (NEXT_RECT.x, NEXT_RECT.y, SIDEBAR_WIDTH, NEXT_RECT.height), 1)
+        pygame.draw.rect(background, BOARD_BORDER,
+                         (GARBAGE_RECT.x, BOARD_OFFSET_Y, GARBAGE_QUEUE_WIDTH, GRID_HEIGHT * CELL_SIZE), 1)
+        return background
+
+    # Forces everything to be redrawn and the whole display pushed on the next draw
+    def invalidate(self):
+        self.board_key = None
+        self.hold_key = None
+        self.next_key = None
+        self.garbage_key = None
+        self.ghost_key = None
+        self.ghost_y = 0
+        self.piece_rects = []
+        self.full_update = True
+
+    def draw_board(self, board):
+        self.frame.blit(self.background, BOARD_RECT, BOARD_RECT)
+        for y in range(FIRST_VISIBLE_ROW, BOARD_HEIGHT):
+            if board.row_counts[y]:
+                for x, piece_id in enumerate(board.grid[y]):
+                    if piece_id:
+                        self.frame.blit(self.tiles[piece_id], cell_position(x, y))
+
+    def draw_preview_piece(self, piece_name, starting_x, starting_y, width, height):
+        state = ROTATION_STATES[piece_name][0]
+        offset_x = starting_x + ((width - len(state.shape[0]) * CELL_SIZE) // 2)
+        offset_y = starting_y + ((height - (3 if piece_name == 'I' else 2) * CELL_SIZE) // 2)
+        tile = self.tiles[PIECE_IDS[piece_name]]
+        for x, y in state.minos:
+            self.frame.blit(tile, (offset_x + x * CELL_SIZE, offset_y + y * CELL_SIZE))
+
+    def draw_hold(self, held):
+        self.frame.blit(self.background, HOLD_RECT, HOLD_RECT)
+        if held:
+            self.draw_preview_piece(held, HOLD_RECT.x, BOARD_OFFSET_Y, SIDEBAR_WIDTH, PREVIEW_PIECE_HEIGHT)
+
+    def draw_next_queue(self, next_names):
+        self.frame.blit(self.background, NEXT_RECT, NEXT_RECT)
+        for i, name in enumerate(next_names):
+            self.draw_preview_piece(name, NEXT_RECT.x + 1, BOARD_OFFSET_Y + PREVIEW_PIECE_HEIGHT * i,
+                                    SIDEBAR_WIDTH, PREVIEW_PIECE_HEIGHT)
+
+    def draw_garbage_queue(self, garbage_queued):
+        self.frame.blit(self.background, GARBAGE_RECT, GARBAGE_RECT)
+        pygame.draw.rect(self.frame, RED, (GARBAGE_RECT.x, BOARD_OFFSET_Y + GRID_HEIGHT * CELL_SIZE - garbage_queued * CELL_SIZE,
+                         GARBAGE_QUEUE_WIDTH, garbage_queued * CELL_SIZE))
+        pygame.draw.rect(self.frame, BOARD_BORDER,
+                         (GARBAGE_RECT.x, BOARD_OFFSET_Y, GARBAGE_QUEUE_WIDTH, GRID_HEIGHT * CELL_SIZE), 1)
+
+    # Redraws the parts of the cached frame whose contents changed, returns the areas that did
+    def update_frame(self, engine):
+        changed = []
+
+        board_key = (engine.board, engine.board.version)
+        if board_key != self.board_key:
+            self.board_key = board_key
+            self.draw_board(engine.board)
+            changed.append(BOARD_RECT)
+
+        hold_key = PIECE_NAMES[engine.held_piece] if engine.held_piece else None
+        if hold_key != self.hold_key:
+            self.hold_key = hold_key
+            self.draw_hold(hold_key)
+            changed.append(HOLD_RECT)
+
+        next_key = tuple(PIECE_NAMES[piece_id] for piece_id in itertools.islice(engine.next_pieces, 5))
+        if next_key != self.next_key:
+            self.next_key = next_key
+            self.draw_next_queue(next_key)
+            changed.append(NEXT_RECT)
+
+        if engine.board.garbage_queued != self.garbage_key:
+            self.garbage_key = engine.board.garbage_queued
+            self.draw_garbage_queue(self.garbage_key)
+            changed.append(GARBAGE_RECT)
+
+        return changed
+
+    def ghost_sprite(self, piece):
+        key = (piece.piece_name, piece.rotation_state)
+        sprite = self.ghost_sprites.get(key)
+        if sprite is None:
+            size = len(piece.shape)
+            sprite = pygame.Surface((size * CELL_SIZE, size * CELL_SIZE), pygame.SRCALPHA)
+            for x, y in piece.state.minos:
+                pygame.draw.rect(sprite, (*piece.color, 128), (x * CELL_SIZE, y * CELL_SIZE, CELL_SIZE, CELL_SIZE))
+            self.ghost_sprites[key] = sprite
+        return sprite
+
+    def draw_piece(self, piece, board):
+        rects = []
+        tile = self.tiles[piece.piece_id]
+        for x, y in piece.state.minos:
+            rects.append(self.screen.blit(tile, cell_position(piece.x + x, piece.y + y)))
+
+        rects.append(self.draw_ghost(piece, board))
+        return [rect.clip(self.screen_rect) for rect in rects]
+
+    def draw_ghost(self, piece, board):
+        # The ghost only moves when the piece does or the board changes under it
+        ghost_key = (board, board.version, piece.piece_name, piece.rotation_state, piece.x, piece.y)
+        if ghost_key != self.ghost_key:
+            self.ghost_key = ghost_key
+            self.ghost_y = piece.get_ghost_position(board)
+        return self.screen.blit(self.ghost_sprite(piece), cell_position(piece.x, self.ghost_y))
+
+    def draw(self, engine):
+        changed = self.update_frame(engine)
+
+        # Erase last frame's piece and ghost, then copy over whatever changed in the cached frame
+        if self.full_update:
+            self.screen.blit(self.frame, (0, 0))
+            dirty = []
+        else:
+            dirty = self.piece_rects + changed
+            for rect in dirty:
+                self.screen.blit(self.frame, rect, rect)
+
+        self.piece_rects = self.draw_piece(engine.current_piece, engine.board) if engine.current_piece else []
+
+        if self.full_update:
+            self.full_update = False
+            pygame.display.flip()
+        else:
+            pygame.display.update(dirty + self.piece_rects)
@@ -0,0 +1,233 @@
+import argparse
+import bisect
+import struct
+import time
+from engine import Engine
+from constants import *
+
+# File layout: header, then one record per batch of events
+# A record is the logic steps since the previous record and a header, both as varints
+# The header's low bit says whether the record is a batch of inputs or received garbage, the rest is the count
+# Inputs follow the header as one byte each, action * 2 + pressed
+REPLAY_MAGIC = b'TRPL'
+REPLAY_VERSION = 2
+HEADER = struct.Struct('<4sBHQdI')  # Magic, version, logic rate, seed, garbage messiness, length in logic steps
+INPUTS = 0
+GARBAGE = 1
+
+# Milliseconds of play between snapshots kept for seeking
+SNAPSHOT_INTERVAL = 5000
+
+def write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def read_varint(data, i):
+    value = shift = 0
+    while True:
+        byte = data[i]
+        i += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, i
+        shift += 7
+
+def time_to_step(game_time):
+    return round(game_time / LOGIC_STEP)
+
+class Replay:
+    def __init__(self, seed, messiness, length, body):
+        self.seed = seed
+        self.messiness = messiness
+        self.length = length  # Logic steps
+        self.body = bytes(body)
+
+    def to_bytes(self):
+        return HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, LOGIC_RATE, self.seed, self.messiness, self.length) + self.body
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, logic_rate, seed, messiness, length = HEADER.unpack_from(data)
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+            raise ValueError("Not a replay file, or one from another version")
+        if logic_rate != LOGIC_RATE:
+            raise ValueError(f"Replay was recorded at a logic rate of {logic_rate} Hz, not {LOGIC_RATE} Hz")
+        return cls(seed, messiness, length, data[HEADER.size:])
+
+    def save(self, path):
+        with open(path, 'wb') as file:
+            file.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as file:
+            return cls.from_bytes(file.read())
+
+    # Decodes the body into (step, kind, data) records, data is the input list or the garbage lines
+    def records(self):
+        records = []
+        step = i = 0
+        while i < len(self.body):
+            delta, i = read_varint(self.body, i)
+            header, i = read_varint(self.body, i)
+            step += delta
+            kind, count = header & 1, header >> 1
+            if kind == INPUTS:
+                inputs = [(byte >> 1, bool(byte & 1)) for byte in self.body[i:i + count]]
+                i += count
+                records.append((step, INPUTS, inputs))
+            else:
+                records.append((step, GARBAGE, count))
+        return records
+
+# Collects everything that reaches an engine from outside during one game
+# Inputs have to be recorded in the same batches they were given to Engine.step, so lock and DAS checks line up
+class ReplayRecorder:
+    def __init__(self, seed, messiness):
+        self.seed = seed
+        self.messiness = messiness
+        self.body = bytearray()
+        self.last_step = 0
+
+    def record(self, game_time, kind, count):
+        step = time_to_step(game_time)
+        write_varint(self.body, step - self.last_step)
+        write_varint(self.body, (count << 1) | kind)
+        self.last_step = step
+
+    def record_inputs(self, game_time, inputs):
+        if inputs:
+            self.record(game_time, INPUTS, len(inputs))
+            self.body.extend(action * 2 + pressed for action, pressed in inputs)
+
+    def record_garbage(self, game_time, lines):
+        self.record(game_time, GARBAGE, lines)
+
+    def finish(self, game_time):
+        return Replay(self.seed, self.messiness, max(self.last_step, time_to_step(game_time)), self.body)
+
+# Replays a recording into a fresh engine, keeping snapshots along the way so seeking back doesn't start over
+class ReplayPlayer:
+    def __init__(self, replay, snapshot_interval=SNAPSHOT_INTERVAL):
+        self.replay = replay
+        self.records = replay.records()
+        self.snapshot_interval = time_to_step(snapshot_interval)
+        self.engine = Engine(replay.seed, replay.messiness)
+        self.index = 0  # Next record to apply
+        self.step = 0
+
+        # (step, record index, engine snapshot), ordered by step
+        self.snapshots = []
+        self.snapshot_steps = []
+        self.take_snapshot()
+
+    @property
+    def length(self):
+        return self.replay.length * LOGIC_STEP
+
+    @property
+    def position(self):
+        return self.step * LOGIC_STEP
+
+    def take_snapshot(self):
+        if not self.snapshot_steps or self.step > self.snapshot_steps[-1]:
+            self.snapshots.append((self.step, self.index, self.engine.snapshot()))
+            self.snapshot_steps.append(self.step)
+
+    def run_to(self, step):
+        # Half a step over the target so the float time sum can't fall just short of it
+        self.engine.advance((step + .5) * LOGIC_STEP)
+        self.step = step
+
+    def advance(self, step):
+        # Snapshots are taken as playback first passes each interval
+        next_snapshot = (self.step // self.snapshot_interval + 1) * self.snapshot_interval
+        while next_snapshot <= step:
+            self.run_to(next_snapshot)
+            self.take_snapshot()
+            next_snapshot += self.snapshot_interval
+        self.run_to(step)
+
+    # Plays forward to the given time in milliseconds
+    def play_to(self, game_time):
+        target = min(time_to_step(game_time), self.replay.length)
+        while self.index < len(self.records) and self.records[self.index][0] <= target:
+            step, kind, data = self.records[self.index]
+            self.advance(step)
+            if kind == INPUTS:
+                self.engine.step(data, 0)
+            else:
+                self.engine.board.take_garbage(data)
+            self.index += 1
+        self.advance(target)
+
+    # Jumps to any time by restoring the last snapshot before it and playing on from there
+    def seek(self, game_time):
+        target = min(time_to_step(game_time), self.replay.length)
+        i = bisect.bisect_right(self.snapshot_steps, target) - 1
+        snapshot_step, index, snapshot = self.snapshots[i]
+        if target < self.step or snapshot_step > self.step:
+            self.engine.restore(snapshot)
+            self.index = index
+            self.step = snapshot_step
+        self.play_to(game_time)
+
+    def finished(self):
+        return self.step >= self.replay.length or self.engine.game_over
+
+# Shows a replay in a window at the given speed, left and right seek, space pauses
+def watch(replay, speed=1):
+    import pygame
+    from render import Renderer
+
+    pygame.init()
+    screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+    pygame.display.set_caption("Tetris Replay")
+    renderer = Renderer(screen)
+    player = ReplayPlayer(replay)
+    clock = pygame.time.Clock()
+    position = 0
+    paused = False
+
+    running = True
+    while running:
+        dt = clock.tick(RENDER_FPS or FPS)
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_SPACE:
+                    paused = not paused
+                elif event.key in (pygame.K_LEFT, pygame.K_RIGHT):
+                    position += SNAPSHOT_INTERVAL * (1 if event.key == pygame.K_RIGHT else -1)
+                    position = min(max(0, position), player.length)
+                    player.seek(position)
+                    renderer.invalidate()
+
+        if not paused and not player.finished():
+            position = min(position + dt * speed, player.length)
+            player.play_to(position)
+        renderer.draw(player.engine)
+
+    pygame.quit()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play back a recorded game")
+    parser.add_argument('path')
+    parser.add_argument('--headless', action='store_true', help="play the whole replay as fast as possible and report it")
+    parser.add_argument('--speed', type=float, default=1, help="playback speed in a window")
+    args = parser.parse_args()
+
+    replay = Replay.load(args.path)
+    if args.headless:
+        start = time.perf_counter()
+        player = ReplayPlayer(replay)
+        player.play_to(player.length)
+        elapsed = time.perf_counter() - start
+        engine = player.engine
+        print(f"length: {player.length / 1000:.1f}s, replayed in {elapsed:.3f}s")
+        print(f"pieces: {engine.pieces_placed}, lines: {engine.lines_cleared}, game_over: {engine.game_over}")
+    else:
+        watch(replay, args.speed)
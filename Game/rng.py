@@ -0,0 +1,34 @@
+MASK_64 = (1 << 64) - 1
+
+# SplitMix64's step and mixing constants, batch.py runs the same stream over arrays of states
+SPLITMIX_GAMMA = 0x9E3779B97F4A7C15
+SPLITMIX_MIX_1 = 0xBF58476D1CE4E5B9
+SPLITMIX_MIX_2 = 0x94D049BB133111EB
+
+# SplitMix64, a small random stream whose whole state is one integer
+# Copying it is as cheap as copying an int, so boards can be copied by searches without sharing a stream
+class SplitMix64:
+    def __init__(self, seed=0):
+        self.state = seed & MASK_64
+
+    def copy(self):
+        return SplitMix64(self.state)
+
+    def next(self):
+        self.state = (self.state + SPLITMIX_GAMMA) & MASK_64
+        z = self.state
+        z = ((z ^ (z >> 30)) * SPLITMIX_MIX_1) & MASK_64
+        z = ((z ^ (z >> 27)) * SPLITMIX_MIX_2) & MASK_64
+        return z ^ (z >> 31)
+
+    # Float in [0, 1) from the top 53 bits
+    def random(self):
+        return (self.next() >> 11) / (1 << 53)
+
+    def randrange(self, n):
+        return self.next() % n
+
+    def shuffle(self, items):
+        for i in range(len(items) - 1, 0, -1):
+            j = self.randrange(i + 1)
+            items[i], items[j] = items[j], items[i]
@@ -0,0 +1,157 @@
+import zlib
+from engine import Engine
+from constants import *
+
+# Rollback runs in frames of this many milliseconds, inputs are stamped with the frame they're played on
+FRAME_TIME = 1000 / FPS
+
+# Frames the local game may run ahead of the last remote inputs it has, it waits for them past this
+MAX_ROLLBACK_FRAMES = 12
+
+# Frames between a clear and its garbage reaching the other board, the same in both players' simulations
+GARBAGE_DELAY = 6
+
+# Frames between checksums of the confirmed state, sent to catch the two sides drifting apart
+SYNC_INTERVAL = 60
+
+# Inputs are sent one byte each, action * 2 + pressed, the same as in replays
+def pack_inputs(inputs):
+    return bytes(action * 2 + pressed for action, pressed in inputs)
+
+def unpack_inputs(data):
+    return [(byte >> 1, bool(byte & 1)) for byte in data]
+
+# Both players' games simulated side by side, the same way on both ends of the connection
+# Local inputs are played the frame they're given, the other player is predicted to press nothing new
+# When their real inputs for a frame turn out to be different, both games are restored to before that frame and played again
+# Garbage isn't sent over the network, each side sees the clear in its own copy of the other game and delivers it GARBAGE_DELAY frames later
+class RollbackSession:
+    def __init__(self, seed, player, recorder=None, messiness=GARBAGE_MESSINESS):
+        self.player = player  # Index of the local player, the host is 0
+        self.remote = 1 - player
+        self.engines = [Engine(seed, messiness), Engine(seed, messiness)]
+        self.recorder = recorder  # Gets the local player's inputs and garbage once their frames are final
+
+        self.frame = 0  # Next frame to simulate
+        self.confirmed = 0  # Remote inputs are known for every frame before this
+        self.inputs = [{}, {}]  # Per player, frame to inputs
+        self.garbage = []  # (arrival frame, target player, lines) on their way
+        self.snapshots = {}  # Frame to the state right before it was simulated
+        self.received = {}  # Frame to the local player's garbage and inputs on it, kept until it's recorded
+        self.rollback_frame = None  # Earliest frame whose prediction was wrong
+        self.final_frame = 0  # Frames before this have been recorded and checked
+        self.rollbacks = 0
+        self.frames_resimulated = 0
+
+        # Checksums of the confirmed state at every SYNC_INTERVAL frames, compared with the other side's
+        self.checksums = {}
+        self.remote_checksums = {}
+        self.unsent_checksums = []
+        self.desynced = False
+
+    @property
+    def local_engine(self):
+        return self.engines[self.player]
+
+    def snapshot(self):
+        return self.engines[0].snapshot(), self.engines[1].snapshot(), tuple(self.garbage)
+
+    def restore(self, state):
+        self.engines[0].restore(state[0])
+        self.engines[1].restore(state[1])
+        self.garbage = list(state[2])
+
+    def simulate_frame(self, frame):
+        self.snapshots[frame] = self.snapshot()
+
+        garbage = 0
+        if self.garbage and self.garbage[0][0] == frame:
+            arriving = [entry for entry in self.garbage if entry[0] == frame]
+            self.garbage = self.garbage[len(arriving):]
+            for _, target, lines in arriving:
+                self.engines[target].board.take_garbage(lines)
+                if target == self.player:
+                    garbage += lines
+
+        inputs = self.inputs[self.player].get(frame, [])
+        self.received[frame] = (self.local_engine.time, garbage, inputs)
+
+        for player, engine in enumerate(self.engines):
+            engine.step(self.inputs[player].get(frame, ()), 0)
+            engine.advance((frame + 1) * FRAME_TIME)
+            attack = engine.pop_attack()
+            if attack:
+                self.garbage.append((frame + GARBAGE_DELAY, 1 - player, attack))
+
+    def can_advance(self):
+        return self.frame - self.confirmed < MAX_ROLLBACK_FRAMES
+
+    # Plays the next frame with the local player's inputs, returns its number to stamp them with when they're sent
+    def advance(self, inputs):
+        self.roll_back()
+        frame = self.frame
+        self.inputs[self.player][frame] = inputs
+        self.simulate_frame(frame)
+        self.frame += 1
+        self.finalize()
+        return frame
+
+    # Remote inputs arrive in order, one message per frame
+    def add_remote_inputs(self, frame, inputs):
+        self.inputs[self.remote][frame] = inputs
+        self.confirmed = frame + 1
+        # Frames already played were played with nothing pressed, so only inputs mean they were wrong
+        if inputs and frame < self.frame and (self.rollback_frame is None or frame < self.rollback_frame):
+            self.rollback_frame = frame
+
+    def roll_back(self):
+        if self.rollback_frame is None:
+            return
+        self.restore(self.snapshots[self.rollback_frame])
+        for frame in range(self.rollback_frame, self.frame):
+            self.simulate_frame(frame)
+        self.rollbacks += 1
+        self.frames_resimulated += self.frame - self.rollback_frame
+        self.rollback_frame = None
+
+    # Rolls back now if it's needed, so the screen shows the corrected state before the next frame is due
+    def catch_up(self):
+        self.roll_back()
+        self.finalize()
+
+    # Frames with both players' inputs known can't change any more, so they're recorded and dropped
+    def finalize(self):
+        final = min(self.confirmed, self.frame)
+        if self.rollback_frame is not None:
+            final = min(final, self.rollback_frame)
+
+        for frame in range(self.final_frame, final):
+            time, garbage, inputs = self.received.pop(frame)
+            if self.recorder:
+                if garbage:
+                    self.recorder.record_garbage(time, garbage)
+                self.recorder.record_inputs(time, inputs)
+            if frame % SYNC_INTERVAL == 0:
+                checksum = zlib.crc32(b''.join(self.snapshots[frame][:2]))
+                self.checksums[frame] = checksum
+                self.unsent_checksums.append((frame, checksum))
+                self.compare_checksum(frame)
+            del self.snapshots[frame]
+            self.inputs[0].pop(frame, None)
+            self.inputs[1].pop(frame, None)
+        self.final_frame = max(self.final_frame, final)
+
+    # Checksums made since the last call, as (frame, checksum) for the other side
+    def pop_checksums(self):
+        checksums = self.unsent_checksums
+        self.unsent_checksums = []
+        return checksums
+
+    def add_remote_checksum(self, frame, checksum):
+        self.remote_checksums[frame] = checksum
+        self.compare_checksum(frame)
+
+    def compare_checksum(self, frame):
+        if frame in self.checksums and frame in self.remote_checksums:
+            if self.checksums.pop(frame) != self.remote_checksums.pop(frame):
+                self.desynced = True
@@ -0,0 +1,336 @@
+import argparse
+import asyncio
+import itertools
+import struct
+import time
+from board import Board
+from tetromino import Tetromino
+from net import Connection, MultiplayerMessage, FRAME_HEADER, DEFAULT_PORT, encode, decode
+from constants import *
+
+SPECTATE_PORT = DEFAULT_PORT + 1
+ALL_PLAYERS = 255  # Subscribes to every player in the match
+
+NEXT_SHOWN = 5
+
+# Seconds between batched writes to spectators
+FLUSH_INTERVAL = 1 / 60
+
+# Bytes a spectator may have waiting to be sent before it's skipped, it gets keyframes once it has caught up
+MAX_VIEWER_BUFFER = 64 * 1024
+
+# A delta starts with these flags, then each part that's flagged in this order
+# Rows are a count, then each row's y and its cells packed two to a byte
+RESET = 1  # Clear the board before the rows, only keyframes use it
+ROWS = 2
+PIECE = 4
+HOLD = 8
+NEXT = 16
+GARBAGE_METER = 32
+EVERYTHING = RESET | ROWS | PIECE | HOLD | NEXT | GARBAGE_METER
+PIECE_POSE = struct.Struct('<BBbb')  # Piece id, rotation, x, y
+GARBAGE_AMOUNT = struct.Struct('<H')
+EMPTY_CELLS = bytes(BOARD_WIDTH)
+
+# What a spectator sees of one player: the board's piece ids, the falling piece, hold, next queue and garbage meter
+# The game keeps one to work out its deltas, the server and every spectator keep one to apply them to
+class SpectatorView:
+    def __init__(self):
+        self.rows = [EMPTY_CELLS] * BOARD_HEIGHT
+        self.piece = (0, 0, 0, 0)
+        self.held = 0
+        self.next = bytes(NEXT_SHOWN)
+        self.garbage = 0
+        self.board_key = None
+
+    # Catches the view up with an engine, returns the delta that does the same or nothing when nothing changed
+    def update(self, engine):
+        flags = 0
+        rows = []
+
+        # Rows are only compared when the board has changed since the last update
+        board_key = (engine.board, engine.board.version)
+        if board_key != self.board_key:
+            self.board_key = board_key
+            for y, cells in enumerate(engine.board.grid):
+                cells = cells.tobytes()
+                if cells != self.rows[y]:
+                    self.rows[y] = cells
+                    rows.append(y)
+            if rows:
+                flags |= ROWS
+
+        piece = engine.current_piece
+        pose = (piece.piece_id, piece.rotation_state, piece.x, piece.y) if piece else (0, 0, 0, 0)
+        if pose != self.piece:
+            self.piece = pose
+            flags |= PIECE
+
+        held = engine.held_piece or 0
+        if held != self.held:
+            self.held = held
+            flags |= HOLD
+
+        next_ids = bytes(itertools.islice(engine.next_pieces, NEXT_SHOWN)).ljust(NEXT_SHOWN, b'\0')
+        if next_ids != self.next:
+            self.next = next_ids
+            flags |= NEXT
+
+        if engine.board.garbage_queued != self.garbage:
+            self.garbage = engine.board.garbage_queued
+            flags |= GARBAGE_METER
+
+        return self.encode(flags, rows) if flags else b''
+
+    def encode(self, flags, rows):
+        out = bytearray([flags])
+        if flags & ROWS:
+            out.append(len(rows))
+            for y in rows:
+                cells = self.rows[y]
+                out.append(y)
+                out.extend(cells[x] << 4 | cells[x + 1] for x in range(0, BOARD_WIDTH, 2))
+        if flags & PIECE:
+            out += PIECE_POSE.pack(*self.piece)
+        if flags & HOLD:
+            out.append(self.held)
+        if flags & NEXT:
+            out += self.next
+        if flags & GARBAGE_METER:
+            out += GARBAGE_AMOUNT.pack(self.garbage)
+        return bytes(out)
+
+    # The whole view as one delta, only rows with something in them are sent
+    def keyframe(self):
+        return self.encode(EVERYTHING, [y for y in range(BOARD_HEIGHT) if self.rows[y] != EMPTY_CELLS])
+
+    # Applies a delta, returns its flags
+    def apply(self, delta):
+        flags = delta[0]
+        i = 1
+        if flags & RESET:
+            self.rows = [EMPTY_CELLS] * BOARD_HEIGHT
+        if flags & ROWS:
+            count = delta[i]
+            i += 1
+            for _ in range(count):
+                y = delta[i]
+                self.rows[y] = bytes(half for byte in delta[i + 1:i + 1 + BOARD_WIDTH // 2] for half in (byte >> 4, byte & 0xF))
+                i += 1 + BOARD_WIDTH // 2
+        if flags & PIECE:
+            self.piece = PIECE_POSE.unpack_from(delta, i)
+            i += PIECE_POSE.size
+        if flags & HOLD:
+            self.held = delta[i]
+            i += 1
+        if flags & NEXT:
+            self.next = delta[i:i + NEXT_SHOWN]
+            i += NEXT_SHOWN
+        if flags & GARBAGE_METER:
+            self.garbage = GARBAGE_AMOUNT.unpack_from(delta, i)[0]
+        return flags
+
+# Streams one player's screen from their game to a spectator server
+class SpectatorFeed:
+    def __init__(self, host, port, player):
+        self.player = player
+        self.view = SpectatorView()
+        self.conn = Connection.connect(host, port)
+        self.conn.send(MultiplayerMessage(MultiplayerMessage.PUBLISH, player))
+
+    # Called once per drawn frame, sends nothing when nothing changed
+    def publish(self, engine):
+        delta = self.view.update(engine)
+        if delta:
+            self.conn.send(MultiplayerMessage(MultiplayerMessage.DELTA, (self.player, delta)))
+
+    def close(self):
+        self.conn.close()
+
+class Viewer:
+    def __init__(self, writer, player):
+        self.writer = writer
+        self.player = player
+        self.needs_keyframe = True  # Set for new spectators and ones that fell behind
+        self.frames_dropped = 0
+
+    def watches(self, player):
+        return self.player == ALL_PLAYERS or self.player == player
+
+# Relays games' deltas to any number of spectators
+# Deltas are forwarded exactly as they arrived, and each flush joins everything that came in since the last one into one
+# batch per player, so every spectator is handed the same bytes object and costs one write
+# Spectators that can't keep up are skipped instead of buffered for, then sent keyframes from the server's own
+# copy of each player's view once their backlog has drained
+class BroadcastServer:
+    def __init__(self):
+        self.views = {}  # Player to the latest SpectatorView
+        self.keyframes = {}  # Player to their keyframe message, made on demand and kept until the next delta
+        self.pending = {}  # Player to delta messages waiting for the next flush
+        self.viewers = []
+        self.server = None
+
+    async def serve(self, host, port):
+        self.server = await asyncio.start_server(self.accept, host, port)
+        async with self.server:
+            while True:
+                await asyncio.sleep(FLUSH_INTERVAL)
+                self.flush()
+
+    async def read_message(self, reader):
+        header = await reader.readexactly(FRAME_HEADER.size)
+        length, type = FRAME_HEADER.unpack(header)
+        payload = await reader.readexactly(length)
+        return type, header + payload, payload
+
+    async def accept(self, reader, writer):
+        viewer = None
+        try:
+            while True:
+                type, message, payload = await self.read_message(reader)
+                if type == MultiplayerMessage.DELTA:
+                    self.publish(payload[0], message, payload[1:])
+                elif type == MultiplayerMessage.SUBSCRIBE and viewer is None:
+                    viewer = Viewer(writer, decode(type, payload).data)
+                    self.viewers.append(viewer)
+                elif type == MultiplayerMessage.PING:
+                    writer.write(encode(MultiplayerMessage(MultiplayerMessage.PONG, decode(type, payload).data)))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if viewer:
+                self.viewers.remove(viewer)
+            writer.close()
+
+    def publish(self, player, message, delta):
+        if player not in self.views:
+            self.views[player] = SpectatorView()
+            self.pending[player] = []
+        self.views[player].apply(delta)
+        self.keyframes.pop(player, None)
+        self.pending[player].append(message)
+
+    def keyframe(self, player):
+        if player not in self.keyframes:
+            self.keyframes[player] = encode(MultiplayerMessage(MultiplayerMessage.KEYFRAME, (player, self.views[player].keyframe())))
+        return self.keyframes[player]
+
+    def flush(self):
+        batches = {player: b''.join(messages) for player, messages in self.pending.items() if messages}
+        for messages in self.pending.values():
+            messages.clear()
+
+        for viewer in self.viewers:
+            if viewer.writer.transport.get_write_buffer_size() > MAX_VIEWER_BUFFER:
+                if any(viewer.watches(player) for player in batches):
+                    viewer.frames_dropped += 1
+                    viewer.needs_keyframe = True
+                continue
+            if viewer.needs_keyframe:
+                # A keyframe already includes this flush's deltas
+                for player in self.views:
+                    if viewer.watches(player):
+                        viewer.writer.write(self.keyframe(player))
+                viewer.needs_keyframe = False
+            else:
+                for player, batch in batches.items():
+                    if viewer.watches(player):
+                        viewer.writer.write(batch)
+
+def run_server(host, port=SPECTATE_PORT):
+    try:
+        asyncio.run(BroadcastServer().serve(host, port))
+    except KeyboardInterrupt:
+        pass
+
+# Enough of an engine for the renderer, rebuilt from a spectator's view of a player
+class SpectatedGame:
+    def __init__(self):
+        self.view = SpectatorView()
+        self.board = Board()
+        self.piece = Tetromino('I')
+        self.current_piece = None
+        self.held_piece = None
+        self.next_pieces = []
+
+    def apply(self, delta):
+        view = self.view
+        flags = view.apply(delta)
+        if flags & ROWS:
+            self.board.grid[:] = np.frombuffer(b''.join(view.rows), np.uint8).reshape(BOARD_HEIGHT, BOARD_WIDTH)
+            self.board.update_rows()
+        if flags & PIECE:
+            piece_id, rotation, x, y = view.piece
+            self.current_piece = None
+            if piece_id:
+                self.current_piece = self.piece.reset(PIECE_NAMES[piece_id])
+                self.current_piece.set_rotation(rotation)
+                self.current_piece.x, self.current_piece.y = x, y
+        if flags & HOLD:
+            self.held_piece = view.held or None
+        if flags & NEXT:
+            self.next_pieces = [piece_id for piece_id in view.next if piece_id]
+        if flags & GARBAGE_METER:
+            self.board.garbage_queued = view.garbage
+
+def subscribe(host, port, player):
+    conn = Connection.connect(host, port)
+    conn.send(MultiplayerMessage(MultiplayerMessage.SUBSCRIBE, player))
+    return conn
+
+# Follows one player of a match in a window
+def watch(host, port, player):
+    import pygame
+    from render import Renderer
+
+    pygame.init()
+    screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+    pygame.display.set_caption(f"Tetris - Spectating player {player + 1}")
+    renderer = Renderer(screen)
+    game = SpectatedGame()
+    conn = subscribe(host, port, player)
+    clock = pygame.time.Clock()
+
+    while not conn.closed and not any(event.type == pygame.QUIT for event in pygame.event.get()):
+        for message in conn.poll():
+            if message.type in (MultiplayerMessage.DELTA, MultiplayerMessage.KEYFRAME):
+                game.apply(message.data[1])
+        renderer.draw(game)
+        clock.tick(RENDER_FPS or FPS)
+
+    conn.close()
+    pygame.quit()
+
+# Follows a match without a window, reporting how much arrives each second
+def watch_headless(host, port, player):
+    conn = subscribe(host, port, player)
+    views = {}
+    messages = keyframes = 0
+    next_report = time.monotonic() + 1
+    while not conn.closed:
+        for message in conn.poll():
+            views.setdefault(message.data[0], SpectatorView()).apply(message.data[1])
+            messages += 1
+            keyframes += message.type == MultiplayerMessage.KEYFRAME
+        if time.monotonic() >= next_report:
+            next_report += 1
+            print(f"{messages} messages, {keyframes} keyframes, players {sorted(views)}")
+            messages = keyframes = 0
+        time.sleep(FLUSH_INTERVAL)
+    conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Spectate VS matches")
+    parser.add_argument('--serve', action='store_true', help="run the server games stream to and spectators watch from")
+    parser.add_argument('--address', default='127.0.0.1', help="address to serve on or to watch from")
+    parser.add_argument('--port', type=int, default=SPECTATE_PORT)
+    parser.add_argument('--player', type=int, default=1, help="player to watch")
+    parser.add_argument('--headless', action='store_true', help="report what arrives instead of showing it")
+    args = parser.parse_args()
+
+    if args.serve:
+        run_server(args.address, args.port)
+    elif args.headless:
+        watch_headless(args.address, args.port, ALL_PLAYERS)
+    else:
+        watch(args.address, args.port, args.player - 1)
@@ -0,0 +1,63 @@
+import pytest
+from attack import AttackRules, CLEAR_TYPES, JSTRIS, DEFAULT_RULES, load_rules
+from board import Board
+
+# Board.garbage_calc before the rules were compiled into a table
+OLD_ATTACK_TABLE = {
+    'SINGLE': 0,
+    'DOUBLE': 1,
+    'TRIPLE': 2,
+    'TETRIS': 4,
+    'T-SPIN DOUBLE': 4,
+    'T-SPIN TRIPLE': 6,
+    'T-SPIN SINGLE': 2,
+    'MINI T-SPIN SINGLE': 0,
+    'MINI T-SPIN DOUBLE': 1
+}
+
+def old_garbage_calc(clear_type, back_to_back, combo, perfect_clear):
+    lines_sent = OLD_ATTACK_TABLE[clear_type]
+    if perfect_clear:
+        lines_sent += 10
+    if back_to_back > 0:
+        lines_sent += 1
+    if combo > 1:
+        if combo < 5:
+            lines_sent += 1
+        elif combo < 7:
+            lines_sent += 2
+        elif combo < 9:
+            lines_sent += 3
+        elif combo < 12:
+            lines_sent += 4
+        else:
+            lines_sent += 5
+    return lines_sent
+
+def test_table_matches_old_garbage_calc():
+    board = Board()
+    for code in range(1, len(CLEAR_TYPES)):
+        for back_to_back in range(-1, 4):
+            for combo in range(20):
+                for perfect_clear in (False, True):
+                    result = {'clear_type': code, 'lines': 1, 'back_to_back': back_to_back, 'combo': combo,
+                              'perfect_clear': perfect_clear}
+                    expected = old_garbage_calc(CLEAR_TYPES[code], back_to_back, combo, perfect_clear)
+                    assert board.garbage_calc(result) == expected, result
+                    assert DEFAULT_RULES.attack(result) == expected, result
+
+def test_no_clear_sends_nothing():
+    assert Board().garbage_calc(None) == 0
+
+def test_unknown_clear_type():
+    with pytest.raises(ValueError):
+        AttackRules(dict(JSTRIS, clears={'T-SPIN MINI SINGLE': 0}))
+
+def test_rules_file_overrides_jstris(tmp_path):
+    path = tmp_path / 'rules.json'
+    path.write_text('{"clears": {"TETRIS": 5}, "perfect_clear": 6}')
+    rules = load_rules(str(path))
+    tetris = {'clear_type': CLEAR_TYPES.index('TETRIS'), 'back_to_back': 0, 'combo': 0, 'perfect_clear': True}
+    single = dict(tetris, clear_type=CLEAR_TYPES.index('SINGLE'), perfect_clear=False)
+    assert rules.attack(tetris) == 11
+    assert rules.attack(single) == 0
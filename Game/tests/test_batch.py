@@ -0,0 +1,101 @@
+import random
+import numpy as np
+from batch import BatchBoard
+from board import Board
+from placements import find_placements
+from tetromino import Tetromino
+from attack import T_SPIN_SINGLE, T_SPIN_DOUBLE, T_SPIN_TRIPLE, MINI_T_SPIN_SINGLE, MINI_T_SPIN_DOUBLE
+from constants import *
+
+T_SPINS = {T_SPIN_SINGLE, T_SPIN_DOUBLE, T_SPIN_TRIPLE, MINI_T_SPIN_SINGLE, MINI_T_SPIN_DOUBLE}
+
+def assert_same(batch, i, board):
+    assert (batch.grid[i] == board.grid).all()
+    assert batch.combo[i] == board.combo
+    assert batch.back_to_back[i] == board.back_to_back
+    assert batch.garbage_queued[i] == board.garbage_queued
+    assert batch.garbage_states[i] == board.garbage_generator.state
+    assert batch.garbage_hole[i] == board.garbage_hole
+
+def reset_board(batch, i, board):
+    batch.grid[i] = board.grid
+    batch.combo[i] = board.combo
+    batch.back_to_back[i] = board.back_to_back
+    batch.garbage_queued[i] = board.garbage_queued
+    batch.garbage_states[i] = board.garbage_generator.state
+    batch.garbage_hole[i] = board.garbage_hole
+    batch.messiness[i] = board.messiness
+
+# Seeded games on Boards and a BatchBoard side by side, every piece placed somewhere find_placements reaches,
+# T-spins taken whenever there is one and garbage queued now and then
+def test_batch_follows_boards():
+    n = 24
+    rng = random.Random(5)
+    boards = [Board(i, messiness=(0.9, 0.3, 0.0, 1.0)[i % 4]) for i in range(n)]
+    for board in boards:
+        board.add_garbage_lines(rng.randint(0, 6))
+    batch = BatchBoard.from_boards(boards)
+
+    clears = set()
+    for _ in range(120):
+        pieces = []
+        for i, board in enumerate(boards):
+            piece = Tetromino(rng.choice(list(PIECES)))
+            placements = find_placements(board, piece)
+            if board.check_collision(piece) or not placements:
+                boards[i] = board = Board(rng.randrange(1000))
+                reset_board(batch, i, board)
+                placements = find_placements(board, piece)
+            spins = [placement for placement in placements if placement.t_spin]
+            pieces.append(rng.choice(spins or placements))
+            if rng.random() < 0.1:
+                lines = rng.randint(1, 4)
+                board.take_garbage(lines)
+                batch.garbage_queued[i] += lines
+
+        ids = np.array([PIECE_IDS[placement.piece_name] for placement in pieces])
+        rotations = np.array([placement.rotation_state for placement in pieces])
+        xs = np.array([placement.x for placement in pieces])
+        ys = np.array([placement.y for placement in pieces])
+        spun = np.array([placement.t_spin is not None for placement in pieces])
+        kicks = np.array([placement.kick_index for placement in pieces])
+        active = np.array([rng.random() < 0.9 for _ in range(n)])
+
+        assert not batch.check_collision(ids, rotations, xs, ys).any()
+        assert (batch.drop_distance(ids, rotations, xs, ys) == 0).all()
+        results, attack = batch.lock(ids, rotations, xs, ys, spun, kicks, active)
+        for i, (board, placement) in enumerate(zip(boards, pieces)):
+            if not active[i]:
+                continue
+            result = placement.lock(board)
+            assert attack[i] == board.send_garbage(board.garbage_calc(result))
+            if result:
+                clears.add(result['clear_type'])
+                for key, value in result.items():
+                    assert results[key][i] == value, key
+            else:
+                assert results['lines'][i] == 0
+            assert_same(batch, i, board)
+
+    assert clears & T_SPINS
+
+def test_seeded_garbage_matches_boards():
+    seeds = np.arange(100, 132)
+    batch = BatchBoard(len(seeds), seeds, messiness=0.5)
+    boards = [Board(int(seed), messiness=0.5) for seed in seeds]
+    rng = random.Random(1)
+    for _ in range(6):
+        lines = np.array([rng.randint(0, 7) for _ in seeds])
+        batch.add_garbage_lines(lines)
+        for board, count in zip(boards, lines):
+            board.add_garbage_lines(int(count))
+        for i, board in enumerate(boards):
+            assert_same(batch, i, board)
+
+def test_board_round_trip():
+    board = Board(7, messiness=0.3)
+    board.add_garbage_lines(5)
+    board.take_garbage(3)
+    board.combo, board.back_to_back = 2, 1
+    copy = BatchBoard.from_boards([board]).to_board(0)
+    assert copy.snapshot() == board.snapshot()
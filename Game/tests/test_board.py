@@ -0,0 +1,48 @@
+import random
+import numpy as np
+from board import Board
+from tetromino import Tetromino
+from constants import *
+
+def minos_collide(board, piece, dx, dy):
+    return any(board.is_occupied(piece.x + dx + x, piece.y + dy + y) for x, y in piece.state.minos)
+
+def test_collision_far_outside_the_walls():
+    board = Board()
+    for name in PIECES:
+        piece = Tetromino(name)
+        for rotation in range(4):
+            piece.set_rotation(rotation)
+            for dx in range(-3 * BOARD_WIDTH, 3 * BOARD_WIDTH):
+                assert board.check_collision(piece, dx, 0) == minos_collide(board, piece, dx, 0), (name, rotation, dx)
+
+def test_ghost_of_a_piece_outside_the_board():
+    board = Board()
+    piece = Tetromino('I')
+    piece.set_rotation(1)
+    piece.x = 13
+    assert board.check_collision(piece)
+    piece.x = -BOARD_WIDTH
+    assert board.check_collision(piece)
+
+def full_rows(board):
+    return [y for y in range(BOARD_HEIGHT) if (board.grid[y] != EMPTY).all()]
+
+# Full rows left on the board stay tracked through garbage and line removal, wherever the rows end up
+def test_full_rows_follow_the_rows():
+    rng = random.Random(2)
+    for _ in range(200):
+        board = Board(rng.randrange(1000))
+        grid = np.zeros((BOARD_HEIGHT, BOARD_WIDTH), np.uint8)
+        for y in range(BOARD_HEIGHT - rng.randrange(1, 16), BOARD_HEIGHT):
+            grid[y] = GARBAGE_ID
+            if rng.random() < .5:
+                grid[y, rng.randrange(BOARD_WIDTH)] = EMPTY
+        board.load_grid(grid)
+        for _ in range(4):
+            assert sorted(board.full_rows) == full_rows(board)
+            if rng.random() < .5:
+                board.add_garbage_lines(rng.randrange(1, 6))
+            elif board.full_rows:
+                board.remove_lines(rng.sample(board.full_rows, rng.randrange(1, len(board.full_rows) + 1)))
+        assert sorted(board.full_rows) == full_rows(board)
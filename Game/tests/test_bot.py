@@ -0,0 +1,18 @@
+from bot import Bot, THINK_TIME, POOL_THINK_TIME
+from engine import Engine
+
+def test_pool_is_used_at_its_default_think_time():
+    assert Bot().think_time == THINK_TIME
+    bot = Bot(workers=2)
+    try:
+        assert bot.think_time == POOL_THINK_TIME
+        calls = []
+        starmap = bot.pool.starmap
+        bot.pool.starmap = lambda *args: calls.append(1) or starmap(*args)
+        engine = Engine(0)
+        for _ in range(5):
+            assert bot.think(engine) is not None
+            engine.hard_drop()
+        assert len(calls) == 5
+    finally:
+        bot.close()
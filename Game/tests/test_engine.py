@@ -0,0 +1,15 @@
+from engine import Engine
+from constants import *
+
+# The piece swapped in from hold starts its lock delay over, the same as one spawned from the queue
+def test_hold_resets_lock_delay():
+    engine = Engine(5)
+    engine.handle_input(HOLD, True)
+    engine.hard_drop()
+    engine.step([(SOFT_DROP, True)], 100)
+    engine.advance(engine.time + engine.lock_delay - 10)
+    placed = engine.pieces_placed
+    engine.handle_input(HOLD, True)
+    assert engine.lock_time == engine.time
+    engine.advance(engine.time + engine.lock_delay - 10)
+    assert engine.pieces_placed == placed
@@ -0,0 +1,64 @@
+import numpy as np
+from board import Board
+from bot import evaluate as bot_evaluate, DEFAULT_WEIGHTS
+from features import extract, evaluate, pack_boards
+from constants import *
+
+# Random stacks of every height and density, some with holes, loaded into Boards
+def random_boards(count, seed):
+    rng = np.random.default_rng(seed)
+    boards = []
+    for i in range(count):
+        height = rng.integers(0, 24)
+        grid = np.zeros((BOARD_HEIGHT, BOARD_WIDTH), np.uint8)
+        filled = rng.random((height, BOARD_WIDTH)) < rng.random()
+        grid[BOARD_HEIGHT - height:] = filled * rng.integers(1, GARBAGE_ID + 1, (height, BOARD_WIDTH))
+        board = Board(i)
+        board.load_grid(grid)
+        boards.append(board)
+    return boards
+
+def test_grids_and_row_masks_agree():
+    boards = random_boards(300, 1)
+    garbage = np.arange(len(boards)) % 8
+    from_grids = extract(np.stack([board.grid for board in boards]), garbage)
+    from_rows = extract(pack_boards(boards), garbage)
+    for name in from_grids:
+        assert np.array_equal(from_grids[name], from_rows[name]), name
+
+def test_evaluate_matches_bot():
+    boards = random_boards(500, 2)
+    garbage = np.arange(len(boards)) % 8
+    scores = evaluate(extract(pack_boards(boards), garbage))
+    for board, queued, score in zip(boards, garbage, scores):
+        assert abs(score - bot_evaluate(board, DEFAULT_WEIGHTS, int(queued))) < 1e-6
+
+def test_features_by_cell():
+    boards = random_boards(300, 3)
+    features = extract(pack_boards(boards))
+    for i, board in enumerate(boards):
+        filled = board.grid != EMPTY
+        assert list(features['heights'][i]) == [BOARD_HEIGHT - top for top in board.heights]
+        holes = sum(1 for x in range(BOARD_WIDTH) for y in range(board.heights[x], BOARD_HEIGHT) if not filled[y, x])
+        assert features['holes'][i] == holes
+
+        covered = 0
+        for x in range(BOARD_WIDTH):
+            hole_rows = [y for y in range(board.heights[x] + 1, BOARD_HEIGHT) if not filled[y, x]]
+            if hole_rows:
+                covered += filled[:max(hole_rows), x].sum()
+        assert features['covered'][i] == covered
+
+        # A T facing down with three corners blocked that clears a line, checked cell by cell
+        def blocked(x, y):
+            return not (0 <= x < BOARD_WIDTH and y < BOARD_HEIGHT) or (y >= 0 and filled[y, x])
+        slots = 0
+        for x in range(BOARD_WIDTH - 2):
+            for y in range(-1, BOARD_HEIGHT - 2):
+                if any(blocked(cx, cy) for cx, cy in ((x, y + 1), (x + 1, y + 1), (x + 2, y + 1), (x + 1, y + 2))):
+                    continue
+                if sum(blocked(cx, cy) for cx, cy in ((x, y), (x + 2, y), (x, y + 2), (x + 2, y + 2))) < 3:
+                    continue
+                if (y + 1 >= 0 and filled[y + 1].sum() == BOARD_WIDTH - 3) or filled[y + 2].sum() == BOARD_WIDTH - 1:
+                    slots += 1
+        assert features['t_slots'][i] == slots
@@ -0,0 +1,49 @@
+import struct
+from net import MultiplayerMessage, FRAME_HEADER, MESSAGE_FORMATS, VARIABLE_LENGTH, encode, decode
+
+MESSAGES = [
+    MultiplayerMessage(MultiplayerMessage.QUIT),
+    MultiplayerMessage(MultiplayerMessage.RESTART),
+    MultiplayerMessage(MultiplayerMessage.GARBAGE, 4),
+    MultiplayerMessage(MultiplayerMessage.HELLO, (2 ** 63 + 5, True)),
+    MultiplayerMessage(MultiplayerMessage.PING, 12.5),
+    MultiplayerMessage(MultiplayerMessage.PONG, 12.5),
+    MultiplayerMessage(MultiplayerMessage.INPUTS, (1, 4000, bytes([3, 9, 12]))),
+    MultiplayerMessage(MultiplayerMessage.SYNC, (0, 120, 0xDEADBEEF)),
+    MultiplayerMessage(MultiplayerMessage.PUBLISH, 2),
+    MultiplayerMessage(MultiplayerMessage.SUBSCRIBE, 255),
+    MultiplayerMessage(MultiplayerMessage.DELTA, (1, b'')),
+    MultiplayerMessage(MultiplayerMessage.KEYFRAME, (2, bytes(range(256)) * 4))
+]
+
+# Splits a stream of frames back into messages the way Connection reads them
+def read_frames(stream):
+    messages = []
+    i = 0
+    while i < len(stream):
+        length, type = FRAME_HEADER.unpack_from(stream, i)
+        i += FRAME_HEADER.size
+        messages.append(decode(type, stream[i:i + length]))
+        i += length
+    return messages
+
+def test_every_type_has_a_format():
+    for name, value in vars(MultiplayerMessage).items():
+        if name.isupper():
+            assert value in MESSAGE_FORMATS, name
+    assert VARIABLE_LENGTH <= set(MESSAGE_FORMATS)
+
+def test_frames_round_trip():
+    stream = b''.join(encode(message) for message in MESSAGES)
+    decoded = read_frames(stream)
+    assert [(message.type, message.data) for message in decoded] == [(message.type, message.data) for message in MESSAGES]
+
+def test_frame_header():
+    frame = encode(MultiplayerMessage(MultiplayerMessage.SYNC, (0, 1, 2)))
+    assert FRAME_HEADER.unpack_from(frame) == (struct.calcsize('<BII'), MultiplayerMessage.SYNC)
+    assert len(frame) == FRAME_HEADER.size + struct.calcsize('<BII')
+
+def test_garbage_past_two_bytes():
+    for lines in (65535, 65536, 2 ** 32 - 1):
+        message = read_frames(encode(MultiplayerMessage(MultiplayerMessage.GARBAGE, lines)))[0]
+        assert (message.type, message.data) == (MultiplayerMessage.GARBAGE, lines)
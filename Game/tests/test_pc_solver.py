@@ -0,0 +1,15 @@
+import pytest
+from engine import Engine
+from pc_solver import solve_engine
+
+# Plays a solution on the engine's own board, which has to come out empty
+@pytest.mark.parametrize('workers', [0, 2])
+@pytest.mark.parametrize('seed', [0, 3, 6])
+def test_solutions_clear_the_board(seed, workers):
+    engine = Engine(seed)
+    solution = solve_engine(engine, workers=workers)
+    assert solution is not None
+    board = engine.board.copy()
+    for use_hold, placement in solution:
+        placement.lock(board)
+    assert board.is_perfect_clear()
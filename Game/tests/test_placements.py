@@ -0,0 +1,61 @@
+import collections
+import numpy as np
+from board import Board
+from tetromino import Tetromino
+from placements import find_placements
+from constants import *
+
+# Ragged stacks full of holes and overhangs for pieces to tuck under
+def random_boards(count, seed):
+    rng = np.random.default_rng(seed)
+    for i in range(count):
+        height = rng.integers(2, 10)
+        grid = np.zeros((BOARD_HEIGHT, BOARD_WIDTH), np.uint8)
+        grid[BOARD_HEIGHT - height:] = (rng.random((height, BOARD_WIDTH)) < .6) * GARBAGE_ID
+        board = Board(i)
+        board.load_grid(grid)
+        yield board
+
+def cells(piece):
+    return frozenset((piece.x + x, piece.y + y) for x, y in piece.state.minos)
+
+# Brute force breadth first search with the engine's own moves, dropping all the way or, with partial_drops, a row at a time
+# Returns the cells of every pose the piece can rest in
+def reference_placements(board, start, partial_drops=False):
+    def pose(piece):
+        return (piece.x, piece.y, piece.rotation_state)
+
+    seen = {pose(start)}
+    queue = collections.deque([pose(start)])
+    resting = set()
+    while queue:
+        x, y, rotation = queue.popleft()
+        moves = [(1, 0), (-1, 0), (0, 1) if partial_drops else (0, None), 'cw', 'ccw']
+        for move in moves:
+            piece = Tetromino(start.piece_name)
+            piece.set_rotation(rotation)
+            piece.x, piece.y = x, y
+            if move == 'cw' or move == 'ccw':
+                moved = piece.rotate(board, move == 'cw')
+            elif move[1] is None:
+                moved = piece.move(board, 0, board.drop_distance(piece))
+            else:
+                moved = piece.move(board, *move)
+            if moved and pose(piece) not in seen:
+                seen.add(pose(piece))
+                queue.append(pose(piece))
+        piece = Tetromino(start.piece_name)
+        piece.set_rotation(rotation)
+        piece.x, piece.y = x, y
+        if board.check_collision(piece, 0, 1):
+            resting.add(cells(piece))
+    return resting
+
+def test_matches_brute_force():
+    for board in random_boards(60, 1):
+        for name in PIECES:
+            start = Tetromino(name)
+            found = {cells(placement.piece()) for placement in find_placements(board, start)}
+            assert found == reference_placements(board, start), name
+            # Poses only reached by stopping partway down to shift or spin are left out on purpose
+            assert found <= reference_placements(board, start, partial_drops=True)
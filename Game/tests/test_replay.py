@@ -0,0 +1,62 @@
+import random
+from engine import Engine
+from replay import Replay, ReplayRecorder, ReplayPlayer, read_varint, write_varint
+from constants import *
+
+# Hard drops are rare enough that games last a while
+ACTIONS = [MOVE_LEFT, MOVE_RIGHT, SOFT_DROP, ROTATE_CW, ROTATE_CCW, HOLD] * 5 + [HARD_DROP]
+
+# A game played the way game.py records it, returning the replay and the engine's snapshot every 100 frames
+def record_game(seed, frames):
+    rng = random.Random(seed)
+    engine = Engine(seed)
+    recorder = ReplayRecorder(seed, engine.messiness)
+    snapshots = {}
+    for frame in range(1, frames + 1):
+        engine.advance(frame * 1000 / FPS)
+        if rng.random() < 0.002:
+            lines = rng.randint(1, 4)
+            recorder.record_garbage(engine.time, lines)
+            engine.board.take_garbage(lines)
+        inputs = [(rng.choice(ACTIONS), rng.random() < 0.7) for _ in range(rng.randint(1, 2))] if rng.random() < 0.3 else []
+        recorder.record_inputs(engine.time, inputs)
+        engine.step(inputs, 0)
+        if frame % 100 == 0:
+            snapshots[engine.time] = engine.snapshot()
+    return recorder.finish(engine.time), snapshots
+
+def test_varints():
+    out = bytearray()
+    values = [0, 1, 127, 128, 300, 2 ** 21, 2 ** 35 + 5]
+    for value in values:
+        write_varint(out, value)
+    i = 0
+    for value in values:
+        decoded, i = read_varint(out, i)
+        assert decoded == value
+    assert i == len(out)
+
+def test_encode_decode():
+    replay, _ = record_game(4, 600)
+    copy = Replay.from_bytes(replay.to_bytes())
+    assert (copy.seed, copy.messiness, copy.length, copy.body) == (replay.seed, replay.messiness, replay.length, replay.body)
+    assert copy.records() == replay.records()
+
+def test_playback_and_seek():
+    replay, snapshots = record_game(1, 1200)
+    assert len(snapshots) == 12
+    player = ReplayPlayer(Replay.from_bytes(replay.to_bytes()), snapshot_interval=5000)
+    times = sorted(snapshots)
+    for game_time in times:
+        player.play_to(game_time)
+        assert player.engine.snapshot() == snapshots[game_time]
+
+    # Seeking straight past everything played so far in a new player
+    player = ReplayPlayer(replay, snapshot_interval=5000)
+    player.seek(times[-1])
+    assert player.engine.snapshot() == snapshots[times[-1]]
+
+    # Back and forth across the snapshots it kept
+    for game_time in (times[0], times[len(times) // 2], times[3], times[-1], times[1]):
+        player.seek(game_time)
+        assert player.engine.snapshot() == snapshots[game_time]
@@ -0,0 +1,55 @@
+import random
+from board import Board, BOARD_SNAPSHOT_SIZE
+from engine import Engine, SNAPSHOT_SIZE
+from constants import *
+
+# Hard drops are rare enough that games last a while
+ACTIONS = [MOVE_LEFT, MOVE_RIGHT, SOFT_DROP, ROTATE_CW, ROTATE_CCW, HOLD] * 5 + [HARD_DROP]
+
+def random_inputs(rng):
+    return [(rng.choice(ACTIONS), rng.random() < 0.7) for _ in range(rng.randint(1, 2))] if rng.random() < 0.3 else []
+
+def test_snapshot_size():
+    assert SNAPSHOT_SIZE == 356
+    assert len(Engine(0).snapshot()) == SNAPSHOT_SIZE
+    assert len(Board().snapshot()) == BOARD_SNAPSHOT_SIZE
+
+# Restoring a snapshot into another engine carries on exactly like the original from then on
+def test_engine_round_trip():
+    rng = random.Random(2)
+    engine = Engine(11)
+    frame = 0
+    for _ in range(3):
+        for _ in range(200):
+            frame += 1
+            engine.step(random_inputs(rng), 0)
+            engine.advance(frame * 1000 / FPS)
+            if rng.random() < 0.002:
+                engine.board.take_garbage(rng.randint(1, 4))
+        data = engine.snapshot()
+        assert len(data) == SNAPSHOT_SIZE
+
+        copy = Engine(99)
+        copy.restore(data)
+        assert copy.snapshot() == data
+        inputs = [random_inputs(rng) for _ in range(100)]
+        for other in (engine, copy):
+            for i, batch in enumerate(inputs):
+                other.step(batch, 0)
+                other.advance((frame + i + 1) * 1000 / FPS)
+        frame += len(inputs)
+        assert copy.snapshot() == engine.snapshot()
+        assert copy.board.rows == engine.board.rows and copy.board.heights == engine.board.heights
+    assert not engine.game_over and engine.pieces_placed > 10
+
+def test_board_round_trip():
+    board = Board(3, messiness=0.4)
+    board.add_garbage_lines(6)
+    board.take_garbage(2)
+    board.combo, board.back_to_back, board.last_kick_index = 3, 2, 4
+    copy = Board()
+    copy.restore(board.snapshot())
+    assert copy.snapshot() == board.snapshot()
+    assert (copy.grid == board.grid).all()
+    assert copy.rows == board.rows and copy.heights == board.heights and copy.row_counts == board.row_counts
+    assert copy.garbage_holes(5) == board.garbage_holes(5)
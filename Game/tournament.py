@@ -0,0 +1,198 @@
+import argparse
+import concurrent.futures
+import itertools
+import json
+import os
+import time
+import traceback
+from concurrent.futures.process import BrokenProcessPool
+from engine import Engine
+from bot import Bot, BotController
+from attack import DEFAULT_RULES, RULE_SETS, load_rules
+from constants import *
+
+# Bots entered when no entrants file is given, each entry is passed to Bot as keyword arguments
+DEFAULT_ENTRANTS = {
+    'default': {},
+    'greedy': {'beam_width': 1, 'preview': 1},
+    'no_wells': {'weights': {'well_depth': 0}}
+}
+
+# Matches where neither bot has topped out after this many pieces each go to whoever sent more garbage
+MAX_MATCH_PIECES = 300
+
+# Times a match is retried after its worker process dies before it's recorded as crashed
+MAX_ATTEMPTS = 3
+
+# Bots are made once per worker process and kept for every match it plays
+worker_bots = {}
+
+def get_bot(name, options):
+    if name not in worker_bots:
+        worker_bots[name] = Bot(**dict(options, workers=0))
+    return worker_bots[name]
+
+# Plays two bots against each other on the same piece order until one tops out
+# Both boards live in this process and trade garbage directly: lock_piece already runs garbage_calc and send_garbage,
+# whatever is left goes to the other board's take_garbage
+def play_match(seed, names, entrants, attack_rules=DEFAULT_RULES):
+    engines = [Engine(seed, attack_rules=attack_rules), Engine(seed, attack_rules=attack_rules)]
+    controllers = [BotController(get_bot(name, entrants[name]), inputs_per_step=BOARD_HEIGHT) for name in names]
+    attack = [0, 0]
+    think_time = [0, 0]
+    frame = 1000 / FPS
+
+    # Both games move one frame at a time, each bot gets one batch of inputs per frame
+    frames = 0
+    while not any(engine.game_over for engine in engines) and min(engine.pieces_placed for engine in engines) < MAX_MATCH_PIECES:
+        frames += 1
+        for player, engine in enumerate(engines):
+            start = time.perf_counter()
+            inputs = controllers[player].next_inputs(engine)
+            think_time[player] += time.perf_counter() - start
+            engine.step(inputs, 0)
+            engine.advance(frames * frame)
+
+            lines = engine.pop_attack()
+            if lines:
+                attack[player] += lines
+                engines[1 - player].board.take_garbage(lines)
+
+    winner = None
+    if engines[0].game_over != engines[1].game_over:
+        winner = names[1] if engines[0].game_over else names[0]
+    elif attack[0] != attack[1]:
+        winner = names[0] if attack[0] > attack[1] else names[1]
+    return {
+        'seed': seed,
+        'players': list(names),
+        'winner': winner,
+        'topped_out': [engine.game_over for engine in engines],
+        'time': frames * frame / 1000,
+        'pieces': [engine.pieces_placed for engine in engines],
+        'attack': attack,
+        'attack_per_piece': [attack[i] / max(1, engines[i].pieces_placed) for i in range(2)],
+        'pieces_per_second': [engines[i].pieces_placed / max(think_time[i], 1e-9) for i in range(2)]
+    }
+
+# Runs in the worker, a match that raises is recorded with its error instead of taking the tournament down
+def run_match(match, entrants, attack_rules):
+    seed, names = match
+    try:
+        return play_match(seed, names, entrants, attack_rules)
+    except Exception:
+        return {'seed': seed, 'players': list(names), 'error': traceback.format_exc()}
+
+def match_key(result):
+    return result['seed'], tuple(result['players'])
+
+def load_results(path):
+    results = []
+    if path and os.path.exists(path):
+        with open(path) as file:
+            results = [json.loads(line) for line in file if line.strip()]
+    return results
+
+# Every pair of entrants plays once a round, each match on its own seed with the sides swapped every other round
+# Seeds only depend on the round and pair, so running more rounds with the same results file just adds matches
+def schedule(names, rounds, seed):
+    pairs = list(itertools.combinations(names, 2))
+    matches = []
+    for round in range(rounds):
+        for i, (a, b) in enumerate(pairs):
+            matches.append((seed + round * len(pairs) + i, (a, b) if round % 2 == 0 else (b, a)))
+    return matches
+
+# Plays every scheduled match across a pool of processes, one per core by default
+# Each result is appended to the results file as soon as it's in, and matches already in the file are skipped,
+# so a tournament that is stopped can be picked up again by running it with the same file
+# Only as many matches as there are workers are handed out at once, so when a worker dies and takes the pool with it
+# the matches that were running are known, they're retried on a new pool and the rest carry on as before
+def run_tournament(entrants, rounds, seed=0, results_path=None, workers=None, attack_rules=DEFAULT_RULES):
+    results = load_results(results_path)
+    done = {match_key(result) for result in results}
+    pending = [match for match in schedule(list(entrants), rounds, seed) if (match[0], match[1]) not in done]
+    attempts = dict.fromkeys(pending, 0)
+    workers = workers or os.cpu_count()
+
+    results_file = open(results_path, 'a') if results_path else None
+    def record(result):
+        results.append(result)
+        if results_file:
+            results_file.write(json.dumps(result) + '\n')
+            results_file.flush()
+        print(f"{len(results)} matches played", end='\r')
+
+    try:
+        while pending:
+            with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+                running = {}
+                broken = False
+                while running or (pending and not broken):
+                    while pending and not broken and len(running) < workers:
+                        match = pending.pop(0)
+                        running[pool.submit(run_match, match, entrants, attack_rules)] = match
+                    finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in finished:
+                        match = running.pop(future)
+                        try:
+                            record(future.result())
+                        except BrokenProcessPool:
+                            broken = True
+                            attempts[match] += 1
+                            if attempts[match] < MAX_ATTEMPTS:
+                                pending.append(match)
+                            else:
+                                record({'seed': match[0], 'players': list(match[1]), 'error': "Worker process died"})
+    finally:
+        if results_file:
+            results_file.close()
+    print()
+    return results
+
+def standings(results):
+    table = {}
+    for result in results:
+        if 'error' in result:
+            continue
+        for i, name in enumerate(result['players']):
+            row = table.setdefault(name, {'matches': 0, 'wins': 0, 'draws': 0, 'pieces': 0, 'attack': 0, 'think_time': 0})
+            row['matches'] += 1
+            row['wins'] += result['winner'] == name
+            row['draws'] += result['winner'] is None
+            row['pieces'] += result['pieces'][i]
+            row['attack'] += result['attack'][i]
+            row['think_time'] += result['pieces'][i] / result['pieces_per_second'][i]
+
+    return {name: {
+        'matches': row['matches'],
+        'win_rate': row['wins'] / row['matches'],
+        'draws': row['draws'],
+        'attack_per_piece': row['attack'] / max(1, row['pieces']),
+        'pieces_per_second': row['pieces'] / max(row['think_time'], 1e-9)
+    } for name, row in table.items()}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play bots against each other headless and rank them")
+    parser.add_argument('--entrants', help="JSON file of name to Bot options, the built-in entrants are used without it")
+    parser.add_argument('--rounds', type=int, default=10, help="matches per pair of entrants")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the first match")
+    parser.add_argument('--results', default='tournament.jsonl', help="file each match's result is appended to")
+    parser.add_argument('--workers', type=int, help="processes to play matches in, every core by default")
+    parser.add_argument('--rules', default='jstris', help=f"attack rules, one of {', '.join(RULE_SETS)} or a JSON rule set file")
+    args = parser.parse_args()
+
+    entrants = DEFAULT_ENTRANTS
+    if args.entrants:
+        with open(args.entrants) as file:
+            entrants = json.load(file)
+
+    results = run_tournament(entrants, args.rounds, args.seed, args.results, args.workers, load_rules(args.rules))
+    crashed = sum('error' in result for result in results)
+    table = standings(results)
+    print(f"{'entrant':<16}{'matches':>8}{'win rate':>10}{'draws':>7}{'APP':>7}{'PPS':>9}")
+    for name, row in sorted(table.items(), key=lambda item: item[1]['win_rate'], reverse=True):
+        print(f"{name:<16}{row['matches']:>8}{row['win_rate']:>10.1%}{row['draws']:>7}"
+              f"{row['attack_per_piece']:>7.2f}{row['pieces_per_second']:>9.0f}")
+    if crashed:
+        print(f"{crashed} matches failed, see the results file")
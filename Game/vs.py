@@ -1,92 +1,200 @@
+import argparse
 import multiprocessing
+import os
 import pygame
 import random
 from game import Game
+from bot import Bot, BotController, THINK_TIME, POOL_THINK_TIME
+from net import Connection, MultiplayerMessage, DEFAULT_PORT
+from rollback import RollbackSession, FRAME_TIME, pack_inputs, unpack_inputs
+from spectate import SpectatorFeed, SPECTATE_PORT, run_server
 from constants import *
 
-class MultiplayerMessage:
-    QUIT = "QUIT"
-    RESTART = "RESTART"
-    GARBAGE = "GARBAGE"
-    
-    def __init__(self, type, data=None):
-        self.type = type
-        self.data = data
-
 # Add Multiplayer functionality to the game by extending the Game class
+# With rollback both players' games are simulated on each side, see RollbackSession, and player is 0 for the host
+# The player's screen is streamed to the spectator server at the spectate address when one is given
 class MultiplayerGame(Game):
-    def __init__(self, conn, seed):
-        super().__init__(conn, seed)
-
-    def lock_piece(self):
-        if self.current_piece:
-            self.board.add_to_board(self.current_piece)
-            clear_result = self.board.check_lines(self.current_piece)
-            if clear_result:
-                lines_sent = self.board.send_garbage(self.board.garbage_calc(clear_result))
-                if lines_sent > 0:
-                    try:
-                        self.conn.send(MultiplayerMessage(MultiplayerMessage.GARBAGE, lines_sent))
-                    except (EOFError, BrokenPipeError):
-                        self.running = False
-            self.current_piece = None
-            self.can_hold = True
-            self.spawn_piece()
+    def __init__(self, conn, seed, replay_path=None, rollback=False, player=0, spectate=None):
+        super().__init__(conn, seed, replay_path)
+        self.feed = SpectatorFeed(spectate, SPECTATE_PORT, player) if spectate else None
+        self.caption = "Tetris"
+        self.next_latency_update = 0
+        self.rollback = rollback
+        self.player = player
+        self.game_number = 0  # Counts restarts, so the other side's messages from before one can be told apart
+        self.desync_reported = False
+        if rollback:
+            self.start_session()
+
+    def start_session(self):
+        self.session = RollbackSession(self.seed, self.player, self.recorder, self.engine.messiness)
+        self.engine = self.session.local_engine
+        self.frame_inputs = []  # Local inputs waiting for the next frame
+
+    def restart_game(self):
+        super().restart_game()
+        self.game_number = (self.game_number + 1) % 256
+        if self.rollback:
+            self.start_session()
+
+    def send_attack(self):
+        lines_sent = self.engine.pop_attack()
+        if lines_sent > 0:
+            self.conn.send(MultiplayerMessage(MultiplayerMessage.GARBAGE, lines_sent))
 
     def handle_broad_events(self, events):
         for event in events:
             if event.type == pygame.QUIT:
-                self.conn.send(MultiplayerMessage("QUIT"))
+                self.conn.send(MultiplayerMessage(MultiplayerMessage.QUIT))
                 self.running = False 
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_r:
-                        self.conn.send(MultiplayerMessage("RESTART"))
+                        self.conn.send(MultiplayerMessage(MultiplayerMessage.RESTART))
                         self.restart_game()
                 elif event.key == pygame.K_p:
                         self.paused = not self.paused
 
     def handle_connection(self):
-        try:
-            if self.conn.poll():
-                message = self.conn.recv()
-                if isinstance(message, MultiplayerMessage):
-                    if message.type == MultiplayerMessage.QUIT:
-                        self.running = False
-                    elif message.type == MultiplayerMessage.RESTART:
-                        self.restart_game()
-                    elif message.type == MultiplayerMessage.GARBAGE:
-                        self.board.take_garbage(message.data)
-        except (EOFError, BrokenPipeError):
+        # Everything that arrived since the last update is handled, so bursts of garbage land together
+        for message in self.conn.poll():
+            if message.type == MultiplayerMessage.QUIT:
+                self.running = False
+            elif message.type == MultiplayerMessage.RESTART:
+                self.restart_game()
+            elif message.type == MultiplayerMessage.GARBAGE:
+                self.receive_garbage(message.data)
+            elif message.type == MultiplayerMessage.INPUTS:
+                game_number, frame, inputs = message.data
+                if game_number == self.game_number:
+                    self.session.add_remote_inputs(frame, unpack_inputs(inputs))
+            elif message.type == MultiplayerMessage.SYNC:
+                game_number, frame, checksum = message.data
+                if game_number == self.game_number:
+                    self.session.add_remote_checksum(frame, checksum)
+        if self.conn.closed:
             self.running = False
 
-    def update(self):
-        super().update()
+    def draw(self):
+        super().draw()
+        if self.feed:
+            self.feed.publish(self.engine)
+
+    def show_latency(self):
+        now = pygame.time.get_ticks()
+        if self.conn.rtt is not None and now >= self.next_latency_update:
+            self.next_latency_update = now + 1000
+            pygame.display.set_caption(f"{self.caption} - {self.conn.rtt:.1f} ms")
+
+    # Frames the local game is ahead of the other player's, going by when their inputs arrive
+    def frame_advantage(self):
+        latency = (self.conn.rtt or 0) / 2 / FRAME_TIME
+        return self.session.frame - self.session.confirmed - latency
+
+    def update_rollback(self):
+        dt = self.tick()
         self.handle_connection()
+        if not self.paused:
+            # The side that's ahead runs a little slower until the two line up, rather than stalling at the rollback limit
+            self.logic_time += dt * (.75 if self.frame_advantage() > 1 else 1)
+        self.frame_inputs.extend(self.handle_events())
+
+        # Inputs are played on the next frame that comes due, and sent stamped with it
+        session = self.session
+        while session.frame * FRAME_TIME <= self.logic_time and session.can_advance():
+            frame = session.advance(self.frame_inputs)
+            self.conn.send(MultiplayerMessage(MultiplayerMessage.INPUTS, (self.game_number, frame, pack_inputs(self.frame_inputs))))
+            self.frame_inputs = []
+        session.catch_up()
+        if not session.can_advance():
+            # Time doesn't run on while waiting for the other player
+            self.logic_time = min(self.logic_time, session.frame * FRAME_TIME)
+
+        for frame, checksum in session.pop_checksums():
+            self.conn.send(MultiplayerMessage(MultiplayerMessage.SYNC, (self.game_number, frame, checksum)))
+        if session.desynced and not self.desync_reported:
+            self.desync_reported = True
+            print(f"Games out of sync before frame {session.final_frame}")
+
+        self.draw_if_due()
+
+    def update(self):
+        if self.rollback:
+            self.update_rollback()
+        else:
+            super().update()
+            self.send_attack()
+            self.handle_connection()
+        self.show_latency()
 
-def run_game(conn, seed):
-    game = MultiplayerGame(conn, seed)
+# Same game with the bot at the controls, the keyboard only reaches the broad events
+class MultiplayerBotGame(MultiplayerGame):
+    def __init__(self, conn, seed, bot_options, replay_path=None, rollback=False, player=0, spectate=None):
+        super().__init__(conn, seed, replay_path, rollback, player, spectate)
+        self.bot = Bot(**bot_options)
+        self.controller = BotController(self.bot, input_delay=1000 / FPS)
+        self.caption = "Tetris (Bot)"
+        pygame.display.set_caption(self.caption)
+
+    def restart_game(self):
+        super().restart_game()
+        self.controller = BotController(self.bot, input_delay=1000 / FPS)
+
+    def handle_ingame_events(self, events):
+        if self.paused:
+            return []
+        return self.controller.next_inputs(self.engine)
+
+    def run(self):
+        try:
+            super().run()
+        finally:
+            self.bot.close()
+
+# The host picks the match seed and whether it uses rollback, and sends them to the player who joins
+def open_connection(host, port, hosting, udp, rollback):
+    if hosting:
+        conn = Connection.host(host, port, udp)
+        seed = random.randint(0, 2**32 - 1)
+        conn.send(MultiplayerMessage(MultiplayerMessage.HELLO, (seed, rollback)))
+    else:
+        conn = Connection.connect(host, port, udp)
+        seed, rollback = conn.wait_for(MultiplayerMessage.HELLO).data
+    return conn, seed, rollback
+
+def run_game(host, port, hosting, udp=False, bot_options=None, replay_path=None, rollback=False, spectate=None):
+    conn, seed, rollback = open_connection(host, port, hosting, udp, rollback)
+    player = 0 if hosting else 1
+    if bot_options is None:
+        game = MultiplayerGame(conn, seed, replay_path, rollback, player, spectate)
+    else:
+        game = MultiplayerBotGame(conn, seed, bot_options, replay_path, rollback, player, spectate)
     try:
         game.run()
     except Exception as e:
         print(e)
-        try:
-            conn.send(MultiplayerMessage(MultiplayerMessage.QUIT))
-        except (EOFError, BrokenPipeError):
-            pass
-        finally:
-            conn.close()
-            pygame.quit()
+        conn.send(MultiplayerMessage(MultiplayerMessage.QUIT))
+    finally:
+        conn.close()
+        if game.feed:
+            game.feed.close()
+        pygame.quit()
 
+# Both players on this machine, each in their own process, talking over localhost
 class MultiplayerVS:
-    def __init__(self):
-        # Create bidirectional pipes for both players
-        self.p1_conn, self.p2_conn = multiprocessing.Pipe()
-        
-        self.seed = random.randint(0, 2**32 - 1)
-        
-        # Create and start game processes
-        self.p1_process = multiprocessing.Process(target=run_game, args=(self.p1_conn, self.seed))
-        self.p2_process = multiprocessing.Process(target=run_game, args=(self.p2_conn, self.seed))
+    # bot_options are passed to Bot for player two, who is a human when they are None
+    # Replays of both players are saved in replay_dir when it's given
+    # With spectate, a spectator server is started on that address and both players stream to it
+    def __init__(self, bot_options=None, replay_dir=None, port=DEFAULT_PORT, udp=False, rollback=False, spectate=None):
+        replay_paths = [os.path.join(replay_dir, f"{{seed}}-p{player}.rpl") if replay_dir else None for player in (1, 2)]
+
+        self.server_process = None
+        if spectate:
+            self.server_process = multiprocessing.Process(target=run_server, args=(spectate, SPECTATE_PORT), daemon=True)
+            self.server_process.start()
+
+        # Create and start game processes, player one hosts and player two joins
+        self.p1_process = multiprocessing.Process(target=run_game, args=('127.0.0.1', port, True, udp, None, replay_paths[0], rollback, spectate))
+        self.p2_process = multiprocessing.Process(target=run_game, args=('127.0.0.1', port, False, udp, bot_options, replay_paths[1], False, spectate))
         
         self.p1_process.start()
         self.p2_process.start()
@@ -96,14 +204,31 @@ class MultiplayerVS:
             self.p1_process.join()
             self.p2_process.join()
         except KeyboardInterrupt:
-            self.p1_conn.send(MultiplayerMessage(MultiplayerMessage.QUIT))
-            self.p2_conn.send(MultiplayerMessage(MultiplayerMessage.QUIT))
             self.p1_process.terminate()
             self.p2_process.terminate()
-        finally:
-            self.p1_conn.close()
-            self.p2_conn.close()
+        if self.server_process:
+            self.server_process.terminate()
 
 if __name__ == "__main__":
-    multiplayer_game = MultiplayerVS()
-    multiplayer_game.run()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bot', action='store_true', help="play against the bot")
+    parser.add_argument('--think-time', type=float, help=f"bot milliseconds per piece, {THINK_TIME} or {POOL_THINK_TIME} with --workers")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="processes the bot splits each search across, only worth it at think times well above the pool's few ms round trip")
+    parser.add_argument('--replays', help="directory to save both players' replays in")
+    parser.add_argument('--host', action='store_true', help="play one side here and wait for a player to join over the network")
+    parser.add_argument('--connect', metavar='ADDRESS', help="join a match hosted at this address")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--udp', action='store_true', help="also open a UDP path for latency probes")
+    parser.add_argument('--rollback', action='store_true', help="simulate both games on each side so garbage lands the same for both (set by the host)")
+    parser.add_argument('--spectate', nargs='?', const='127.0.0.1', metavar='ADDRESS',
+                        help="stream the match to the spectator server at this address, one is started there for a local match")
+    args = parser.parse_args()
+
+    bot_options = {'think_time': args.think_time, 'workers': args.workers} if args.bot else None
+    if args.host or args.connect:
+        replay_path = os.path.join(args.replays, "{seed}.rpl") if args.replays else None
+        run_game(args.connect or '0.0.0.0', args.port, args.host, args.udp, bot_options, replay_path, args.rollback, args.spectate)
+    else:
+        multiplayer_game = MultiplayerVS(bot_options, args.replays, args.port, args.udp, args.rollback, args.spectate)
+        multiplayer_game.run()